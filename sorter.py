@@ -26,9 +26,18 @@ def run_controller(args, sub_parser):
         logging.info("vf1/vf2/storage disabled ...")
 
     import sorter.controller.machine_controller
+    import sorter.network.send_queue
 
     mc = sorter.controller.machine_controller.MachineController(
-        enable_device, enable_belt, disable_server=False, enable_vf=enable_vf
+        enable_device,
+        enable_belt,
+        disable_server=False,
+        enable_vf=enable_vf,
+        async_server=args.async_server,
+        send_queue_max_count=args.send_queue_size,
+        send_overflow_policy=sorter.network.send_queue.SendOverflowPolicy[
+            args.send_queue_policy.upper()
+        ],
     )
     mc.start_control_thread()
 
@@ -77,8 +86,30 @@ def run_serial(args, sub_parser):
 def run_classification(args, sub_parser):
     import sorter.classification_service.classification_service
 
+    if args.preprocess_threads < 1:
+        sub_parser.error("--preprocess_threads must be at least 1")
+
     c = sorter.classification_service.classification_service.ClassificationService(
-        args.host, model_fp=pathlib.Path(args.model), enable_cnn=not args.disable_cnn
+        args.host,
+        model_fp=pathlib.Path(args.model),
+        enable_cnn=not args.disable_cnn,
+        max_batch_size=args.max_batch_size,
+        max_batch_wait_ms=args.max_batch_wait_ms,
+        inference_engine=args.inference_engine,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        scheduling_policy=args.scheduling_policy,
+        deadline_ms=args.deadline_ms,
+        worker_id=args.worker_id,
+        prediction_cache_size=args.prediction_cache_size,
+        preprocess_thread_count=args.preprocess_threads,
+        first_stage_model_fp=(
+            pathlib.Path(args.first_stage_model)
+            if args.first_stage_model is not None
+            else None
+        ),
+        first_stage_min_probability=args.first_stage_min_probability,
+        first_stage_min_uniqueness=args.first_stage_min_uniqueness,
     )
 
     time.sleep(0.5)
@@ -91,6 +122,81 @@ def run_classification(args, sub_parser):
         c.stop()
 
 
+def run_evaluate(args, sub_parser):
+    import sorter.classification_service.bulk_evaluation
+    import sorter.classification_service.classifier
+    import sorter.classification_service.config as c
+    import sorter.classification_service.evaluation_report
+
+    folder_list = args.folder
+    if folder_list is None:
+        folder_list = [
+            c.incoming_data_known_class_train_dir_path,
+            c.incoming_data_known_class_test_dir_path,
+            c.trash_dir_path,
+            c.inconsistent_dir_path,
+        ]
+
+    model_fp = pathlib.Path(args.model)
+    classifier = sorter.classification_service.classifier.Classifier(
+        model_fp,
+        inference_engine=args.inference_engine,
+        warm_up_batch_size_list=(args.batch_size,),
+        hash_cache_fp=c.model_hash_cache_file_path,
+    )
+    sorter.classification_service.evaluation_report.write_reports(
+        sorter.classification_service.bulk_evaluation.evaluate(
+            classifier, folder_list, batch_size=args.batch_size
+        ),
+        output_dir=args.output_dir,
+        classifier_model=model_fp.name,
+        report_title="Evaluation "
+        + ", ".join(pathlib.Path(f).name for f in folder_list),
+    )
+
+
+def run_export_tflite(args, sub_parser):
+    import sorter.classification_service.tflite_export
+
+    sorter.classification_service.tflite_export.export_tflite(
+        pathlib.Path(args.model),
+        output_fp=args.output,
+        quantization=args.quantization,
+        calibration_folder_list=args.calibration_folder,
+        calibration_count=args.calibration_count,
+    )
+
+
+def run_reload(args, sub_parser):
+    import sorter.network.tcp_client
+
+    c = sorter.network.tcp_client.TcpClient(
+        args.host,
+        5005,
+        name=f"ReloadClient-{os.getpid()}",
+        type="ReloadClient",
+        retry_connection=False,
+        auto_reconnect=False,
+    )
+    c.start()
+    time.sleep(0.5)
+    c.send_msg(b"RLD %s %s" % (bytes(args.target, "utf-8"), bytes(args.model, "utf-8")))
+    logging.info(f"Requested reload of {args.model} by {args.target}")
+    time.sleep(0.5)
+    c.stop()
+
+
+def run_stats(args, sub_parser):
+    import sorter.network.stats_client
+
+    c = sorter.network.stats_client.StatsClient(args.host)
+    c.start()
+    time.sleep(0.5)
+    for statistics in c.query(args.target, expected_count=args.expected_count):
+        print(sorter.network.stats_client.StatsClient.format_stage_table(statistics))
+    c.stop()
+
+
 def run_vision(args, sub_parser):
     recording = None
     if args.disable_camera:
@@ -103,6 +209,13 @@ def run_vision(args, sub_parser):
             os.path.join(os.path.dirname(__file__), "data", rec)
         )
 
+    # cmd arg overrides config.json
+    background_model = args.background_model
+    if background_model is None:
+        background_model = sorter.util.config_handler.ConfigHandler().get_param(
+            "vision_service_background_model", default="mog2"
+        )
+
     import sorter.vision_service.vision_service
 
     c = sorter.vision_service.vision_service.VisionService(
@@ -112,6 +225,13 @@ def run_vision(args, sub_parser):
         args.host,
         disable_network=False,
         enable_visualization_fullscreen=not args.disable_fullscreen,
+        enable_pipeline=args.enable_pipeline,
+        bg_downscale_factor=args.bg_downscale_factor,
+        background_model=background_model,
+        image_format=args.image_format,
+        png_compression=args.png_compression,
+        enable_shared_memory=args.enable_shared_memory,
+        enable_crops_at_source=args.enable_crops_at_source,
     )
     try:
         c.collect()
@@ -138,6 +258,24 @@ if __name__ == "__main__":
         "--disable_belt", action="store_true", required=False
     )
     controller_parser.add_argument("--disable_vf", action="store_true", required=False)
+    controller_parser.add_argument(
+        "--async_server",
+        action="store_true",
+        required=False,
+        help="Serve clients by an asyncio event loop instead of a thread per client",
+    )
+    controller_parser.add_argument(
+        "--send_queue_size",
+        type=int,
+        default=100000,
+        help="Messages queued per client before the overflow policy applies",
+    )
+    controller_parser.add_argument(
+        "--send_queue_policy",
+        choices=["drop_oldest", "drop_newest", "disconnect"],
+        default="drop_oldest",
+        help="Overflow policy of the per-client send queues",
+    )
 
     # vision
     vision_parser = subparsers.add_parser("vision")
@@ -170,6 +308,47 @@ if __name__ == "__main__":
         action="store_true",
         help="Display visualization in window instead of in fuillscreen mode",
     )
+    vision_parser.add_argument(
+        "--enable_pipeline",
+        action="store_true",
+        help="Run capture, detection, persistence and rendering in separate threads",
+    )
+    vision_parser.add_argument(
+        "--bg_downscale_factor",
+        type=int,
+        default=1,
+        help="Background subtraction on a 2x/4x downscaled region (1 = full size)",
+    )
+    vision_parser.add_argument(
+        "--background_model",
+        required=False,
+        help="mog2, knn, running_average, running_median or static_reference "
+        '(default: config.json "vision_service_background_model" or mog2)',
+    )
+    vision_parser.add_argument(
+        "--image_format",
+        choices=["png", "webp"],
+        default="png",
+        help="Format of written part images, webp is lossless",
+    )
+    vision_parser.add_argument(
+        "--png_compression",
+        type=int,
+        default=None,
+        help="PNG compression level 0 (fastest) to 9 (smallest)",
+    )
+    vision_parser.add_argument(
+        "--enable_shared_memory",
+        action="store_true",
+        help="Hand crops to the classification service via shared memory "
+        "(same host), images on disk are archive only",
+    )
+    vision_parser.add_argument(
+        "--enable_crops_at_source",
+        action="store_true",
+        help="Write the two model input crops as small extra image, the classifier "
+        "reads these instead of the camera image",
+    )
 
     # classification
     classification_parser = subparsers.add_parser("classification")
@@ -178,7 +357,7 @@ if __name__ == "__main__":
         "--host", required=True, help="Hostname of machine server"
     )
     classification_parser.add_argument(
-        "--model", required=True, help="CNN model to load"
+        "--model", required=True, help="CNN model to load (.keras or .tflite)"
     )
     classification_parser.add_argument(
         "--disable_cnn",
@@ -186,6 +365,88 @@ if __name__ == "__main__":
         help="Disable CNN (dummy results)",
         action="store_true",
     )
+    classification_parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=1,
+        help="Classify up to N queued requests in a single predict call",
+    )
+    classification_parser.add_argument(
+        "--max_batch_wait_ms",
+        type=int,
+        default=0,
+        help="Wait at most M ms for a batch to fill",
+    )
+    classification_parser.add_argument(
+        "--inference_engine",
+        choices=["tf_function", "keras"],
+        default="tf_function",
+        help="tf_function: traced graph, keras: plain model call",
+    )
+    classification_parser.add_argument(
+        "--intra_op_threads",
+        type=int,
+        default=None,
+        help="TF threads used within an op, interpreter threads for .tflite "
+        "(default: all cores)",
+    )
+    classification_parser.add_argument(
+        "--inter_op_threads",
+        type=int,
+        default=None,
+        help="TF threads running independent ops in parallel (default: auto)",
+    )
+    classification_parser.add_argument(
+        "--scheduling_policy",
+        choices=["fifo", "edf", "lifo"],
+        default="fifo",
+        help="Order of serving requests: oldest, earliest deadline or newest first",
+    )
+    classification_parser.add_argument(
+        "--deadline_ms",
+        type=int,
+        default=None,
+        help="Requests waiting longer are answered with skip w/o classification",
+    )
+    classification_parser.add_argument(
+        "--worker_id",
+        type=str,
+        default=None,
+        help="Unique id when running several classification services (worker pool)",
+    )
+    classification_parser.add_argument(
+        "--prediction_cache_size",
+        type=int,
+        default=None,
+        help="Cache predictions of up to this many camera images on disk (keyed by "
+        "image and model hash), e.g. for re-classification",
+    )
+    classification_parser.add_argument(
+        "--preprocess_threads",
+        type=int,
+        default=2,
+        help="Threads loading and cropping images while the model runs the previous "
+        "batch",
+    )
+    classification_parser.add_argument(
+        "--first_stage_model",
+        default=None,
+        help="Small model (.keras or .tflite, same labels) run first, only parts it "
+        "is not confident about are classified by the full model",
+    )
+    classification_parser.add_argument(
+        "--first_stage_min_probability",
+        type=float,
+        default=0.9,
+        help="First stage result taken from this probability on",
+    )
+    classification_parser.add_argument(
+        "--first_stage_min_uniqueness",
+        type=float,
+        default=5.0,
+        help="First stage result taken from this ratio of best to second best "
+        "probability on",
+    )
 
     # notification
     notification_parser = subparsers.add_parser("notification")
@@ -214,6 +475,100 @@ if __name__ == "__main__":
         help="No network connection",
     )
 
+    # evaluate
+    evaluate_parser = subparsers.add_parser("evaluate")
+    evaluate_parser.set_defaults(command="evaluate")
+    evaluate_parser.add_argument(
+        "--model", required=True, help="Model file (.keras or .tflite)"
+    )
+    evaluate_parser.add_argument(
+        "--folder",
+        nargs="+",
+        default=None,
+        help="Folders with labeled part images (default: incoming, trash and "
+        "inconsistent folders)",
+    )
+    evaluate_parser.add_argument(
+        "--batch_size", type=int, default=32, help="Images per predict call"
+    )
+    evaluate_parser.add_argument(
+        "--inference_engine",
+        choices=["tf_function", "keras"],
+        default="tf_function",
+        help="tf_function: traced graph, keras: plain model call",
+    )
+    evaluate_parser.add_argument(
+        "--output_dir",
+        default=os.path.join(os.path.dirname(__file__), "data", "evaluation"),
+        help="Folder for predictions.jsonl and the html reports",
+    )
+
+    # export_tflite
+    export_tflite_parser = subparsers.add_parser("export_tflite")
+    export_tflite_parser.set_defaults(command="export_tflite")
+    export_tflite_parser.add_argument(
+        "--model", required=True, help="Model file (.keras)"
+    )
+    export_tflite_parser.add_argument(
+        "--output",
+        default=None,
+        help="Output .tflite (default: <model>_<quantization>.tflite)",
+    )
+    export_tflite_parser.add_argument(
+        "--quantization",
+        choices=["none", "dynamic", "int8"],
+        default="none",
+        help="dynamic: int8 weights, int8: also activations (needs calibration)",
+    )
+    export_tflite_parser.add_argument(
+        "--calibration_folder",
+        nargs="+",
+        default=None,
+        help="Folders with part images for int8 calibration",
+    )
+    export_tflite_parser.add_argument(
+        "--calibration_count",
+        type=int,
+        default=200,
+        help="Number of calibration images",
+    )
+
+    # reload
+    reload_parser = subparsers.add_parser("reload")
+    reload_parser.set_defaults(command="reload")
+    reload_parser.add_argument(
+        "--host", required=True, help="Hostname of machine server"
+    )
+    reload_parser.add_argument(
+        "--model",
+        required=True,
+        help="Model file (.keras or .tflite), path as seen by the classification "
+        "service",
+    )
+    reload_parser.add_argument(
+        "--target",
+        default="ClassificationService",
+        help="Service (or worker pool) to reload",
+    )
+
+    # stats
+    stats_parser = subparsers.add_parser("stats")
+    stats_parser.set_defaults(command="stats")
+    stats_parser.add_argument(
+        "--host", required=True, help="Hostname of machine server"
+    )
+    stats_parser.add_argument(
+        "--target",
+        default="ClassificationService",
+        help="Service (or worker pool) to query",
+    )
+    stats_parser.add_argument(
+        "--expected_count",
+        type=int,
+        default=1,
+        help="Number of services to wait for, e.g. workers in the pool",
+    )
+
     args = parser.parse_args()
 
     _ = sorter.util.config_handler.ConfigHandler()
@@ -237,6 +592,18 @@ if __name__ == "__main__":
     elif args.command.lower() == "serial":
         run_serial(args, serial_parser)
 
+    elif args.command.lower() == "evaluate":
+        run_evaluate(args, evaluate_parser)
+
+    elif args.command.lower() == "export_tflite":
+        run_export_tflite(args, export_tflite_parser)
+
+    elif args.command.lower() == "reload":
+        run_reload(args, reload_parser)
+
+    elif args.command.lower() == "stats":
+        run_stats(args, stats_parser)
+
     # standard help
     else:
         parser.print_help()
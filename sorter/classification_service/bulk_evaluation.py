@@ -0,0 +1,109 @@
+import logging
+import time
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+import sorter.classification_service.crop_image
+import sorter.classification_service.evaluation_report
+import sorter.classification_service.inference_engine
+
+crop_shape = sorter.classification_service.inference_engine.crop_shape
+
+
+def load_crop_pair(fp):
+    """
+    RGB crops (low, high) of an image file and whether it could be used, same
+    preprocessing as Classifier.load_crops (runs in the tf.data worker threads)
+    """
+    ocv_img = cv2.imread(fp.decode("utf-8"))
+    if ocv_img is None or ocv_img.shape != (720, 1280, 3):
+        logging.warning(f"Skipping {fp}, not a camera image")
+        empty = np.zeros(crop_shape, dtype=np.uint8)
+        return empty, empty, False
+    ocv_img = cv2.cvtColor(ocv_img, cv2.COLOR_BGR2RGB)
+    return (
+        sorter.classification_service.crop_image.crop_image(ocv_img, low=True),
+        sorter.classification_service.crop_image.crop_image(ocv_img, low=False),
+        True,
+    )
+
+
+def make_dataset(sample_fn, batch_size=32):
+    """
+    tf.data pipeline of batches (fp, label, crops low, crops high, valid)
+
+    sample_fn returns a generator of (image path, label), images are decoded and
+    cropped in parallel and batches prefetched while the model runs. Only the
+    batches in flight are held in memory.
+    """
+    dataset = tf.data.Dataset.from_generator(
+        sample_fn,
+        output_signature=(
+            tf.TensorSpec(shape=(), dtype=tf.string),
+            tf.TensorSpec(shape=(), dtype=tf.string),
+        ),
+    )
+
+    def load(fp, label):
+        low, high, valid = tf.numpy_function(
+            load_crop_pair, [fp], (tf.uint8, tf.uint8, tf.bool)
+        )
+        low.set_shape(crop_shape)
+        high.set_shape(crop_shape)
+        valid.set_shape(())
+        return fp, label, low, high, valid
+
+    return (
+        dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+        .batch(batch_size)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def evaluate(classifier, folder_list, batch_size=32):
+    """
+    EvaluationItem per labeled image below the folders (generator)
+    """
+    er = sorter.classification_service.evaluation_report
+    dataset = make_dataset(
+        lambda: er.list_labeled_images(folder_list), batch_size=batch_size
+    )
+
+    count = 0
+    dt_start = time.perf_counter()
+    for (
+        fp_batch,
+        label_batch,
+        low_batch,
+        high_batch,
+        valid_batch,
+    ) in dataset.as_numpy_iterator():
+        if not valid_batch.any():
+            continue
+        probability = classifier.inference_engine.predict(
+            low_batch[valid_batch], high_batch[valid_batch]
+        )
+        for fp, label, probability_list in zip(
+            fp_batch[valid_batch], label_batch[valid_batch], probability.tolist()
+        ):
+            cr = classifier.classification_result(
+                classifier.pred_list(probability_list)
+            )
+            label_class = label.decode("utf-8")
+            yield er.EvaluationItem(
+                fp=fp.decode("utf-8"),
+                label_class=label_class,
+                predicted_class=cr.predicted_class,
+                predicted_class_high=cr.predicted_class_high,
+                probability=cr.probability,
+                uniqueness=cr.uniqueness,
+                prediction_correct=cr.predicted_class == label_class,
+            )
+
+        count += int(valid_batch.sum())
+        logging.info(
+            f"Evaluated {count} images "
+            f"({count / (time.perf_counter() - dt_start):.1f} images/s)"
+        )
@@ -0,0 +1,369 @@
+import base64
+import json
+import logging
+import math
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+
+# binary CLR versions understood, negotiated per connection at HLO (binary=<version>)
+binary_version = 1
+supported_binary_version_list = [1]
+
+# v1: CLB, version, class list id, object id, decision (kind, class low, class high),
+# probability, uniqueness, average process time (NaN = None), top list lengths
+header_struct = struct.Struct("!3sBIqBHHfffBB")
+entry_struct = struct.Struct("!Hf")  # class index, probability
+
+# predicted class besides class names: skip or inconsistent low/high prediction
+decision_class = 0
+decision_skip = 1
+decision_inconsistent = 2
+
+# names used in the top lists that are not classes
+reserved_index_dict = {"skip": 0xFFFF, "-": 0xFFFE}
+reserved_name_dict = {index: name for name, index in reserved_index_dict.items()}
+
+
+@dataclass
+class ClassificationResultMessage:
+    object_id: int = None
+    predicted_class: str = None  # class name, "skip" or "inc_<low>_<high>"
+    probability: float = None
+    uniqueness: float = None
+    average_process_time_sec: float = None
+    low_list: list = None  # top classes [{"class": name, "probability": p}, ...]
+    high_list: list = None
+    model_hash: str = None
+    class_list: list = None  # all classes of the model, needed for binary encoding
+
+
+def serialize(d) -> str:
+    s = str(base64.b64encode(bytes(json.dumps(d), "utf-8")), "utf-8")
+    assert " " not in s
+    return s
+
+
+def deserialize(s: str):
+    return json.loads(str(base64.b64decode(bytes(s, "utf-8")), "utf-8"))
+
+
+def encode_text(m: ClassificationResultMessage) -> bytes:
+    """
+    CLR <id> <class> <probability> <uniqueness> <process time> <low> <high>
+    [model=<hash>], top lists as base64 json
+    """
+    msg = (
+        f"CLR {m.object_id:d} {m.predicted_class} {m.probability} {m.uniqueness} "
+        f"{m.average_process_time_sec} {serialize(m.low_list)} "
+        f"{serialize(m.high_list)}"
+    )
+
+    # optional: model=<hash of the model that produced the result>
+    if m.model_hash is not None:
+        msg += f" model={m.model_hash}"
+    return bytes(msg, "utf-8")
+
+
+def decode_text(msg: bytes) -> ClassificationResultMessage:
+    part_list = str(msg, "utf-8").split(" ")
+    param_dict = dict(p.split("=", 1) for p in part_list[8:] if "=" in p)
+    return ClassificationResultMessage(
+        object_id=int(part_list[1]),
+        predicted_class=part_list[2],
+        probability=float(part_list[3]),
+        uniqueness=float(part_list[4]),
+        average_process_time_sec=(
+            float(part_list[5]) if part_list[5] != "None" else None
+        ),
+        low_list=deserialize(part_list[6]),
+        high_list=deserialize(part_list[7]),
+        model_hash=param_dict.get("model"),
+    )
+
+
+def class_list_id(class_list) -> int:
+    return zlib.crc32(bytes(",".join(class_list), "utf-8"))
+
+
+# class list last encoded: (class list, id, class name -> index), the classifier
+# passes the same list with every result
+last_class_list_info = (None, None, None)
+
+
+def class_list_info(class_list):
+    global last_class_list_info
+    info = last_class_list_info
+    if info[0] is not class_list:
+        info = (
+            class_list,
+            class_list_id(class_list),
+            {name: i for i, name in enumerate(class_list)},
+        )
+        last_class_list_info = info
+    return info[1], info[2]
+
+
+def encode_class_list(class_list) -> bytes:
+    """
+    CLL <id> <class>,<class>,... - classes the indices of binary results refer to
+    """
+    return b"CLL %d %s" % (
+        class_list_id(class_list),
+        bytes(",".join(class_list), "utf-8"),
+    )
+
+
+def decode_class_list(msg: bytes):
+    part_list = str(msg, "utf-8").split(" ")
+    return int(part_list[1]), part_list[2].split(",")
+
+
+def class_index(class_index_dict, name):
+    if name in reserved_index_dict:
+        return reserved_index_dict[name]
+    return class_index_dict[name]
+
+
+def class_name(class_list, index):
+    if index in reserved_name_dict:
+        return reserved_name_dict[index]
+    return class_list[index]
+
+
+def encode_binary(m: ClassificationResultMessage):
+    """
+    CLB, struct packed with class indices into m.class_list, None if the result
+    can not be represented (e.g. class list not known or too long model hash)
+    """
+    if m.class_list is None:
+        return None
+    list_id, class_index_dict = class_list_info(m.class_list)
+
+    try:
+        # decision
+        if m.predicted_class == "skip":
+            decision = (decision_skip, 0, 0)
+        elif m.predicted_class in class_index_dict:
+            index = class_index_dict[m.predicted_class]
+            decision = (decision_class, index, index)
+        elif m.predicted_class.startswith("inc_"):
+            # class names may contain underscores, try all splits
+            name_pair = [
+                (m.predicted_class[4:i], m.predicted_class[i + 1 :])
+                for i in range(5, len(m.predicted_class))
+                if m.predicted_class[i] == "_"
+                and m.predicted_class[4:i] in class_index_dict
+                and m.predicted_class[i + 1 :] in class_index_dict
+            ][0]
+            decision = (
+                decision_inconsistent,
+                class_index_dict[name_pair[0]],
+                class_index_dict[name_pair[1]],
+            )
+        else:
+            return None
+
+        entry_list = [
+            entry_struct.pack(
+                class_index(class_index_dict, e["class"]), e["probability"]
+            )
+            for e in m.low_list + m.high_list
+        ]
+    except (KeyError, IndexError):
+        return None
+
+    model_hash = bytes(m.model_hash or "", "utf-8")
+    if len(model_hash) > 255:
+        return None
+
+    header = header_struct.pack(
+        b"CLB",
+        binary_version,
+        list_id,
+        m.object_id,
+        *decision,
+        m.probability,
+        m.uniqueness,
+        (
+            m.average_process_time_sec
+            if m.average_process_time_sec is not None
+            else math.nan
+        ),
+        len(m.low_list),
+        len(m.high_list),
+    )
+    return header + b"".join(entry_list) + bytes([len(model_hash)]) + model_hash
+
+
+def decode_binary(msg: bytes, class_list_dict) -> ClassificationResultMessage:
+    try:
+        return unpack_binary(msg, class_list_dict)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Malformed binary CLR: {e}")
+
+
+def unpack_binary(msg: bytes, class_list_dict) -> ClassificationResultMessage:
+    (
+        _,
+        version,
+        list_id,
+        object_id,
+        decision_kind,
+        index_low,
+        index_high,
+        probability,
+        uniqueness,
+        average_process_time_sec,
+        low_count,
+        high_count,
+    ) = header_struct.unpack_from(msg)
+    if version not in supported_binary_version_list:
+        raise ValueError(f"Unsupported binary CLR version {version}")
+    if list_id not in class_list_dict:
+        raise ValueError(f"Unknown class list {list_id}")
+    class_list = class_list_dict[list_id]
+
+    offset = header_struct.size
+    top_list = []
+    for _ in range(low_count + high_count):
+        index, entry_probability = entry_struct.unpack_from(msg, offset)
+        offset += entry_struct.size
+        top_list.append(
+            {"class": class_name(class_list, index), "probability": entry_probability}
+        )
+    model_hash_length = msg[offset]
+    if len(msg) != offset + 1 + model_hash_length:
+        raise ValueError(
+            f"Binary CLR of {len(msg)} bytes, expected {offset + 1 + model_hash_length}"
+        )
+    model_hash = str(msg[offset + 1 : offset + 1 + model_hash_length], "utf-8")
+
+    if decision_kind == decision_skip:
+        predicted_class = "skip"
+    elif decision_kind == decision_inconsistent:
+        predicted_class = f"inc_{class_list[index_low]}_{class_list[index_high]}"
+    else:
+        predicted_class = class_list[index_low]
+
+    return ClassificationResultMessage(
+        object_id=object_id,
+        predicted_class=predicted_class,
+        probability=probability,
+        uniqueness=uniqueness,
+        average_process_time_sec=(
+            average_process_time_sec
+            if not math.isnan(average_process_time_sec)
+            else None
+        ),
+        low_list=top_list[:low_count],
+        high_list=top_list[low_count:],
+        model_hash=model_hash if model_hash_length > 0 else None,
+        class_list=class_list,
+    )
+
+
+def is_classification_result(msg: bytes) -> bool:
+    return msg[:3] in [b"CLR", b"CLB", b"CLL"]
+
+
+class ClassificationResultCodec:
+    """
+    CLR of one connection, binary (CLB) if the connection negotiated a supported
+    version at HLO, text otherwise
+
+    Class lists are announced (CLL) once per connection before the first binary
+    result referring to them. Text results are understood on any connection.
+    """
+
+    def __init__(self, version=None) -> None:
+        self.binary = version in supported_binary_version_list
+        if version is not None and not self.binary:
+            logging.warning(f"Binary CLR version {version} not supported, using text")
+        self.sent_class_list_id_set = set()
+        self.class_list_dict = {}  # class list id -> class names, received CLL
+
+    def reset(self):
+        """
+        New connection, receiver knows no class lists
+        """
+        self.sent_class_list_id_set = set()
+
+    def encode(self, m: ClassificationResultMessage) -> list:
+        """
+        Messages to send for the result (incl. class list if new to the receiver)
+        """
+        if self.binary:
+            msg = encode_binary(m)
+            if msg is not None:
+                msg_list = []
+                list_id, _ = class_list_info(m.class_list)
+                if list_id not in self.sent_class_list_id_set:
+                    msg_list.append(encode_class_list(m.class_list))
+                    self.sent_class_list_id_set.add(list_id)
+                return msg_list + [msg]
+        return [encode_text(m)]
+
+    def decode(self, msg: bytes):
+        """
+        Result of CLR or CLB, None for CLL (class list kept for following results)
+        """
+        command = msg[:3]
+        if command == b"CLL":
+            list_id, class_list = decode_class_list(msg)
+            self.class_list_dict[list_id] = class_list
+            return None
+        if command == b"CLB":
+            return decode_binary(msg, self.class_list_dict)
+        return decode_text(msg)
+
+
+def benchmark(message_count=10000):
+    """
+    Encode + decode time and bytes on the wire (incl. framing) per result, text vs
+    binary
+    """
+    class_list = [f"class_{i:03d}" for i in range(400)]
+    top_list = [
+        {"class": class_list[i], "probability": p}
+        for i, p in [(17, 0.91), (5, 0.05), (399, 0.01)]
+    ]
+    m = ClassificationResultMessage(
+        object_id=123456,
+        predicted_class="class_017",
+        probability=0.91,
+        uniqueness=18.2,
+        average_process_time_sec=0.045,
+        low_list=top_list,
+        high_list=top_list,
+        model_hash="0123456789abcdef0123456789abcdef01234567",
+        class_list=class_list,
+    )
+
+    result_list = []
+    for name, encode_fn, decode_fn, framing_size in [
+        ("text", encode_text, decode_text, 1),
+        (
+            "binary",
+            encode_binary,
+            lambda msg: decode_binary(msg, {class_list_id(class_list): class_list}),
+            4,
+        ),
+    ]:
+        dt_start = time.perf_counter()
+        for _ in range(message_count):
+            msg = encode_fn(m)
+        dt_encoded = time.perf_counter()
+        for _ in range(message_count):
+            decode_fn(msg)
+        dt_end = time.perf_counter()
+        result_list.append(
+            {
+                "format": name,
+                "bytes": len(msg) + framing_size,
+                "encode_us": 1e6 * (dt_encoded - dt_start) / message_count,
+                "decode_us": 1e6 * (dt_end - dt_encoded) / message_count,
+            }
+        )
+    return result_list
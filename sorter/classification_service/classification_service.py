@@ -1,5 +1,6 @@
-import base64
 import datetime
+import enum
+import gc
 import json
 import logging
 import pathlib
@@ -8,15 +9,49 @@ import time
 from dataclasses import dataclass
 
 import sorter.classification_service.classification_result
+import sorter.classification_service.classification_result_codec as crc
 import sorter.classification_service.config
+import sorter.classification_service.prediction_cache
+import sorter.classification_service.request_scheduler as rs
 import sorter.network.tcp_client
 import sorter.notification_service.notification_client as nc
+import sorter.util.bounded_queue
+import sorter.util.file_hash
+import sorter.util.latency_histogram
+import sorter.util.shared_frame_ring
+import sorter.util.stage_overlap
 
 
 @dataclass
 class QueueItem:
     object_id: int = None
     img_filepath: str = None
+    ring_name: str = None  # crops in shared memory (same host)
+    slot: int = None
+    crops_filepath: str = None  # crops image written by the vision service
+    dt_enqueued: float = None  # monotonic, set by scheduler
+    dt_deadline: float = None  # monotonic, None = no deadline
+
+
+@dataclass
+class PreparedBatch:
+    queue_item_list: list = None
+    crop_pair_list: list = None  # RGB crops (low, high), None if served from cache
+    image_hash_list: list = None  # prediction cache keys, None = not cacheable
+    probability_list_list: list = None  # cache hits, None = to be predicted
+    model_hash: str = None  # model used for the cache lookup
+    dt_start: datetime.datetime = None
+    count_answered: int = 0  # results sent, in order of queue_item_list
+
+
+# stages of a request, in order
+stage_name_list = ["queue_wait", "load", "crop", "inference", "serialization", "send"]
+
+
+class ClassifierState(enum.Enum):
+    LOADING = 0
+    READY = 1
+    FAILED = 2
 
 
 class CSTcpClient(sorter.network.tcp_client.TcpClient):
@@ -29,10 +64,31 @@ class CSTcpClient(sorter.network.tcp_client.TcpClient):
         retry_connection,
         auto_reconnect,
         classification_service,
+        pool=None,
     ):
-        super().__init__(host, port, name, type, retry_connection, auto_reconnect)
+        super().__init__(
+            host,
+            port,
+            name,
+            type,
+            retry_connection,
+            auto_reconnect,
+            pool=pool,
+            binary_version=crc.binary_version,
+        )
         self.classification_service: ClassificationService = classification_service
 
+        # results binary, class list announced once per connection
+        self.clr_codec = crc.ClassificationResultCodec(crc.binary_version)
+        self.clr_mutex = threading.Lock()
+
+    def event_connected(self):
+        self.clr_codec.reset()
+
+        # e.g. still loading the model
+        self.classification_service.send_state()
+        self.classification_service.start_loading()
+
     def event_msg_received(self, msg):
         part_list = str(msg, "utf-8").split(" ")
 
@@ -40,67 +96,355 @@ class CSTcpClient(sorter.network.tcp_client.TcpClient):
         if part_list[0] == "CLF":
             object_id = int(part_list[1])
             filepath = part_list[2]
+
+            # optional params: ring=<shared memory name> slot=<index> crops=<path>
+            # budget_ms=<time until the result is useless>
+            param_dict = dict(p.split("=", 1) for p in part_list[3:] if "=" in p)
+            ring_name = param_dict.get("ring")
+            slot = int(param_dict["slot"]) if "slot" in param_dict else None
+            crops_filepath = param_dict.get("crops")
+            budget_sec = (
+                float(param_dict["budget_ms"]) / 1000.0
+                if "budget_ms" in param_dict
+                else None
+            )
             logging.info(
                 f"Received classification request - id: {object_id} fp: {filepath}"
+                f" slot: {slot} crops: {crops_filepath}"
+            )
+            self.classification_service.add_queue(
+                object_id,
+                filepath,
+                ring_name=ring_name,
+                slot=slot,
+                crops_filepath=crops_filepath,
+                budget_sec=budget_sec,
             )
-            self.classification_service.add_queue(object_id, filepath)
+
+        # reload, new model swapped in once loaded
+        elif part_list[0] == "RLD":
+            self.classification_service.reload(part_list[1])
+
+        # statistics request, answered via the machine controller to the requester
+        elif part_list[0] == "STA":
+            self.classification_service.send_statistics(part_list[1])
+
+    def send_classification_result(
+        self, m: crc.ClassificationResultMessage, record_stages=False
+    ):
+        """
+        Class list and result sent together, not interleaved with other results
+        """
+        cs = self.classification_service
+        self.clr_mutex.acquire()
+        try:
+            dt_start = time.perf_counter()
+            msg_list = self.clr_codec.encode(m)
+            if record_stages:
+                dt_start = cs.record_stage("serialization", dt_start)
+            for msg in msg_list:
+                logging.info(msg)
+                self.send_msg(msg)
+            if record_stages:
+                cs.record_stage("send", dt_start)
+        finally:
+            self.clr_mutex.release()
 
 
 class ClassificationService:
-    def __init__(self, host, enable_cnn, model_fp) -> None:
-        # classifier
+    def __init__(
+        self,
+        host,
+        enable_cnn,
+        model_fp,
+        max_batch_size=1,
+        max_batch_wait_ms=0,
+        inference_engine="tf_function",
+        intra_op_threads=None,
+        inter_op_threads=None,
+        scheduling_policy="fifo",
+        deadline_ms=None,
+        worker_id=None,
+        prediction_cache_size=None,
+        preprocess_thread_count=2,
+        first_stage_model_fp=None,
+        first_stage_min_probability=0.9,
+        first_stage_min_uniqueness=5.0,
+    ) -> None:
+        # classifier - loaded in the background once connected, requests are queued
+        # in the meantime and state reported to the machine controller (CSS)
         self.enable_cnn = enable_cnn
+        self.classifier = None
+        self.state = ClassifierState.LOADING if enable_cnn else ClassifierState.READY
         if self.enable_cnn:
-            import sorter.classification_service.classifier
-
             assert isinstance(model_fp, pathlib.Path)
+        self.model_fp = model_fp
+        self.load_thread = None
+
+        # hot swap - classifier loaded by the reload thread, swapped in by the
+        # classification thread between batches
+        self.reload_thread = None
+        self.pending_classifier = None
+        self.count_reload = 0
 
-            self.classifier = sorter.classification_service.classifier.Classifier(
-                model_fp
+        # results of camera images classified before (e.g. re-classification of
+        # collected folders), None = disabled
+        self.prediction_cache = None
+        if self.enable_cnn and prediction_cache_size is not None:
+            self.prediction_cache = (
+                sorter.classification_service.prediction_cache.PredictionCache(
+                    sorter.classification_service.config.prediction_cache_file_path,
+                    max_entry_count=prediction_cache_size,
+                )
             )
+        self.classifier_param_dict = {
+            "inference_engine": inference_engine,
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            # warm-up with the batch sizes to be expected
+            "warm_up_batch_size_list": (
+                (1, max_batch_size) if max_batch_size > 1 else (1,)
+            ),
+            # cascade, kept on reload (only the full model is replaced)
+            "first_stage_model_fp": first_stage_model_fp,
+            "first_stage_min_probability": first_stage_min_probability,
+            "first_stage_min_uniqueness": first_stage_min_uniqueness,
+        }
         self.average_process_time_sec = None
 
-        # classification thread
+        # crops handed over by the vision service in shared memory, attached on use
+        self.shared_crop_ring = None
+        self.count_shared_memory_hit = 0
+        self.count_shared_memory_miss = 0
+
+        # batching - up to max_batch_size queued requests are classified in a single
+        # predict call, waiting at most max_batch_wait_ms for the batch to fill
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
+        self.count_batch = 0
+        self.count_item = 0
+        self.max_batch_size_seen = 0
+        self.total_latency_sec = 0.0
+        self.max_latency_sec = 0.0
+
+        # per stage latency histograms, where the time of a request goes
+        self.stage_histogram_dict = {
+            stage: sorter.util.latency_histogram.LatencyHistogram()
+            for stage in stage_name_list
+        }
+
+        # shared crop ring and its statistics, used by all preprocessing threads
+        self.ring_mutex = threading.Lock()
+
+        # pipeline - preprocessing threads take batches from the scheduler, load and
+        # crop the images and hand them to the inference thread, i.e. the next batch
+        # is prepared while the current one is on the model
         self.thread_stop_requested = False
         self.queue_mutex = threading.Lock()
         self.queue_condition = threading.Condition(self.queue_mutex)
-        self.queue = []
+        # requests past their deadline are answered with "skip" w/o classification
+        self.scheduler = rs.RequestScheduler(
+            policy=rs.SchedulingPolicy[scheduling_policy.upper()],
+            deadline_sec=deadline_ms / 1000.0 if deadline_ms is not None else None,
+        )
+        # one preprocessing thread at a time forms a batch, batches fill as before
+        self.take_mutex = threading.Lock()
+        # batches handed to the inference thread in the order they were taken
+        self.count_taken = 0  # take_mutex held
+        self.count_handed_over = 0
+        self.hand_over_mutex = threading.Lock()
+        self.hand_over_condition = threading.Condition(self.hand_over_mutex)
+        # backpressure, requests stay in the scheduler while inference is behind
+        self.inference_queue = sorter.util.bounded_queue.BoundedQueue(
+            "inference",
+            preprocess_thread_count,
+            sorter.util.bounded_queue.OverflowPolicy.BLOCK,
+        )
+        self.stage_overlap = sorter.util.stage_overlap.StageOverlap(
+            ["preprocess", "inference"]
+        )
+        self.preprocess_thread_list = []
+        for i in range(preprocess_thread_count):
+            thread = threading.Thread(target=self.preprocess_thread_fct)
+            thread.daemon = True
+            thread.start()
+            thread.name = f"Classification Preprocessing {i}"
+            self.preprocess_thread_list.append(thread)
         self.thread = threading.Thread(target=self.thread_fct)
         self.thread.daemon = True
         self.thread.start()
         self.thread.name = "Classification Service"
 
-        # network thread
+        # network thread - with worker id, one of several services in the pool
         self.tcp_client = CSTcpClient(
             host,
             5005,
-            "ClassificationService",
+            (
+                "ClassificationService"
+                if worker_id is None
+                else f"ClassificationService-{worker_id}"
+            ),
             "ClassificationService",
             retry_connection=True,
             auto_reconnect=True,
             classification_service=self,
+            pool="ClassificationService",
         )
         self.tcp_client.start()
 
         # notification
         self.notification_client = nc.NotificationClient(self.tcp_client)
 
+    def start_loading(self):
+        """
+        Model loading thread, started once connected (not interruptible, daemon and
+        not joined on stop)
+        """
+        if not self.enable_cnn or self.load_thread is not None:
+            return
+        self.load_thread = threading.Thread(target=self.load_fct)
+        self.load_thread.daemon = True
+        self.load_thread.start()
+        self.load_thread.name = "Classifier Loading"
+
+    def create_classifier(self, model_fp):
+        """
+        Load, verify and warm up model (takes seconds up to minutes)
+        """
+        import sorter.classification_service.classifier
+
+        return sorter.classification_service.classifier.Classifier(
+            model_fp,
+            hash_cache_fp=sorter.classification_service.config.model_hash_cache_file_path,
+            prediction_cache=self.prediction_cache,
+            **self.classifier_param_dict,
+        )
+
+    def load_fct(self):
+        dt_start = time.perf_counter()
+        try:
+            classifier = self.create_classifier(self.model_fp)
+            state = ClassifierState.READY
+            logging.info(
+                f"Classifier ready after {time.perf_counter() - dt_start:.1f}s"
+            )
+        except Exception as e:
+            classifier = None
+            state = ClassifierState.FAILED
+            logging.error(f"Loading classifier failed: {e}")
+
+        self.queue_mutex.acquire()
+        self.classifier = classifier
+        self.state = state
+        self.queue_condition.notify_all()
+        self.queue_mutex.release()
+        self.send_state()
+
+    def reload(self, model_fp):
+        """
+        Load model in the background, requests are served by the current model in
+        the meantime (see swap_classifier)
+        """
+        if not self.enable_cnn or self.state == ClassifierState.LOADING:
+            logging.warning(f"Reload of {model_fp} ignored, no model loaded yet")
+            return
+        if self.reload_thread is not None and self.reload_thread.is_alive():
+            logging.warning(f"Reload of {model_fp} ignored, reload in progress")
+            return
+        self.reload_thread = threading.Thread(
+            target=self.reload_fct, args=(pathlib.Path(model_fp),)
+        )
+        self.reload_thread.daemon = True
+        self.reload_thread.start()
+        self.reload_thread.name = "Classifier Reloading"
+
+    def reload_fct(self, model_fp):
+        dt_start = time.perf_counter()
+        try:
+            classifier = self.create_classifier(model_fp)
+        except Exception as e:
+            logging.error(f"Reloading {model_fp} failed, keeping current model: {e}")
+            return
+        logging.info(
+            f"Classifier {model_fp} ready after {time.perf_counter() - dt_start:.1f}s"
+        )
+
+        self.queue_mutex.acquire()
+        self.pending_classifier = classifier
+        self.model_fp = model_fp
+        self.queue_condition.notify_all()
+        self.queue_mutex.release()
+
+    def swap_classifier(self):
+        """
+        Reloaded classifier in place of the current one (queue_mutex held, called
+        by the inference thread between batches), returns the old one
+        """
+        old_classifier = self.classifier
+        self.classifier = self.pending_classifier
+        self.pending_classifier = None
+        self.state = ClassifierState.READY
+        self.count_reload += 1
+        logging.info(f"Swapped in model {self.classifier.model_hash}")
+        return old_classifier
+
+    def get_model_hash(self):
+        return self.classifier.model_hash if self.classifier is not None else None
+
+    def send_state(self):
+        """
+        CSS - Classification Service State (loading, ready, failed) and hash of
+        the model in use
+        """
+        if not self.tcp_client.get_connected():
+            return
+        msg = b"CSS %s" % bytes(self.state.name.lower(), "utf-8")
+        if self.get_model_hash() is not None:
+            msg += b" model=%s" % bytes(self.get_model_hash(), "utf-8")
+        logging.info(msg)
+        self.tcp_client.send_msg(msg)
+
     def stop(self) -> None:
         # network thread
         self.tcp_client.stop()
 
-        # classification thread
+        # preprocessing threads, then inference thread (drains prepared batches)
         self.thread_stop_requested = True
         self.queue_mutex.acquire()
         logging.info("Notifying for stop ...")
         self.queue_condition.notify_all()
         self.queue_mutex.release()
+        self.inference_queue.close()
+        for thread in self.preprocess_thread_list:
+            thread.join()
         self.thread.join()
 
-    def add_queue(self, object_id, img_filepath):
+        if self.shared_crop_ring is not None:
+            self.shared_crop_ring.close()
+        if self.prediction_cache is not None:
+            self.prediction_cache.close()
+
+    def add_queue(
+        self,
+        object_id,
+        img_filepath,
+        ring_name=None,
+        slot=None,
+        crops_filepath=None,
+        budget_sec=None,
+    ):
         self.queue_mutex.acquire()
         logging.info("Adding to queue ...")
-        self.queue.append(QueueItem(object_id=object_id, img_filepath=img_filepath))
+        self.scheduler.add(
+            QueueItem(
+                object_id=object_id,
+                img_filepath=img_filepath,
+                ring_name=ring_name,
+                slot=slot,
+                crops_filepath=crops_filepath,
+            ),
+            budget_sec=budget_sec,
+        )
         logging.info("Notifying ...")
         self.queue_condition.notify_all()
         self.queue_mutex.release()
@@ -108,30 +452,221 @@ class ClassificationService:
     def get_result_list(self):
         pass
 
-    def thread_fct(self):
-        logging.info("Classifier thread started ...")
+    def preprocess_thread_fct(self):
+        logging.info("Preprocessing thread started ...")
         while not self.thread_stop_requested:
-            queue_item = None
+            queue_item_list = []
+            expired_item_list = []
+            self.take_mutex.acquire()
             self.queue_mutex.acquire()
 
-            logging.info(f"Thread: Checking queue len: {len(self.queue)}")
-            if len(self.queue) > 0:
-                queue_item: QueueItem = self.queue.pop()
-            else:
-                logging.info("Thread: Queue empty - going to wait ...")
+            logging.info(f"Thread: Checking queue len: {len(self.scheduler)}")
+            while not self.thread_stop_requested and (
+                len(self.scheduler) == 0 or self.state == ClassifierState.LOADING
+            ):
+                logging.info("Thread: Queue empty or loading - going to wait ...")
                 self.queue_condition.wait()
                 logging.info("Thread: Woke up.")
+            if not self.thread_stop_requested:
+                if self.max_batch_size > 1:
+                    self.wait_for_batch()
+                queue_item_list, expired_item_list = self.scheduler.take(
+                    self.max_batch_size
+                )
+            batch_index = self.count_taken
+            if len(queue_item_list) > 0:
+                self.count_taken += 1
 
             self.queue_mutex.release()
+            self.take_mutex.release()
+
+            # too late, part passed the slide already
+            for queue_item in expired_item_list:
+                logging.warning(f"Deadline missed for {queue_item.object_id} - skip")
+                self.send_skip_result(queue_item)
+
+            if len(queue_item_list) == 0:
+                continue
 
-            if queue_item is not None:
+            # w/o model all requests are skipped
+            prepared_batch = None
+            if self.state == ClassifierState.FAILED:
+                for queue_item in queue_item_list:
+                    self.send_skip_result(queue_item)
+            else:
+                logging.info("Thread: Preprocessing ...")
+                prepared_batch = self.preprocess(queue_item_list)
+            self.hand_over(batch_index, prepared_batch)
+
+        logging.info("Preprocessing thread stopped.")
+
+    def hand_over(self, batch_index, prepared_batch: PreparedBatch):
+        """
+        Prepared batch to the inference thread once all batches taken before are,
+        None if nothing is left to classify (turn passed on only)
+        """
+        self.hand_over_mutex.acquire()
+        while self.count_handed_over != batch_index:
+            self.hand_over_condition.wait()
+        try:
+            if prepared_batch is not None and len(prepared_batch.queue_item_list) > 0:
+                self.inference_queue.put(prepared_batch)
+        finally:
+            self.count_handed_over += 1
+            self.hand_over_condition.notify_all()
+            self.hand_over_mutex.release()
+
+    def thread_fct(self):
+        logging.info("Classifier thread started ...")
+        while not self.inference_queue.is_finished():
+            self.swap_pending_classifier()
+
+            # timeout to swap in a reloaded model w/o requests
+            prepared_batch: PreparedBatch = self.inference_queue.get(timeout=0.1)
+            if prepared_batch is not None:
                 logging.info("Thread: Processing ...")
-                self.process_queue_item(queue_item)
+                try:
+                    self.process_prepared_batch(prepared_batch)
+                except Exception:
+                    # requests of the batch still waiting are answered, next batch
+                    logging.exception("Classifying batch failed - skip")
+                    for queue_item in prepared_batch.queue_item_list[
+                        prepared_batch.count_answered :
+                    ]:
+                        self.send_skip_result(queue_item)
 
         logging.info("Classifier thread stopped.")
 
-    def process_queue_item(self, queue_item: QueueItem):
-        dt_start = datetime.datetime.now()
+    def swap_pending_classifier(self):
+        """
+        Reloaded model swapped in, old one released and the new one announced
+        """
+        self.queue_mutex.acquire()
+        swapped = self.pending_classifier is not None
+        if swapped:
+            old_classifier = self.swap_classifier()
+            self.queue_condition.notify_all()
+        self.queue_mutex.release()
+        if not swapped:
+            return
+
+        if old_classifier is not None:
+            logging.info(f"Releasing model {old_classifier.model_hash}")
+        del old_classifier
+        gc.collect()
+        self.send_state()
+
+    def wait_for_batch(self):
+        """
+        Wait up to max_batch_wait_ms for the batch to fill (queue_mutex held)
+        """
+        dt_end = time.monotonic() + self.max_batch_wait_ms / 1000.0
+        while (
+            len(self.scheduler) < self.max_batch_size and not self.thread_stop_requested
+        ):
+            remaining_sec = dt_end - time.monotonic()
+            if remaining_sec <= 0:
+                break
+            self.queue_condition.wait(remaining_sec)
+
+    def get_shared_crops(self, queue_item: QueueItem):
+        """
+        Crops (low, high) from shared memory, None if not available (anymore)
+        """
+        if queue_item.slot is None:
+            return None
+
+        self.ring_mutex.acquire()
+        try:
+            crops = self.get_shared_crops_from_ring(queue_item)
+            if crops is not None:
+                self.count_shared_memory_hit += 1
+            else:
+                self.count_shared_memory_miss += 1
+        finally:
+            self.ring_mutex.release()
+        return crops
+
+    def get_shared_crops_from_ring(self, queue_item: QueueItem):
+        """
+        Crops of the slot, (re)attaching the ring if needed (ring_mutex held)
+        """
+        # vision service (re)started -> new ring
+        if (
+            self.shared_crop_ring is None
+            or self.shared_crop_ring.name != queue_item.ring_name
+        ):
+            if self.shared_crop_ring is not None:
+                self.shared_crop_ring.close()
+                self.shared_crop_ring = None
+            try:
+                self.shared_crop_ring = sorter.util.shared_frame_ring.SharedFrameRing(
+                    queue_item.ring_name
+                )
+            except FileNotFoundError:
+                logging.warning(
+                    f"Shared memory {queue_item.ring_name} not found - reading from disk"
+                )
+                return None
+
+        crops = self.shared_crop_ring.get(queue_item.slot, queue_item.object_id)
+        if crops is None:
+            logging.warning(
+                f"Slot {queue_item.slot} overwritten - reading {queue_item.object_id}"
+                " from disk"
+            )
+        return crops
+
+    @staticmethod
+    def wait_for_file(fp: pathlib.Path, timeout_sec=5.0):
+        """
+        Request can arrive before the vision service finished writing the image
+        """
+        dt_end = time.monotonic() + timeout_sec
+        while not fp.is_file() and time.monotonic() < dt_end:
+            time.sleep(0.02)
+        return fp.is_file()
+
+    def record_stage(self, stage, dt_start):
+        """
+        Time since dt_start (perf_counter) into the stage histogram, returns now
+        """
+        dt_now = time.perf_counter()
+        self.stage_histogram_dict[stage].record(dt_now - dt_start)
+        return dt_now
+
+    def load_crops(self, queue_item: QueueItem):
+        """
+        RGB crops (low, high) of the request, from shared memory, crops image or
+        camera image
+        """
+        dt_start = time.perf_counter()
+        crops = self.get_shared_crops(queue_item)
+        if crops is not None:
+            logging.info(f"Predicting {queue_item.object_id} from shared memory ...")
+            dt_start = self.record_stage("load", dt_start)
+            if not self.enable_cnn:
+                return None
+            crop_pair = self.classifier.rgb_crops_from_bgr(crops[0], crops[1])
+            self.record_stage("crop", dt_start)
+            return crop_pair
+
+        # crops prepared by vision service, ~10x less to read and decode
+        if queue_item.crops_filepath is not None:
+            crops_abspath = (
+                sorter.classification_service.config.data_dir_path
+                / pathlib.Path(queue_item.crops_filepath)
+            ).resolve()
+            if ClassificationService.wait_for_file(crops_abspath):
+                logging.info(f"Predicting {crops_abspath} ...")
+                if not self.enable_cnn:
+                    return None
+                ocv_img = self.classifier.read_image(str(crops_abspath))
+                dt_start = self.record_stage("load", dt_start)
+                crop_pair = self.classifier.split_crops_image(ocv_img)
+                self.record_stage("crop", dt_start)
+                return crop_pair
+            logging.warning(f"Crops {crops_abspath} missing - using camera image")
 
         # img path is relative to data_dir
         img_abspath = (
@@ -139,51 +674,268 @@ class ClassificationService:
             / pathlib.Path(queue_item.img_filepath)
         ).resolve()
 
-        if not img_abspath.is_file():
+        if not ClassificationService.wait_for_file(img_abspath):
             raise Exception(f"File {img_abspath} does not exist")
 
         logging.info(f"Predicting {img_abspath} ...")
+        if not self.enable_cnn:
+            return None
+        ocv_img = self.classifier.read_image(str(img_abspath))
+        dt_start = self.record_stage("load", dt_start)
+        crop_pair = self.classifier.crop_pair(ocv_img)
+        self.record_stage("crop", dt_start)
+        return crop_pair
 
-        # run CNN
-        if self.enable_cnn:
-            cr = self.classifier.predict(str(img_abspath))
-            predicted_class = cr.predicted_class
-            probability = cr.probability
-            uniqueness = cr.uniqueness
-        else:
-            predicted_class = "plate1x"
-            pred_low_list = [
-                {"class": "plate1x", "probability": 1},
-                {"class": "brick1x", "probability": 0},
-                {"class": "brick2x", "probability": 0},
+    def process_queue_item(self, queue_item: QueueItem):
+        self.process_queue_item_list([queue_item])
+
+    def process_queue_item_list(self, queue_item_list: list):
+        """
+        Preprocess and classify in the calling thread, w/o pipelining
+        """
+        prepared_batch = self.preprocess(queue_item_list)
+        if len(prepared_batch.queue_item_list) > 0:
+            self.process_prepared_batch(prepared_batch)
+
+    def preprocess(self, queue_item_list: list) -> PreparedBatch:
+        """
+        Load and crop the images of a batch (preprocessing thread), images
+        classified before with the current model are looked up in the prediction
+        cache instead
+
+        Requests failing to load are answered with "skip" and left out of the batch.
+        """
+        self.stage_overlap.begin("preprocess")
+        try:
+            return self.preprocess_batch(queue_item_list)
+        finally:
+            self.stage_overlap.end("preprocess")
+
+    def preprocess_batch(self, queue_item_list: list) -> PreparedBatch:
+        prepared_batch = PreparedBatch(
+            queue_item_list=queue_item_list,
+            image_hash_list=[None] * len(queue_item_list),
+            probability_list_list=[None] * len(queue_item_list),
+            model_hash=self.get_model_hash(),
+            dt_start=datetime.datetime.now(),
+        )
+
+        dt_now = time.monotonic()
+        for queue_item in queue_item_list:
+            if queue_item.dt_enqueued is not None:
+                self.stage_histogram_dict["queue_wait"].record(
+                    dt_now - queue_item.dt_enqueued
+                )
+
+        if self.enable_cnn and self.prediction_cache is not None:
+            prepared_batch.image_hash_list = [
+                self.image_hash(qi) for qi in queue_item_list
+            ]
+            prepared_batch.probability_list_list = [
+                (
+                    self.prediction_cache.get(image_hash, prepared_batch.model_hash)
+                    if image_hash is not None
+                    else None
+                )
+                for image_hash in prepared_batch.image_hash_list
             ]
-            pred_high_list = pred_low_list
-            cr = sorter.classification_service.classification_result.ClassificationResult(
-                predicted_class=predicted_class,
-                predicted_class_high=predicted_class,
-                probability=None,
-                uniqueness=None,
-                prediction_list=[],
-                label_data={},
-                low_list=pred_low_list,
-                high_list=pred_high_list,
-            )
-            probability = 1
-            uniqueness = 100
-            time.sleep(1.2)
 
-        logging.info(f"PredictedClass: {predicted_class}")
+        prepared_batch.crop_pair_list = []
+        failed_index_list = []
+        for i, (queue_item, probability_list) in enumerate(
+            zip(queue_item_list, prepared_batch.probability_list_list)
+        ):
+            crop_pair = None
+            if probability_list is None:
+                try:
+                    crop_pair = self.load_crops(queue_item)
+                except Exception as e:
+                    logging.error(
+                        f"Preprocessing {queue_item.object_id} failed - skip: {e}"
+                    )
+                    self.send_skip_result(queue_item)
+                    failed_index_list.append(i)
+            prepared_batch.crop_pair_list.append(crop_pair)
+
+        self.drop_items(prepared_batch, failed_index_list)
+        return prepared_batch
+
+    def drop_items(self, prepared_batch: PreparedBatch, index_list: list):
+        """
+        Requests already answered with "skip" removed from the batch
+        """
+        if len(index_list) == 0:
+            return
+        kept_index_list = [
+            i for i in range(len(prepared_batch.queue_item_list)) if i not in index_list
+        ]
+        prepared_batch.queue_item_list = [
+            prepared_batch.queue_item_list[i] for i in kept_index_list
+        ]
+        prepared_batch.crop_pair_list = [
+            prepared_batch.crop_pair_list[i] for i in kept_index_list
+        ]
+        prepared_batch.image_hash_list = [
+            prepared_batch.image_hash_list[i] for i in kept_index_list
+        ]
+        prepared_batch.probability_list_list = [
+            prepared_batch.probability_list_list[i] for i in kept_index_list
+        ]
+
+    def process_prepared_batch(self, prepared_batch: PreparedBatch):
+        """
+        Classify a preprocessed batch and send the results (inference thread)
+        """
+        self.stage_overlap.begin("inference")
+        try:
+            cr_list = self.classify_prepared(prepared_batch)
+        finally:
+            self.stage_overlap.end("inference")
+
+        # all requests answered with "skip" (crops missing)
+        queue_item_list = prepared_batch.queue_item_list
+        if len(queue_item_list) == 0:
+            return
+
         dt_end = datetime.datetime.now()
-        delta_sec = (dt_end - dt_start).total_seconds()
+        delta_sec = (dt_end - prepared_batch.dt_start).total_seconds()
 
+        # exponential moving average, weights sum up to 1
         if self.average_process_time_sec is None:
             self.average_process_time_sec = delta_sec
         else:
             self.average_process_time_sec = (
-                0.7 * self.average_process_time_sec + 0.1 * delta_sec
+                0.9 * self.average_process_time_sec + 0.1 * delta_sec
             )
         logging.info(f"Average Processing Time: {self.average_process_time_sec:.2f}s")
 
+        for queue_item, cr in zip(queue_item_list, cr_list):
+            self.send_classification_result(queue_item, cr)
+            prepared_batch.count_answered += 1
+
+        # statistics
+        dt_now = time.monotonic()
+        self.count_batch += 1
+        self.count_item += len(queue_item_list)
+        self.max_batch_size_seen = max(self.max_batch_size_seen, len(queue_item_list))
+        for queue_item in queue_item_list:
+            if queue_item.dt_enqueued is not None:
+                latency_sec = dt_now - queue_item.dt_enqueued
+                self.total_latency_sec += latency_sec
+                self.max_latency_sec = max(self.max_latency_sec, latency_sec)
+        if len(queue_item_list) > 1:
+            logging.info(f"Batch statistics: {self.get_statistics()}")
+
+    def classify_prepared(self, prepared_batch: PreparedBatch):
+        """
+        Classification results of the batch (inference thread)
+        """
+        # run CNN
+        if self.enable_cnn:
+            return self.predict_prepared(prepared_batch)
+
+        # dummy classification
+        dt_inference_start = time.perf_counter()
+        predicted_class = "plate1x"
+        pred_low_list = [
+            {"class": "plate1x", "probability": 1},
+            {"class": "brick1x", "probability": 0},
+            {"class": "brick2x", "probability": 0},
+        ]
+        pred_high_list = pred_low_list
+        cr = sorter.classification_service.classification_result.ClassificationResult(
+            predicted_class=predicted_class,
+            predicted_class_high=predicted_class,
+            probability=1,
+            uniqueness=100,
+            prediction_list=[],
+            label_data={},
+            low_list=pred_low_list,
+            high_list=pred_high_list,
+        )
+        cr_list = [cr] * len(prepared_batch.queue_item_list)
+        time.sleep(1.2)
+        self.record_stage("inference", dt_inference_start)
+        return cr_list
+
+    def image_hash(self, queue_item: QueueItem):
+        """
+        Content hash of the request's camera image, None for live requests handed
+        over as crops (new parts, not worth hashing)
+        """
+        if queue_item.ring_name is not None or queue_item.crops_filepath is not None:
+            return None
+        img_abspath = (
+            sorter.classification_service.config.data_dir_path
+            / pathlib.Path(queue_item.img_filepath)
+        ).resolve()
+        if not img_abspath.is_file():
+            return None
+        return sorter.util.file_hash.file_hash(str(img_abspath))
+
+    def predict_prepared(self, prepared_batch: PreparedBatch):
+        """
+        Classification results, cache hits of preprocessing taken as they are, only
+        the others run through the CNN (and are added to the cache)
+        """
+        model_hash = self.classifier.model_hash
+
+        # model swapped since preprocessing, cache hits were of the old model
+        if prepared_batch.model_hash != model_hash:
+            self.load_cache_hit_crops(prepared_batch)
+            prepared_batch.model_hash = model_hash
+        crop_pair_list = prepared_batch.crop_pair_list
+        probability_list_list = list(prepared_batch.probability_list_list)
+
+        miss_index_list = [i for i, p in enumerate(probability_list_list) if p is None]
+        if len(miss_index_list) > 0:
+            dt_inference_start = time.perf_counter()
+            predicted_list = self.classifier.predict_probability_batch(
+                [crop_pair_list[i] for i in miss_index_list]
+            )
+            self.record_stage("inference", dt_inference_start)
+            for i, probability_list in zip(miss_index_list, predicted_list):
+                probability_list_list[i] = probability_list
+                image_hash = prepared_batch.image_hash_list[i]
+                if self.prediction_cache is not None and image_hash is not None:
+                    self.prediction_cache.put(image_hash, model_hash, probability_list)
+
+        return [
+            self.classifier.classification_result(
+                self.classifier.pred_list(probability_list)
+            )
+            for probability_list in probability_list_list
+        ]
+
+    def load_cache_hit_crops(self, prepared_batch: PreparedBatch):
+        """
+        Crops of the cache hits, to be predicted by the swapped in model (inference
+        thread), requests failing to load are answered with "skip" and dropped
+        """
+        failed_index_list = []
+        for i, probability_list in enumerate(prepared_batch.probability_list_list):
+            if probability_list is None:
+                continue
+            queue_item = prepared_batch.queue_item_list[i]
+            try:
+                prepared_batch.crop_pair_list[i] = self.load_crops(queue_item)
+            except Exception as e:
+                logging.error(f"Reloading {queue_item.object_id} failed - skip: {e}")
+                self.send_skip_result(queue_item)
+                failed_index_list.append(i)
+            prepared_batch.probability_list_list[i] = None
+        self.drop_items(prepared_batch, failed_index_list)
+
+    def send_classification_result(
+        self,
+        queue_item: QueueItem,
+        cr: sorter.classification_service.classification_result.ClassificationResult,
+    ):
+        predicted_class = cr.predicted_class
+        probability = cr.probability
+        uniqueness = cr.uniqueness
+        logging.info(f"PredictedClass: {predicted_class}")
+
         # skip
         if probability < 0.55 or uniqueness < 0.0:
             predicted_class = "skip"
@@ -193,21 +945,116 @@ class ClassificationService:
             )
 
         # send result to vision
-        msg = self.compose_classification_result_message(
-            queue_item.object_id,
-            predicted_class,
-            probability,
-            uniqueness,
-            self.average_process_time_sec,
-            cr.low_list[:3],
-            cr.high_list[:3],
+        m = crc.ClassificationResultMessage(
+            object_id=queue_item.object_id,
+            predicted_class=predicted_class,
+            probability=probability,
+            uniqueness=uniqueness,
+            average_process_time_sec=self.average_process_time_sec,
+            low_list=cr.low_list[:3],
+            high_list=cr.high_list[:3],
+            model_hash=self.get_model_hash(),
+            class_list=(
+                self.classifier.class_list if self.classifier is not None else None
+            ),
         )
-        logging.info(msg)
-        self.tcp_client.send_msg(msg)
+        self.tcp_client.send_classification_result(m, record_stages=True)
 
         # send notification
         self.notification_client.notify_classification_result(predicted_class)
 
+    def send_skip_result(self, queue_item: QueueItem):
+        skip_list = [
+            {"class": "skip", "probability": 0.0},
+            {"class": "-", "probability": 0.0},
+            {"class": "-", "probability": 0.0},
+        ]
+        self.tcp_client.send_classification_result(
+            crc.ClassificationResultMessage(
+                object_id=queue_item.object_id,
+                predicted_class="skip",
+                probability=0.0,
+                uniqueness=0.0,
+                average_process_time_sec=self.average_process_time_sec,
+                low_list=skip_list,
+                high_list=skip_list,
+                model_hash=self.get_model_hash(),
+            )
+        )
+
+    def get_statistics(self):
+        self.queue_mutex.acquire()
+        scheduler_statistics = self.scheduler.get_statistics()
+        self.queue_mutex.release()
+        return scheduler_statistics | {
+            "state": self.state.name.lower(),
+            "model_hash": self.get_model_hash(),
+            "count_reload": self.count_reload,
+            "count_batch": self.count_batch,
+            "count_item": self.count_item,
+            "average_batch_size": (
+                self.count_item / self.count_batch if self.count_batch > 0 else 0.0
+            ),
+            "max_batch_size": self.max_batch_size_seen,
+            "average_latency_ms": (
+                1000.0 * self.total_latency_sec / self.count_item
+                if self.count_item > 0
+                else 0.0
+            ),
+            "max_latency_ms": 1000.0 * self.max_latency_sec,
+            "count_shared_memory_hit": self.count_shared_memory_hit,
+            "count_shared_memory_miss": self.count_shared_memory_miss,
+            "inference_queue": self.inference_queue.get_statistics(),
+            "overlap": self.stage_overlap.get_statistics(),
+            "cascade": (
+                self.classifier.get_statistics()
+                if self.classifier is not None
+                else None
+            ),
+            "prediction_cache": (
+                self.prediction_cache.get_statistics()
+                if self.prediction_cache is not None
+                else None
+            ),
+            "stage": {
+                stage: histogram.get_statistics()
+                for stage, histogram in self.stage_histogram_dict.items()
+            },
+        }
+
+    def send_statistics(self, requester):
+        """
+        STR - Statistics Result, answer to STA of requester
+
+        Kept to the stage percentiles and a few counters.
+        """
+        statistics = self.get_statistics()
+        summary = {
+            "name": self.tcp_client.name,
+            "state": statistics["state"],
+            "count_item": statistics["count_item"],
+            "queue_depth": statistics["queue_depth"],
+            "count_missed_deadline": statistics["count_missed_deadline"],
+            "overlap_ratio": round(statistics["overlap"]["overlap_ratio"], 2),
+            "stage": {
+                stage: {
+                    key: round(value, 1) if isinstance(value, float) else value
+                    for key, value in stage_statistics.items()
+                }
+                for stage, stage_statistics in statistics["stage"].items()
+            },
+        }
+        if statistics["cascade"] is not None:
+            summary["first_stage_hit_rate"] = round(
+                statistics["cascade"]["first_stage_hit_rate"], 2
+            )
+        msg = b"STR %s %s" % (
+            bytes(requester, "utf-8"),
+            bytes(json.dumps(summary, separators=(",", ":")), "utf-8"),
+        )
+        logging.info(msg)
+        self.tcp_client.send_msg(msg)
+
     @staticmethod
     def compose_classification_result_message(
         object_id,
@@ -217,18 +1064,28 @@ class ClassificationService:
         average_process_time_sec,
         low_list,
         high_list,
+        model_hash=None,
     ):
-        pred_low_serialized = ClassificationService.serialize(low_list)
-        pred_high_serialized = ClassificationService.serialize(high_list)
-        msg = f"CLR {object_id:d} {predicted_class} {probability} {uniqueness} {average_process_time_sec} {pred_low_serialized} {pred_high_serialized}"
-        return bytes(msg, "utf-8")
+        """
+        CLR text message (e.g. for manual tools), see classification_result_codec
+        """
+        return crc.encode_text(
+            crc.ClassificationResultMessage(
+                object_id=object_id,
+                predicted_class=predicted_class,
+                probability=probability,
+                uniqueness=uniqueness,
+                average_process_time_sec=average_process_time_sec,
+                low_list=low_list,
+                high_list=high_list,
+                model_hash=model_hash,
+            )
+        )
 
     @staticmethod
     def serialize(d) -> str:
-        s = str(base64.b64encode(bytes(json.dumps(d), "utf-8")), "utf-8")
-        assert " " not in s
-        return s
+        return crc.serialize(d)
 
     @staticmethod
     def deserialize(s: str):
-        return json.loads(str(base64.b64decode(bytes(s, "utf-8")), "utf-8"))
+        return crc.deserialize(s)
@@ -1,56 +1,160 @@
 import json
 import logging
 import pathlib
+import time
 
 import cv2
+import numpy as np
 import tensorflow as tf
 
 import sorter.classification_service.classification_result
 import sorter.classification_service.crop_image
+import sorter.classification_service.inference_engine
 import sorter.classification_service.white_balance
 import sorter.util.file_hash
 
 
 class Classifier:
-    def __init__(self, model_fp):
-        # softmax convert logits to probabilities
-        # https://developers.google.com/machine-learning/glossary#logits
-
-        # only .keras tested currently
-        assert model_fp.suffix == ".keras"
+    def __init__(
+        self,
+        model_fp,
+        inference_engine="tf_function",
+        intra_op_threads=None,
+        inter_op_threads=None,
+        warm_up_batch_size_list=(1,),
+        hash_cache_fp=None,
+        prediction_cache=None,
+        first_stage_model_fp=None,
+        first_stage_min_probability=0.9,
+        first_stage_min_uniqueness=5.0,
+    ):
+        # thread pools, before model load starts the TF runtime
+        sorter.classification_service.inference_engine.configure_threading(
+            intra_op_threads, inter_op_threads
+        )
 
-        logging.info(f"Loading model {model_fp} ...")
-        model = tf.keras.models.load_model(model_fp, compile=False)
-
-        # add softmax layer -> output probabilities
-        inputs = model.input
-        outputs = tf.keras.layers.Softmax()(
-            model.output[0]
-        )  # Access the tensor directly
-        self.probability_model = tf.keras.Model(inputs=inputs, outputs=outputs)
+        # .keras or .tflite exported from it (see tflite_export)
+        if model_fp.suffix not in [".keras", ".tflite"]:
+            raise Exception(f"Unsupported model file {model_fp}")
 
         # json
         json_fp = str(pathlib.Path(model_fp).with_suffix(".json"))
         with open(json_fp) as json_file:
             json_data = json.load(json_file)
 
-        # verify hash
-        hash = sorter.util.file_hash.file_hash(model_fp)
+        # verify hash before loading, unchanged model file not re-hashed with cache
+        if hash_cache_fp is not None:
+            hash = sorter.util.file_hash.cached_file_hash(model_fp, hash_cache_fp)
+        else:
+            hash = sorter.util.file_hash.file_hash(model_fp)
         if hash != json_data["model_hash"]:
             raise Exception(
                 f"Model hash does not qual hash in json file (file hash: {hash})"
             )
 
         self.class_list = json_data["label_name_list"]
+        self.model_hash = json_data["model_hash"]
+
+        # PredictionCache, results of images already classified with this model
+        self.prediction_cache = prediction_cache
+
+        # inference engine, warmed up so the first part runs at steady-state latency
+        logging.info(f"Loading model {model_fp} ...")
+        if model_fp.suffix == ".tflite":
+            # TFLite interpreter, intra-op threads = interpreter threads
+            self.probability_model = None
+            self.inference_engine = (
+                sorter.classification_service.inference_engine.TfLiteInferenceEngine(
+                    model_fp, num_threads=intra_op_threads
+                )
+            )
+        else:
+            self.probability_model = Classifier.load_probability_model(model_fp)
+            self.inference_engine = (
+                sorter.classification_service.inference_engine.create_inference_engine(
+                    inference_engine, self.probability_model
+                )
+            )
+        self.inference_engine.warm_up(warm_up_batch_size_list)
+
+        # cascade - small first stage model (e.g. low crop only), only parts it is
+        # not confident about run through this model
+        self.first_stage = None
+        self.first_stage_min_probability = first_stage_min_probability
+        self.first_stage_min_uniqueness = first_stage_min_uniqueness
+        self.count_item = 0
+        self.count_escalated = 0
+        self.first_stage_sec = 0.0
+        self.full_sec = 0.0
+        if first_stage_model_fp is not None:
+            self.first_stage = Classifier(
+                first_stage_model_fp,
+                inference_engine=inference_engine,
+                warm_up_batch_size_list=warm_up_batch_size_list,
+                hash_cache_fp=hash_cache_fp,
+            )
+            if self.first_stage.class_list != self.class_list:
+                raise Exception(
+                    f"First stage model {first_stage_model_fp} has different labels"
+                )
+            # results depend on both models (prediction cache, CLR)
+            self.model_hash = f"{self.first_stage.model_hash}+{self.model_hash}"
+
+    @staticmethod
+    def load_probability_model(model_fp):
+        """
+        Keras model with softmax appended, i.e. class probabilities as output
+        """
+        # softmax convert logits to probabilities
+        # https://developers.google.com/machine-learning/glossary#logits
+        model = tf.keras.models.load_model(model_fp, compile=False)
+
+        # add softmax layer -> output probabilities
+        inputs = model.input
+        outputs = tf.keras.layers.Softmax()(
+            model.output[0]
+        )  # Access the tensor directly
+        return tf.keras.Model(inputs=inputs, outputs=outputs)
 
     def predict(
         self, img_fp: str
     ) -> sorter.classification_service.classification_result.ClassificationResult:
+        if self.prediction_cache is None:
+            return self.predict_crops(*self.load_crops(img_fp))
+
+        # same image content with same model -> same probabilities
+        image_hash = sorter.util.file_hash.file_hash(img_fp)
+        probability_list = self.prediction_cache.get(image_hash, self.model_hash)
+        if probability_list is None:
+            probability_list = self.predict_probability_batch(
+                [self.load_crops(img_fp)]
+            )[0]
+            self.prediction_cache.put(image_hash, self.model_hash, probability_list)
+        return self.classification_result(self.pred_list(probability_list))
+
+    def load_crops(self, img_fp: str):
+        """
+        RGB crops (low, high) of camera image file
+        """
         if not isinstance(img_fp, str):
             raise Exception("Input must be string image file path")
+        return Classifier.crop_pair(Classifier.read_image(img_fp))
 
-        # load
+    @staticmethod
+    def read_image(img_fp: str):
+        """
+        BGR image of file
+        """
         ocv_img = cv2.imread(img_fp)
+        if ocv_img is None:
+            raise Exception(f"Unable to read {img_fp}")
+        return ocv_img
+
+    @staticmethod
+    def crop_pair(ocv_img):
+        """
+        RGB crops (low, high) of BGR camera image
+        """
         # ocv_img = sorter.white_balance.white_balance(ocv_img, random_whitebalance=False)
         ocv_img = cv2.cvtColor(ocv_img, cv2.COLOR_BGR2RGB)
 
@@ -62,7 +166,107 @@ class Classifier:
             ocv_img, low=False
         )
 
-        pred_low_list = self.predict_crop(img_crop_low, img_crop_high)
+        return img_crop_low, img_crop_high
+
+    @staticmethod
+    def load_crops_image(img_fp: str):
+        """
+        RGB crops (low, high) of crops image, both side by side as written by the
+        vision service
+        """
+        return Classifier.split_crops_image(Classifier.read_image(img_fp))
+
+    @staticmethod
+    def split_crops_image(ocv_img):
+        """
+        RGB crops (low, high) of BGR crops image
+        """
+        crop_width = ocv_img.shape[1] // 2
+        return Classifier.rgb_crops_from_bgr(
+            ocv_img[:, :crop_width], ocv_img[:, crop_width:]
+        )
+
+    @staticmethod
+    def rgb_crops_from_bgr(img_crop_low, img_crop_high):
+        """
+        Crops made from the BGR camera frame, e.g. handed over in shared memory
+        """
+        # channel swap commutes with crop and resize
+        img_crop_low = cv2.cvtColor(img_crop_low, cv2.COLOR_BGR2RGB)
+        img_crop_high = cv2.cvtColor(img_crop_high, cv2.COLOR_BGR2RGB)
+        return img_crop_low, img_crop_high
+
+    def predict_crops(
+        self, img_crop_low, img_crop_high
+    ) -> sorter.classification_service.classification_result.ClassificationResult:
+        return self.predict_crops_batch([(img_crop_low, img_crop_high)])[0]
+
+    def predict_crops_batch(self, crop_pair_list: list) -> list:
+        """
+        One predict call for a list of RGB crop pairs (low, high), result per pair
+        """
+        return [
+            self.classification_result(self.pred_list(probability_list))
+            for probability_list in self.predict_probability_batch(crop_pair_list)
+        ]
+
+    def predict_probability_batch(self, crop_pair_list: list) -> list:
+        """
+        Class probabilities (list in order of class_list) per RGB crop pair
+
+        With cascade the first stage result is taken if it is confident (probability
+        and uniqueness above the thresholds), the rest is escalated to this model.
+        """
+        if self.first_stage is None:
+            return self.run_model(crop_pair_list)
+
+        dt_start = time.perf_counter()
+        probability_list_list = self.first_stage.run_model(crop_pair_list)
+        dt_first_stage_end = time.perf_counter()
+        self.first_stage_sec += dt_first_stage_end - dt_start
+
+        escalate_index_list = [
+            i
+            for i, probability_list in enumerate(probability_list_list)
+            if not self.first_stage_confident(probability_list)
+        ]
+        if len(escalate_index_list) > 0:
+            full_list = self.run_model([crop_pair_list[i] for i in escalate_index_list])
+            for i, probability_list in zip(escalate_index_list, full_list):
+                probability_list_list[i] = probability_list
+            self.full_sec += time.perf_counter() - dt_first_stage_end
+
+        self.count_item += len(crop_pair_list)
+        self.count_escalated += len(escalate_index_list)
+        return probability_list_list
+
+    def first_stage_confident(self, probability_list) -> bool:
+        """
+        Same criteria as the skip decision of the classification service, stricter
+        thresholds
+        """
+        pred_list = self.pred_list(probability_list)
+        probability = pred_list[0]["probability"]
+        probability_second = pred_list[1]["probability"]
+        return probability >= self.first_stage_min_probability and (
+            probability_second == 0.0
+            or probability / probability_second >= self.first_stage_min_uniqueness
+        )
+
+    def run_model(self, crop_pair_list: list) -> list:
+        """
+        Class probabilities of this model only (no cascade)
+        """
+        # batch
+        batch_low = np.stack([crop_pair[0] for crop_pair in crop_pair_list])
+        batch_high = np.stack([crop_pair[1] for crop_pair in crop_pair_list])
+
+        probability = self.inference_engine.predict(batch_low, batch_high)
+        return probability.tolist()
+
+    def classification_result(
+        self, pred_low_list
+    ) -> sorter.classification_service.classification_result.ClassificationResult:
         pred_uniqueness = (
             pred_low_list[0]["probability"] / pred_low_list[1]["probability"]
         )
@@ -78,21 +282,9 @@ class Classifier:
             high_list=pred_low_list,
         )
 
-    def predict_crop(self, img_crop_low, img_crop_high):
-        # convert to tensor
-        image_array_low = tf.convert_to_tensor(img_crop_low, dtype=tf.float32)
-        image_array_high = tf.convert_to_tensor(img_crop_high, dtype=tf.float32)
-
-        # batch
-        batch_low = tf.expand_dims(image_array_low, 0)
-        batch_high = tf.expand_dims(image_array_high, 0)
-
-        # predict
-        probability = self.probability_model.predict((batch_low, batch_high), verbose=0)
-
+    def pred_list(self, probability_list):
         # class, prob, uniqueness
         # predicted_class = np.argmax(probability,1)
-        probability_list = probability.tolist()[0]
         class_list = self.class_list
         pred_list = list(
             map(
@@ -104,6 +296,38 @@ class Classifier:
 
         return pred_list
 
+    def get_statistics(self):
+        """
+        Cascade statistics, savings relative to running the full model on all parts
+        (estimated from the full model's time per escalated part, None w/o any)
+        """
+        if self.first_stage is None:
+            return None
+        count_first_stage = self.count_item - self.count_escalated
+        full_item_sec = (
+            self.full_sec / self.count_escalated if self.count_escalated > 0 else 0.0
+        )
+        saved_sec = (
+            self.count_item * full_item_sec - self.first_stage_sec - self.full_sec
+            if self.count_escalated > 0
+            else None
+        )
+        return {
+            "count_item": self.count_item,
+            "count_first_stage": count_first_stage,
+            "count_escalated": self.count_escalated,
+            "first_stage_hit_rate": (
+                count_first_stage / self.count_item if self.count_item > 0 else 0.0
+            ),
+            "first_stage_item_ms": (
+                1000.0 * self.first_stage_sec / self.count_item
+                if self.count_item > 0
+                else 0.0
+            ),
+            "full_item_ms": 1000.0 * full_item_sec,
+            "saved_ms": 1000.0 * saved_sec if saved_sec is not None else None,
+        }
+
     def get_class_count(self):
         return len(self.class_list)
 
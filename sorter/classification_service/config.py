@@ -12,3 +12,13 @@ incoming_data_known_class_test_dir_path = (
 )
 trash_dir_path = data_dir_path / "trash"
 inconsistent_dir_path = data_dir_path / "incoming_data_inconsistent"
+roi_mask_cache_dir_path = data_dir_path / "roi_mask_cache"
+model_hash_cache_file_path = data_dir_path / "model_hash_cache.json"
+prediction_cache_file_path = data_dir_path / "prediction_cache.sqlite"
+
+# crops image written by the vision service next to the camera image: <name>_crops.png
+crops_name_suffix = "_crops"
+
+# shared memory handoff of the two crops (low, high) from vision to classification
+shared_crop_ring_slot_count = 16
+shared_crop_ring_item_shape = (2, 224, 224, 3)
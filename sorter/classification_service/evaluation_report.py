@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import pathlib
+from dataclasses import asdict, dataclass, field
+
+import sorter.classification_service.config
+
+templates_dir_path = pathlib.Path(__file__).parents[2] / "templates"
+
+# part images as written by the vision service, w/o the extra crops images
+image_suffix_list = [".png", ".webp"]
+
+
+@dataclass
+class EvaluationItem:
+    fp: str = None
+    label_class: str = None
+    predicted_class: str = None
+    predicted_class_high: str = None
+    probability: float = None
+    uniqueness: float = None
+    prediction_correct: bool = None
+
+
+@dataclass
+class LabelStatistics:
+    count: int = 0
+    count_correct: int = 0
+    confusion_dict: dict = field(default_factory=dict)  # predicted class -> count
+
+    def add(self, ev: EvaluationItem):
+        self.count += 1
+        if ev.prediction_correct:
+            self.count_correct += 1
+        self.confusion_dict[ev.predicted_class] = (
+            self.confusion_dict.get(ev.predicted_class, 0) + 1
+        )
+
+
+def list_labeled_images(folder_list):
+    """
+    (image path, label) of all part images below the folders, label taken from the
+    json next to the image ("unknown" if missing)
+
+    Generator, folders are walked lazily, i.e. any number of images.
+    """
+    for folder in folder_list:
+        for dirpath, dirname_list, filename_list in os.walk(folder):
+            dirname_list.sort()
+            for filename in sorted(filename_list):
+                fp = pathlib.Path(dirpath) / filename
+                if fp.suffix not in image_suffix_list or fp.stem.endswith(
+                    sorter.classification_service.config.crops_name_suffix
+                ):
+                    continue
+
+                label_class = None
+                json_fp = fp.with_suffix(".json")
+                if json_fp.exists():
+                    try:
+                        with open(json_fp) as json_file:
+                            label_class = json.load(json_file).get("object_class")
+                    except ValueError:
+                        logging.warning(f"Unable to read label from {json_fp}")
+                yield str(fp), label_class if label_class is not None else "unknown"
+
+
+def read_predictions(predictions_fp, label_class):
+    """
+    EvaluationItems of one label from predictions.jsonl (generator, read lazily)
+    """
+    with open(predictions_fp, encoding="utf-8") as f:
+        for line in f:
+            ev = EvaluationItem(**json.loads(line))
+            if ev.label_class == label_class:
+                yield ev
+
+
+def render_report(
+    template_name,
+    output_fp,
+    report_title,
+    classifier_model,
+    ev_by_label,
+    statistics_by_label,
+):
+    import jinja2
+
+    environment = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(str(templates_dir_path)), autoescape=True
+    )
+    template = environment.get_template(template_name)
+    with open(output_fp, "w", encoding="utf-8") as f:
+        # streamed, the html is never held in memory as a whole
+        for chunk in template.generate(
+            report_title=report_title,
+            classifier_model=classifier_model,
+            ev_by_label=ev_by_label,
+            statistics_by_label=statistics_by_label,
+        ):
+            f.write(chunk)
+    logging.info(f"Report written to {output_fp}")
+
+
+def write_reports(evaluation_item_iter, output_dir, classifier_model, report_title):
+    """
+    Consume evaluation items: predictions streamed to predictions.jsonl while
+    counting per label, then the html reports rendered (incorrect only and all),
+    returns the LabelStatistics by label
+
+    Memory doesn't grow with the number of images, the items listed in the reports
+    are read back from predictions.jsonl (one pass per label).
+    """
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    predictions_fp = output_dir / "predictions.jsonl"
+
+    statistics_by_label = {}
+    with open(predictions_fp, "w", encoding="utf-8") as f:
+        for ev in evaluation_item_iter:
+            f.write(json.dumps(asdict(ev)) + "\n")
+            statistics_by_label.setdefault(ev.label_class, LabelStatistics()).add(ev)
+    statistics_by_label = dict(sorted(statistics_by_label.items()))
+
+    # summary
+    count = 0
+    count_correct = 0
+    for label_class, statistics in statistics_by_label.items():
+        count += statistics.count
+        count_correct += statistics.count_correct
+        logging.info(
+            f"{label_class}: {statistics.count_correct}/{statistics.count} correct "
+            f"({100.0 * statistics.count_correct / statistics.count:.1f}%), "
+            f"predicted: {statistics.confusion_dict}"
+        )
+    logging.info(
+        f"Total: {count_correct}/{count} correct "
+        f"({100.0 * count_correct / count if count > 0 else 0.0:.1f}%)"
+    )
+
+    for template_name in ["evaluation_report.html", "evaluation_report_all.html"]:
+        render_report(
+            template_name,
+            output_dir / template_name,
+            report_title,
+            classifier_model,
+            {
+                label_class: read_predictions(predictions_fp, label_class)
+                for label_class in statistics_by_label
+            },
+            statistics_by_label,
+        )
+    return statistics_by_label
@@ -0,0 +1,102 @@
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+import sorter.classification_service.bulk_evaluation
+import sorter.classification_service.evaluation_report
+import sorter.util.latency_histogram
+
+
+@dataclass
+class InferenceBenchmarkResult:
+    name: str = None
+    image_count: int = 0
+    top1_agreement: float = None  # with the reference backend
+    max_probability_diff: float = None
+    p50_ms: float = None
+    p95_ms: float = None
+
+
+def run_benchmark(classifier_dict, folder_list, max_image_count=200):
+    """
+    Classify the same part images with every classifier (name -> Classifier),
+    batch size 1 as in live operation
+
+    The first classifier is the reference (e.g. Keras) the others' top-1 class and
+    probabilities are compared to.
+    """
+    sample_iter = sorter.classification_service.evaluation_report.list_labeled_images(
+        folder_list
+    )
+    name_list = list(classifier_dict)
+    histogram_dict = {
+        name: sorter.util.latency_histogram.LatencyHistogram() for name in name_list
+    }
+    count_agree_dict = {name: 0 for name in name_list}
+    max_diff_dict = {name: 0.0 for name in name_list}
+
+    image_count = 0
+    for fp, _ in itertools.islice(sample_iter, max_image_count):
+        low, high, valid = sorter.classification_service.bulk_evaluation.load_crop_pair(
+            bytes(fp, "utf-8")
+        )
+        if not valid:
+            continue
+
+        reference = None
+        for name in name_list:
+            dt_start = time.perf_counter()
+            probability = classifier_dict[name].inference_engine.predict(
+                low[np.newaxis], high[np.newaxis]
+            )[0]
+            histogram_dict[name].record(time.perf_counter() - dt_start)
+
+            if reference is None:
+                reference = probability
+            if np.argmax(probability) == np.argmax(reference):
+                count_agree_dict[name] += 1
+            max_diff_dict[name] = max(
+                max_diff_dict[name], float(np.max(np.abs(probability - reference)))
+            )
+        image_count += 1
+    logging.info(f"Benchmarked {image_count} images")
+
+    result_list = []
+    for name in name_list:
+        statistics = histogram_dict[name].get_statistics()
+        result_list.append(
+            InferenceBenchmarkResult(
+                name=name,
+                image_count=image_count,
+                top1_agreement=(
+                    count_agree_dict[name] / image_count if image_count > 0 else None
+                ),
+                max_probability_diff=max_diff_dict[name],
+                p50_ms=statistics["p50_ms"],
+                p95_ms=statistics["p95_ms"],
+            )
+        )
+    return result_list
+
+
+def format_result_table(result_list):
+    line_list = [
+        f'{"Backend":<32} {"Images":>6} {"Top-1":>7} {"MaxDiff":>8} '
+        f'{"p50 ms":>8} {"p95 ms":>8}'
+    ]
+    result: InferenceBenchmarkResult
+    for result in result_list:
+        agreement = (
+            f"{100.0 * result.top1_agreement:6.1f}%"
+            if result.top1_agreement is not None
+            else "-"
+        )
+        line_list.append(
+            f"{result.name:<32} {result.image_count:>6} {agreement:>7} "
+            f"{result.max_probability_diff:>8.4f} {result.p50_ms:>8.2f} "
+            f"{result.p95_ms:>8.2f}"
+        )
+    return line_list
@@ -0,0 +1,183 @@
+import logging
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# input of the two crop branches (low, high), batch size variable
+crop_shape = (224, 224, 3)
+
+
+def configure_threading(intra_op_threads=None, inter_op_threads=None):
+    """
+    TF thread pools, only possible before the TF runtime is initialized (i.e.
+    before the model is loaded)
+    """
+    try:
+        if intra_op_threads is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        logging.warning(f"TF threading not configured, runtime already started: {e}")
+    logging.info(
+        "TF threads intra-op: "
+        f"{tf.config.threading.get_intra_op_parallelism_threads()} inter-op: "
+        f"{tf.config.threading.get_inter_op_parallelism_threads()} (0 = auto)"
+    )
+
+
+class InferenceEngine:
+    """
+    Runs the softmax model on batches of uint8 crop pairs (low, high)
+
+    predict() returns the class probabilities as numpy array (batch, class count).
+    Models with a single input (e.g. the first stage of a cascade) get the low crop
+    only.
+    """
+
+    def __init__(self, probability_model) -> None:
+        self.probability_model = probability_model
+        self.input_count = (
+            len(probability_model.inputs) if probability_model is not None else 2
+        )
+
+    def model_input(self, batch_low, batch_high):
+        return (batch_low, batch_high) if self.input_count == 2 else batch_low
+
+    def predict(self, batch_low, batch_high):
+        raise NotImplementedError()
+
+    def warm_up(self, batch_size_list=(1,)):
+        """
+        First calls build/trace the graph - done at load time, not for the first part
+        """
+        for batch_size in batch_size_list:
+            batch = np.zeros((batch_size,) + crop_shape, dtype=np.uint8)
+            dt_start = time.perf_counter()
+            self.predict(batch, batch)
+            logging.info(
+                f"Warm-up batch size {batch_size}: "
+                f"{1000.0 * (time.perf_counter() - dt_start):.1f}ms"
+            )
+
+
+class KerasInferenceEngine(InferenceEngine):
+    """
+    Plain Keras call per batch, no tracing
+    """
+
+    def predict(self, batch_low, batch_high):
+        probability = self.probability_model.predict_on_batch(
+            self.model_input(
+                tf.convert_to_tensor(batch_low, dtype=tf.float32),
+                tf.convert_to_tensor(batch_high, dtype=tf.float32),
+            )
+        )
+        return np.asarray(probability)
+
+
+class TfFunctionInferenceEngine(InferenceEngine):
+    """
+    Model call traced once into a graph with fixed input signature
+
+    The uint8 -> float32 conversion happens inside the graph and the batch
+    dimension is left open, so batches of any size reuse the same trace.
+    """
+
+    def __init__(self, probability_model) -> None:
+        super().__init__(probability_model)
+        signature = [
+            tf.TensorSpec(shape=(None,) + crop_shape, dtype=tf.uint8),
+            tf.TensorSpec(shape=(None,) + crop_shape, dtype=tf.uint8),
+        ]
+        self.predict_fn = tf.function(self.call_model, input_signature=signature)
+
+    def call_model(self, batch_low, batch_high):
+        return self.probability_model(
+            self.model_input(
+                tf.cast(batch_low, tf.float32), tf.cast(batch_high, tf.float32)
+            ),
+            training=False,
+        )
+
+    def predict(self, batch_low, batch_high):
+        return self.predict_fn(
+            tf.convert_to_tensor(batch_low), tf.convert_to_tensor(batch_high)
+        ).numpy()
+
+
+class TfLiteInferenceEngine(InferenceEngine):
+    """
+    Model exported to a TFLite flatbuffer (see tflite_export), optionally quantized
+
+    Runs on the TFLite CPU kernels with num_threads interpreter threads. The
+    interpreter is not thread-safe, predict() is called from the classification
+    thread only. Input tensors are resized when the batch size changes.
+    """
+
+    def __init__(self, model_fp, num_threads=None) -> None:
+        super().__init__(None)
+        self.interpreter = tf.lite.Interpreter(
+            model_path=str(model_fp), num_threads=num_threads
+        )
+
+        # inputs matched by name (order in the flatbuffer is not guaranteed), single
+        # input models get the low crop only
+        input_detail_list = self.interpreter.get_input_details()
+        self.input_count = len(input_detail_list)
+        if self.input_count == 1:
+            self.input_index_low = input_detail_list[0]["index"]
+            self.input_index_high = None
+        else:
+            self.input_index_low = TfLiteInferenceEngine.input_index(
+                input_detail_list, "low"
+            )
+            self.input_index_high = TfLiteInferenceEngine.input_index(
+                input_detail_list, "high"
+            )
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.batch_size = None
+
+    @staticmethod
+    def input_index(input_detail_list, name):
+        matching_list = [d for d in input_detail_list if name in d["name"]]
+        if len(matching_list) != 1:
+            raise Exception(
+                f'TFLite model has no unique "{name}" input: '
+                f'{",".join(d["name"] for d in input_detail_list)}'
+            )
+        return matching_list[0]["index"]
+
+    def predict(self, batch_low, batch_high):
+        batch_size = batch_low.shape[0]
+        input_list = [(self.input_index_low, batch_low)]
+        if self.input_index_high is not None:
+            input_list.append((self.input_index_high, batch_high))
+
+        if batch_size != self.batch_size:
+            for index, _ in input_list:
+                self.interpreter.resize_tensor_input(
+                    index, (batch_size,) + crop_shape, strict=False
+                )
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch_size
+
+        for index, batch in input_list:
+            self.interpreter.set_tensor(index, batch.astype(np.uint8))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).astype(np.float32)
+
+
+inference_engine_class_map = {
+    "keras": KerasInferenceEngine,
+    "tf_function": TfFunctionInferenceEngine,
+}
+
+
+def create_inference_engine(name: str, probability_model) -> InferenceEngine:
+    if name not in inference_engine_class_map:
+        raise Exception(
+            f'Inference engine "{name}" not in list {",".join(inference_engine_class_map)}'
+        )
+    return inference_engine_class_map[name](probability_model)
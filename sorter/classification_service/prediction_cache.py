@@ -0,0 +1,138 @@
+import json
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+
+
+class PredictionCache:
+    """
+    Class probabilities of already classified images, persisted in sqlite
+
+    Keyed by image content hash and model hash, i.e. a new model never sees results
+    of an old one. Least recently used entries are evicted above max_entry_count.
+
+    Hits only update the access time in memory, written in one transaction every
+    flush_hit_count hits, before evicting (put) and on close, i.e. cache hits
+    don't commit.
+    """
+
+    def __init__(self, db_fp, max_entry_count=100000, flush_hit_count=100) -> None:
+        self.db_fp = pathlib.Path(db_fp)
+        self.max_entry_count = max_entry_count
+        self.flush_hit_count = flush_hit_count
+        self.last_used_dict = {}  # (image hash, model hash) -> time, not written yet
+        self.db_fp.parent.mkdir(parents=True, exist_ok=True)
+
+        # used from the classification thread and callers of Classifier.predict
+        self.mutex = threading.Lock()
+        self.connection = sqlite3.connect(str(self.db_fp), check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS prediction ("
+            " image_hash TEXT NOT NULL,"
+            " model_hash TEXT NOT NULL,"
+            " probability_list TEXT NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (image_hash, model_hash))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS prediction_last_used ON prediction(last_used)"
+        )
+        self.connection.commit()
+
+        # statistics
+        self.count_hit = 0
+        self.count_miss = 0
+
+    def get(self, image_hash, model_hash):
+        """
+        Probability list of a previous prediction, None if not cached
+        """
+        self.mutex.acquire()
+        try:
+            row = self.connection.execute(
+                "SELECT probability_list FROM prediction"
+                " WHERE image_hash = ? AND model_hash = ?",
+                (image_hash, model_hash),
+            ).fetchone()
+            if row is None:
+                self.count_miss += 1
+                return None
+            self.count_hit += 1
+            self.last_used_dict[(image_hash, model_hash)] = time.time()
+            if len(self.last_used_dict) >= self.flush_hit_count:
+                self.flush()
+                self.connection.commit()
+            return json.loads(row[0])
+        finally:
+            self.mutex.release()
+
+    def put(self, image_hash, model_hash, probability_list):
+        self.mutex.acquire()
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO prediction VALUES (?, ?, ?, ?)",
+                (image_hash, model_hash, json.dumps(probability_list), time.time()),
+            )
+            self.last_used_dict.pop((image_hash, model_hash), None)
+            self.flush()
+            self.evict()
+            self.connection.commit()
+        finally:
+            self.mutex.release()
+
+    def flush(self):
+        """
+        Access times of hits to the db, committed by the caller (mutex held)
+        """
+        if len(self.last_used_dict) == 0:
+            return
+        self.connection.executemany(
+            "UPDATE prediction SET last_used = ? WHERE image_hash = ? AND model_hash = ?",
+            [
+                (last_used, image_hash, model_hash)
+                for (image_hash, model_hash), last_used in self.last_used_dict.items()
+            ],
+        )
+        self.last_used_dict = {}
+
+    def evict(self):
+        """
+        Remove least recently used entries above max_entry_count (mutex held)
+        """
+        entry_count = self.connection.execute(
+            "SELECT COUNT(*) FROM prediction"
+        ).fetchone()[0]
+        if entry_count <= self.max_entry_count:
+            return
+        self.connection.execute(
+            "DELETE FROM prediction WHERE rowid IN ("
+            " SELECT rowid FROM prediction ORDER BY last_used LIMIT ?)",
+            (entry_count - self.max_entry_count,),
+        )
+        logging.info(
+            f"Prediction cache: evicted {entry_count - self.max_entry_count} entries"
+        )
+
+    def __len__(self):
+        self.mutex.acquire()
+        entry_count = self.connection.execute(
+            "SELECT COUNT(*) FROM prediction"
+        ).fetchone()[0]
+        self.mutex.release()
+        return entry_count
+
+    def close(self):
+        self.mutex.acquire()
+        self.flush()
+        self.connection.commit()
+        self.connection.close()
+        self.mutex.release()
+
+    def get_statistics(self):
+        return {
+            "count_hit": self.count_hit,
+            "count_miss": self.count_miss,
+            "entry_count": len(self),
+        }
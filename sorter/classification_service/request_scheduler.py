@@ -0,0 +1,88 @@
+import enum
+import heapq
+import itertools
+import time
+
+
+class SchedulingPolicy(enum.Enum):
+    LIFO = 0  # newest first (former behaviour)
+    FIFO = 1  # oldest first
+    EDF = 2  # earliest deadline first
+
+
+class RequestScheduler:
+    """
+    Queue of classification requests, timestamped on arrival
+
+    Requests past their deadline are not served anymore but handed back separately
+    by take(), e.g. to answer them right away with "skip" - the part already passed
+    the slide. Not thread-safe, guarded by the caller's queue mutex.
+    """
+
+    def __init__(self, policy=SchedulingPolicy.FIFO, deadline_sec=None) -> None:
+        self.policy = policy
+        self.deadline_sec = deadline_sec  # None: requests never expire
+        self.heap = []  # (key, sequence, item)
+        self.sequence = itertools.count()
+
+        # statistics
+        self.max_depth = 0
+        self.count_served = 0
+        self.count_missed_deadline = 0
+        self.total_wait_sec = 0.0
+        self.max_wait_sec = 0.0
+
+    def add(self, item, budget_sec=None):
+        """
+        Enqueue item, budget_sec overrides the default deadline for this request
+        """
+        dt_now = time.monotonic()
+        item.dt_enqueued = dt_now
+        budget_sec = budget_sec if budget_sec is not None else self.deadline_sec
+        item.dt_deadline = dt_now + budget_sec if budget_sec is not None else None
+
+        sequence = next(self.sequence)
+        if self.policy == SchedulingPolicy.LIFO:
+            key = -sequence
+        elif self.policy == SchedulingPolicy.FIFO:
+            key = sequence
+        else:
+            key = item.dt_deadline if item.dt_deadline is not None else float("inf")
+        heapq.heappush(self.heap, (key, sequence, item))
+        self.max_depth = max(self.max_depth, len(self.heap))
+
+    def take(self, max_count=1):
+        """
+        Next requests to serve (up to max_count) and all expired requests found
+        before them
+        """
+        item_list = []
+        expired_list = []
+        dt_now = time.monotonic()
+        while len(self.heap) > 0 and len(item_list) < max_count:
+            _, _, item = heapq.heappop(self.heap)
+            wait_sec = dt_now - item.dt_enqueued
+            self.total_wait_sec += wait_sec
+            self.max_wait_sec = max(self.max_wait_sec, wait_sec)
+            if item.dt_deadline is not None and dt_now > item.dt_deadline:
+                self.count_missed_deadline += 1
+                expired_list.append(item)
+            else:
+                self.count_served += 1
+                item_list.append(item)
+        return item_list, expired_list
+
+    def __len__(self):
+        return len(self.heap)
+
+    def get_statistics(self):
+        count_taken = self.count_served + self.count_missed_deadline
+        return {
+            "queue_depth": len(self.heap),
+            "queue_max_depth": self.max_depth,
+            "average_wait_ms": (
+                1000.0 * self.total_wait_sec / count_taken if count_taken > 0 else 0.0
+            ),
+            "max_wait_ms": 1000.0 * self.max_wait_sec,
+            "count_missed_deadline": self.count_missed_deadline,
+        }
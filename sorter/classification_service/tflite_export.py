@@ -0,0 +1,124 @@
+import itertools
+import json
+import logging
+import pathlib
+
+import numpy as np
+import tensorflow as tf
+
+import sorter.classification_service.bulk_evaluation
+import sorter.classification_service.classifier
+import sorter.classification_service.evaluation_report
+import sorter.classification_service.inference_engine
+import sorter.util.file_hash
+
+quantization_list = ["none", "dynamic", "int8"]
+
+
+def calibration_dataset_fn(folder_list, count):
+    """
+    Representative dataset for int8 quantization: crop pairs of up to count part
+    images below the folders, same preprocessing as for classification
+    """
+
+    def representative_dataset():
+        sample_iter = (
+            sorter.classification_service.evaluation_report.list_labeled_images(
+                folder_list
+            )
+        )
+        used_count = 0
+        for fp, _ in itertools.islice(sample_iter, count):
+            low, high, valid = (
+                sorter.classification_service.bulk_evaluation.load_crop_pair(
+                    bytes(fp, "utf-8")
+                )
+            )
+            if valid:
+                used_count += 1
+                yield [low[np.newaxis], high[np.newaxis]]
+        logging.info(f"Calibrated with {used_count} images")
+
+    return representative_dataset
+
+
+def export_tflite(
+    model_fp,
+    output_fp=None,
+    quantization="none",
+    calibration_folder_list=None,
+    calibration_count=200,
+):
+    """
+    Convert .keras model (with softmax) to .tflite and write the json next to it
+
+    The json keeps label_name_list, model_hash is the hash of the .tflite (checked
+    by the Classifier) and source_model_hash the one of the .keras model.
+    """
+    if quantization not in quantization_list:
+        raise Exception(
+            f'Quantization "{quantization}" not in list {",".join(quantization_list)}'
+        )
+    if quantization == "int8" and not calibration_folder_list:
+        raise Exception("int8 quantization requires calibration images")
+
+    model_fp = pathlib.Path(model_fp)
+    output_fp = (
+        pathlib.Path(output_fp)
+        if output_fp is not None
+        else model_fp.with_name(f"{model_fp.stem}_{quantization}.tflite")
+    )
+    if output_fp.with_suffix(".json") == model_fp.with_suffix(".json"):
+        raise Exception(f"{output_fp} would overwrite the json of {model_fp}")
+    with open(model_fp.with_suffix(".json")) as json_file:
+        json_data = json.load(json_file)
+
+    # same graph as the tf_function engine: uint8 input, cast inside
+    probability_model = (
+        sorter.classification_service.classifier.Classifier.load_probability_model(
+            model_fp
+        )
+    )
+    crop_shape = sorter.classification_service.inference_engine.crop_shape
+
+    @tf.function(
+        input_signature=[
+            tf.TensorSpec(shape=(None,) + crop_shape, dtype=tf.uint8, name="low"),
+            tf.TensorSpec(shape=(None,) + crop_shape, dtype=tf.uint8, name="high"),
+        ]
+    )
+    def probability_fn(low, high):
+        low, high = tf.cast(low, tf.float32), tf.cast(high, tf.float32)
+        return probability_model(
+            (low, high) if len(probability_model.inputs) == 2 else low, training=False
+        )
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [probability_fn.get_concrete_function()], probability_model
+    )
+    if quantization in ["dynamic", "int8"]:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "int8":
+        converter.representative_dataset = calibration_dataset_fn(
+            calibration_folder_list, calibration_count
+        )
+        # int8 kernels where available, float fallback for the rest
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+        ]
+
+    logging.info(f"Converting {model_fp} (quantization: {quantization}) ...")
+    with open(output_fp, "wb") as f:
+        f.write(converter.convert())
+
+    json_data["source_model_hash"] = json_data["model_hash"]
+    json_data["model_hash"] = sorter.util.file_hash.file_hash(output_fp)
+    json_data["quantization"] = quantization
+    with open(output_fp.with_suffix(".json"), "w") as json_file:
+        json.dump(json_data, json_file, indent=2)
+    logging.info(
+        f"Wrote {output_fp} ({output_fp.stat().st_size / 1e6:.1f} MB, "
+        f"keras: {model_fp.stat().st_size / 1e6:.1f} MB)"
+    )
+    return output_fp
@@ -4,8 +4,11 @@ import logging
 import threading
 import time
 
+import sorter.classification_service.classification_result_codec as crc
 import sorter.controller.gpio_controller
 import sorter.controller.machine_state
+import sorter.network.async_tcp_server
+import sorter.network.send_queue
 import sorter.network.tcp_server
 
 
@@ -20,8 +23,25 @@ class StorageState(enum.Enum):
     RUNNING = 1
 
 
+# message types forwarded to clients not subscribing in their HLO (sub=), by name
+default_subscription_dict = {
+    "VisionService": [b"CLR", b"CSS", b"HMV"],
+    "SerialService": [b"CLR"],
+    "NotificationService": [b"NTF"],
+}
+
+
 class MachineController:
-    def __init__(self, enable_device, enable_belt, disable_server, enable_vf):
+    def __init__(
+        self,
+        enable_device,
+        enable_belt,
+        disable_server,
+        enable_vf,
+        async_server=False,
+        send_queue_max_count=100000,
+        send_overflow_policy=sorter.network.send_queue.SendOverflowPolicy.DROP_OLDEST,
+    ):
         # back-ref for command handler to this
         MachineControllerCommandHandler.machine_controller = self
 
@@ -38,10 +58,21 @@ class MachineController:
         self.enable_belt = enable_belt
         self.enable_vf = enable_vf
 
-        # network
+        # network: thread per connection or all connections in one asyncio loop
         if not self.disable_server:
-            self.tcp_server = sorter.network.tcp_server.TcpServer(
-                "0.0.0.0", 5005, MachineControllerCommandHandler
+            server_class = (
+                sorter.network.async_tcp_server.AsyncTcpServer
+                if async_server
+                else sorter.network.tcp_server.TcpServer
+            )
+            # slow clients (e.g. notification service playing a sound) only fill
+            # their own send queue, the control thread never waits for them
+            self.tcp_server = server_class(
+                "0.0.0.0",
+                5005,
+                MachineControllerCommandHandler,
+                send_queue_max_count=send_queue_max_count,
+                send_overflow_policy=send_overflow_policy,
             )
             self.tcp_server.start()
             time.sleep(1)
@@ -151,14 +182,14 @@ class MachineController:
             # hour meter value
             v = self.state.get_hour_meter_value()
 
-            # tcp connection to vision
-            handler = self.tcp_server.get_handler_by_name("VisionService")
-            if handler is not None:
-                handler.sendall(b"HMV %f" % v)
+            # subscribers, e.g. vision
+            self.tcp_server.subscription_table.publish(b"HMV", b"HMV %f" % v)
 
 
 class MachineControllerCommandHandler(sorter.network.tcp_server.RequestHandler):
     def __init__(self, request, client_address, server) -> None:
+        self.clr_codec = crc.ClassificationResultCodec()
+        self.clr_mutex = threading.Lock()
         super().__init__(request, client_address, server)
 
     def process_custom_command(self, message):
@@ -187,57 +218,125 @@ class MachineControllerCommandHandler(sorter.network.tcp_server.RequestHandler):
         elif command == b"CLF":
             # b'CLF image_34053485.png'
             logging.info('Received command CLF: "%s"' % message)
-            cs = self.tcp_server.get_handler_by_name("ClassificationService")
-            if cs is None:
+            object_id = int(str(message, "utf-8").split(" ")[1])
+
+            # fwd message to the least busy classification service of the pool
+            pool = self.tcp_server.get_worker_pool("ClassificationService")
+            if not pool.dispatch(object_id, message):
                 logging.warning(
                     "Received CLF request but ClassificationService not connected"
                 )
 
-            else:
-                # fwd message
-                cs.sendall(message)
-
-        # CLR - Classification Result (fwd to vision service)
-        elif command == b"CLR":
-            # b'CLF image_34053485.png'
-            logging.info('Received command CLR: "%s"' % message)
-
-            # sorter servo
+        # CLR/CLB - Classification Result, text or binary (fwd to subscribers)
+        # CLL - Class list, binary results of this connection refer to
+        elif command in [b"CLR", b"CLB", b"CLL"]:
+            # b'CLR 5 plate1x 0.98 ...'
+            logging.info('Received command %s: "%s"' % (command, message))
+            self.process_classification_result(message)
+
+        # CSS - Classification Service State (fwd to subscribers)
+        elif command == b"CSS":
+            # b'CSS loading'
+            logging.info('Received command CSS: "%s"' % message)
+            self.tcp_server.subscription_table.publish(command, message)
+
+        # STA - Statistics Request (fwd to target with name of requester)
+        elif command == b"STA":
+            # b'STA ClassificationService'
+            logging.info('Received command STA: "%s"' % message)
+            target = str(message, "utf-8").split(" ")[1]
+            worker_list = self.tcp_server.get_worker_pool(target).get_worker_list()
+            if len(worker_list) == 0:
+                logging.warning(f"Received STA request but {target} not connected")
+            for handler in worker_list:
+                handler.sendall(b"STA %s" % bytes(self.name, "utf-8"))
+
+        # RLD - Reload model (fwd to all services of the target pool)
+        elif command == b"RLD":
+            # b'RLD ClassificationService models/new.keras'
+            logging.info('Received command RLD: "%s"' % message)
             part_list = str(message, "utf-8").split(" ")
-            self.machine_controller.event_classification_result(
-                predicted_class=part_list[2]
-            )
-
-            # fwd to vision
-            ns = self.tcp_server.get_handler_by_name("VisionService")
-            if ns is None:
-                logging.warning("Received CLF request but VisionService not connected")
-
-            else:
-                # fwd message
-                ns.sendall(message)
-
-            # fwd to serial
-            ss = self.tcp_server.get_handler_by_name("SerialService")
-            if ss is not None:
-                ss.sendall(message)
-
-        # NTF - Notification (fwd to notification service)
+            target = part_list[1]
+            worker_list = self.tcp_server.get_worker_pool(target).get_worker_list()
+            if len(worker_list) == 0:
+                logging.warning(f"Received RLD request but {target} not connected")
+            for handler in worker_list:
+                handler.sendall(b"RLD %s" % bytes(part_list[2], "utf-8"))
+
+        # STR - Statistics Result (fwd to requester)
+        elif command == b"STR":
+            # b'STR StatsClient {"name": ...}'
+            logging.info('Received command STR: "%s"' % message)
+            requester = str(message, "utf-8").split(" ")[1]
+            rh = self.tcp_server.get_handler_by_name(requester)
+            if rh is not None:
+                rh.sendall(message)
+
+        # NTF - Notification (fwd to subscribers)
         elif command == b"NTF":
             # b'NTF image_34053485.png'
             logging.info('Received command NTF: "%s"' % message)
-            ns = self.tcp_server.get_handler_by_name("NotificationService")
-            if ns is None:
+            if self.tcp_server.subscription_table.publish(command, message) == 0:
                 logging.warning("Received NTF but NotificationService not connected")
 
-            else:
-                # fwd message
-                ns.sendall(message)
-
         else:
             raise Exception("Received unsupported command: " "%s" "" % command)
 
+    def process_classification_result(self, message):
+        # text results are only decoded completely if re-encoded for a binary client
+        result = None
+        if message[:3] == b"CLR":
+            part_list = str(message, "utf-8").split(" ")
+            object_id = int(part_list[1])
+            predicted_class = part_list[2]
+        else:
+            result = self.clr_codec.decode(message)
+            if result is None:
+                return
+            object_id = result.object_id
+            predicted_class = result.predicted_class
+
+        # sorter servo
+        self.tcp_server.get_worker_pool("ClassificationService").complete(object_id)
+        self.machine_controller.event_classification_result(
+            predicted_class=predicted_class
+        )
+
+        # fwd to subscribers (e.g. vision and serial), in the format of their connection
+        subscription_table = self.tcp_server.subscription_table
+        subscriber_list = subscription_table.get_subscriber_list(b"CLR")
+        if len(subscriber_list) == 0:
+            logging.warning("Received CLR but no subscriber connected")
+        subscription_table.count_published(b"CLR")
+        for handler in subscriber_list:
+            if result is None and not handler.clr_codec.binary:
+                handler.sendall(message, droppable=False)
+                continue
+            if result is None:
+                result = self.clr_codec.decode(message)
+            handler.send_classification_result(result)
+
+    def send_classification_result(self, result: crc.ClassificationResultMessage):
+        """
+        Class list (if new to the client) and result, not interleaved with results
+        sent by other handler threads
+
+        Never dropped on overflow: results would be lost, and results following a
+        dropped class list could not be decoded.
+        """
+        self.clr_mutex.acquire()
+        try:
+            for msg in self.clr_codec.encode(result):
+                self.sendall(msg, droppable=False)
+        finally:
+            self.clr_mutex.release()
+
+    def get_default_subscription_list(self):
+        return default_subscription_dict.get(self.name, [])
+
     def event_client_hello(self):
+        # CLR format of this connection
+        self.clr_codec = crc.ClassificationResultCodec(self.get_binary_version())
         self.machine_controller.event_client_hello(self.name)
 
     def event_client_disconnected(self):
@@ -1,7 +1,8 @@
 import logging
 import time
 
-import sorter.classification_service.classification_service
+import sorter.classification_service.classification_result_codec as crc
+import sorter.network.tcp_client
 import sorter.network.tcp_server
 
 
@@ -18,36 +19,22 @@ class CSCTcpClient(sorter.network.tcp_client.TcpClient):
         self.client: ClassificationServiceClient = client
 
     def event_msg_received(self, msg):
-        part_list = str(msg, "utf-8").split(" ")
-
         try:
-            # classification result
-            if part_list[0] == "CLR":
-                object_id = int(part_list[1])
-                predicted_class = part_list[2]
-                probability = float(part_list[3])
-                uniqueness = float(part_list[4])
-                average_process_time_sec = float(part_list[5])
-                pred_low_serialized = part_list[6]
-                pred_high_serialized = part_list[7]
-                pred_low_list = sorter.classification_service.classification_service.ClassificationService.deserialize(
-                    pred_low_serialized
-                )
-                pred_high_list = sorter.classification_service.classification_service.ClassificationService.deserialize(
-                    pred_high_serialized
-                )
+            # classification result, text protocol (no binary negotiated)
+            if msg[:3] == b"CLR":
+                m = crc.decode_text(msg)
                 logging.info(
-                    f"Received classification result - id: {object_id} pc: {predicted_class}"
+                    f"Received classification result - id: {m.object_id} pc: {m.predicted_class}"
                     " prob: {probability*100:.0f}% uniqueness: {uniqueness:.0f}"
                 )
                 self.client.receive_classification_result(
-                    object_id,
-                    predicted_class,
-                    probability,
-                    uniqueness,
-                    average_process_time_sec,
-                    pred_low_list,
-                    pred_high_list,
+                    m.object_id,
+                    m.predicted_class,
+                    m.probability,
+                    m.uniqueness,
+                    m.average_process_time_sec,
+                    m.low_list,
+                    m.high_list,
                 )
 
         except ValueError:
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import threading
+import types
+
+import sorter.network.subscription_table
+import sorter.network.tcp_server
+
+
+class AsyncConnection(asyncio.BufferedProtocol):
+    """
+    One client connection of the AsyncTcpServer, passed to the RequestHandler as its
+    request (providing schedule_flush() and close() instead of a socket)
+
+    Data is received directly into the handler's MessageFramer. Messages to send
+    stay in the handler's bounded send queue while the transport asks to pause
+    writing (client not reading), other clients are not held up.
+    """
+
+    def __init__(self, tcp_server) -> None:
+        self.tcp_server = tcp_server
+        self.loop = tcp_server.loop
+        self.transport = None
+        self.handler = None
+        self.write_paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.handler = self.tcp_server.server_command_handler_class(
+            self, transport.get_extra_info("peername"), self.tcp_server.handler_server
+        )
+        self.tcp_server.client_connected(self.handler)
+        self.handler.event_client_connected()
+
+    def get_buffer(self, sizehint):
+        return self.handler.framer.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self.handler.framer.buffer_updated(nbytes)
+        try:
+            for msg in self.handler.framer.messages():
+                self.handler.process_message(msg)
+                if self.transport.is_closing():
+                    break
+        except Exception:
+            logging.exception(
+                f'Server: Processing message of "{self.handler.get_name()}" failed, '
+                "closing connection"
+            )
+            self.transport.abort()
+
+    def eof_received(self):
+        return False  # close the transport
+
+    def connection_lost(self, exc):
+        self.handler.send_queue.close()
+        self.handler.stopped = True
+        # removed by the server (stop, duplicate name): no disconnect events
+        if not self.handler.stop_requested:
+            self.tcp_server.client_disconnected(self.handler)
+            self.handler.event_client_disconnected()
+        logging.info("Request handler stopped.")
+
+    def pause_writing(self):
+        self.write_paused = True
+
+    def resume_writing(self):
+        self.write_paused = False
+        self.flush()
+
+    def schedule_flush(self):
+        if threading.get_ident() == self.tcp_server.loop_thread_id:
+            self.flush()
+        else:
+            self.loop.call_soon_threadsafe(self.flush)
+
+    def flush(self):
+        if self.write_paused or self.transport.is_closing():
+            return
+        data_list = self.handler.send_queue.get_all(block=False)
+        if len(data_list) > 0:
+            self.transport.writelines(data_list)
+
+    def close(self):
+        """
+        Close connection, callable from any thread
+        """
+        if threading.get_ident() == self.tcp_server.loop_thread_id:
+            self.transport.abort()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.abort)
+
+
+class AsyncTcpServer(sorter.network.tcp_server.TcpServer):
+    """
+    TcpServer serving all connections by an asyncio event loop in a single thread,
+    same interface and RequestHandler callbacks as sorter.network.tcp_server.TcpServer
+
+    Callbacks of the handlers (process_custom_command(), event_client_hello(), ...)
+    run in the event loop thread and must not block. Handlers are found by name
+    in O(1), stopping closes all connections immediately (no receive timeouts).
+    """
+
+    def __init__(self, host, port, server_command_handler_class, **kwargs):
+        super().__init__(host, port, server_command_handler_class, **kwargs)
+        self.loop = None
+        self.loop_thread_id = None
+        self.started_event = threading.Event()
+        # handler_list is replaced on change, iterating it needs no lock
+        self.handler_mutex = threading.Lock()
+        self.handler_by_name_dict = {}
+        self.event_loop_driven = True
+
+        # RequestHandlers find the server as server.tcp_server
+        self.handler_server = types.SimpleNamespace(tcp_server=self)
+
+    def start(self):
+        """
+        Returns once the server is listening
+        """
+        self.started_event.clear()
+        self.server_thread = threading.Thread(target=self.server_fct)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.server_thread.name = "TCPServingThread"
+        self.started_event.wait()
+        if self.server_socket is None:
+            raise Exception(f"Server: Could not listen on {self.host}:{self.port}")
+
+    def stop(self):
+        logging.info("Server: Stop requested")
+        self.loop.call_soon_threadsafe(self.shutdown)
+        self.server_thread.join()
+
+    def shutdown(self):
+        self.server_socket.close()
+        for handler in self.handler_list:
+            handler.request_stop()
+            handler.request.transport.abort()
+        self.loop.stop()
+
+    def server_fct(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.server_socket = None
+        try:
+            self.server_socket = self.loop.run_until_complete(
+                self.loop.create_server(
+                    lambda: AsyncConnection(self),
+                    self.host,
+                    self.port,
+                    reuse_address=True,
+                )
+            )
+        except OSError as e:
+            logging.error(f"Server: {e}")
+            self.loop.close()
+            self.started_event.set()
+            return
+        logging.info("Server: Thread running")
+        self.started_event.set()
+        self.loop.run_forever()
+
+        # connection_lost() callbacks of the aborted connections
+        self.loop.run_until_complete(self.server_socket.wait_closed())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        self.handler_list = []
+        self.handler_by_name_dict = {}
+        self.subscription_table = sorter.network.subscription_table.SubscriptionTable()
+        logging.info("Server: Thread stopped")
+
+    def broadcast(self, message):
+        for handler in self.handler_list:
+            handler.sendall(message)
+
+    def client_connected(self, handler):
+        logging.info("Server: Client connected")
+        self.handler_mutex.acquire()
+        self.handler_list = self.handler_list + [handler]
+        self.handler_mutex.release()
+
+    def client_identified(self, handler):
+        self.handler_mutex.acquire()
+        self.handler_by_name_dict[handler.get_name()] = handler
+        self.handler_mutex.release()
+
+    def client_disconnected(self, handler):
+        logging.info("Server: Client disconnected")
+        self.unregister(handler)
+        self.worker_disconnected(handler)
+
+    def unregister(self, handler):
+        self.handler_mutex.acquire()
+        self.handler_list = [h for h in self.handler_list if h is not handler]
+        if self.handler_by_name_dict.get(handler.get_name()) is handler:
+            del self.handler_by_name_dict[handler.get_name()]
+        self.handler_mutex.release()
+        self.subscription_table.unsubscribe(handler)
+
+    def get_handler_by_name(self, name):
+        return self.handler_by_name_dict.get(name)
+
+    def remove_client(self, handler):
+        handler.request_stop()
+        self.unregister(handler)
+        self.worker_disconnected(handler)
+        handler.request.close()
@@ -0,0 +1,158 @@
+import enum
+import struct
+
+# length prefix, unsigned 32 bit big endian
+length_prefix_struct = struct.Struct("!I")
+
+
+class Framing(enum.Enum):
+    LINE = 0  # message followed by b"\n" (text protocol)
+    LENGTH_PREFIXED = 1  # 4 byte length before the message (any bytes, e.g. binary)
+
+
+def frame_message(msg: bytes, framing: Framing = Framing.LINE) -> bytes:
+    """
+    Message as sent on the stream
+    """
+    if framing == Framing.LINE:
+        return msg + b"\n"
+    return length_prefix_struct.pack(len(msg)) + msg
+
+
+class MessageFramer:
+    """
+    Splits a TCP byte stream into messages, independent of how the stream was cut
+    into segments by the network (messages split over or merged into receives)
+
+    Data is received with recv_into directly into a growable buffer, there is no
+    concatenation of received chunks. Consumed messages are dropped from the buffer
+    by moving the incomplete rest to the front once per receive.
+    """
+
+    def __init__(
+        self,
+        framing: Framing = Framing.LINE,
+        initial_size=4096,
+        max_message_size=16 * 1024 * 1024,
+    ) -> None:
+        self.framing = framing
+        self.max_message_size = max_message_size
+        self.buffer = bytearray(initial_size)
+        self.start = 0  # first byte not consumed yet
+        self.end = 0  # end of received data
+        self.scan_start = 0  # line framing: no newline before this index
+
+        # statistics
+        self.count_message = 0
+        self.count_recv = 0
+        self.max_buffer_size = initial_size
+
+    def recv_from(self, sock) -> int:
+        """
+        Receive available data of the socket into the buffer, returns the number of
+        bytes received (0 = connection closed), socket exceptions are passed on
+        """
+        with self.get_buffer() as view:
+            received_count = sock.recv_into(view)
+        self.buffer_updated(received_count)
+        return received_count
+
+    def get_buffer(self) -> memoryview:
+        """
+        Free part of the buffer to receive into (e.g. asyncio.BufferedProtocol), to
+        be released before the next call, followed by buffer_updated()
+        """
+        self.compact()
+        if self.end == len(self.buffer):
+            self.grow()
+        return memoryview(self.buffer)[self.end :]
+
+    def buffer_updated(self, received_count):
+        self.end += received_count
+        self.count_recv += 1
+
+    def feed(self, data: bytes):
+        """
+        Append data received otherwise (e.g. tests or non-socket transports)
+        """
+        self.compact()
+        while len(self.buffer) - self.end < len(data):
+            self.grow()
+        self.buffer[self.end : self.end + len(data)] = data
+        self.end += len(data)
+
+    def compact(self):
+        """
+        Move the incomplete message to the front of the buffer
+        """
+        if self.start == 0:
+            return
+        rest_count = self.end - self.start
+        self.buffer[:rest_count] = self.buffer[self.start : self.end]
+        self.scan_start -= self.start
+        self.start = 0
+        self.end = rest_count
+
+    def grow(self):
+        if len(self.buffer) >= self.max_message_size + length_prefix_struct.size:
+            raise Exception(
+                f"MessageFramer: Message exceeds {self.max_message_size} bytes"
+            )
+        self.buffer.extend(bytes(len(self.buffer)))
+        self.max_buffer_size = len(self.buffer)
+
+    def messages(self):
+        """
+        Complete messages received so far (generator, w/o framing)
+        """
+        while True:
+            msg = self.next_message()
+            if msg is None:
+                return
+            self.count_message += 1
+            yield msg
+
+    def next_message(self):
+        if self.framing == Framing.LINE:
+            index = self.buffer.find(b"\n", max(self.start, self.scan_start), self.end)
+            if index < 0:
+                self.scan_start = self.end
+                if self.end - self.start > self.max_message_size:
+                    raise Exception(
+                        f"MessageFramer: Message exceeds {self.max_message_size} bytes"
+                    )
+                return None
+            msg = self.copy_message(self.start, index)
+            self.start = index + 1
+            self.scan_start = self.start
+            return msg
+
+        if self.end - self.start < length_prefix_struct.size:
+            return None
+        (length,) = length_prefix_struct.unpack_from(self.buffer, self.start)
+        if length > self.max_message_size:
+            raise Exception(
+                f"MessageFramer: Message of {length} bytes exceeds "
+                f"{self.max_message_size} bytes"
+            )
+        msg_start = self.start + length_prefix_struct.size
+        if self.end - msg_start < length:
+            return None
+        msg = self.copy_message(msg_start, msg_start + length)
+        self.start = msg_start + length
+        return msg
+
+    def copy_message(self, start, end) -> bytes:
+        """
+        Message handed out as bytes, the only copy of the received data
+        """
+        with memoryview(self.buffer) as view:
+            return bytes(view[start:end])
+
+    def get_statistics(self):
+        return {
+            "count_message": self.count_message,
+            "count_recv": self.count_recv,
+            "buffered": self.end - self.start,
+            "max_buffer_size": self.max_buffer_size,
+        }
@@ -0,0 +1,186 @@
+import collections
+import enum
+import threading
+
+
+class SendOverflowPolicy(enum.Enum):
+    DROP_OLDEST = 0  # oldest queued messages are discarded to make room
+    DROP_NEWEST = 1  # message to be sent is discarded
+    DISCONNECT = 2  # client is disconnected, it can reconnect and start over
+
+
+class SendQueue:
+    """
+    Bounded outbound queue of one client connection (framed messages)
+
+    Senders never wait for the client, a slow or stuck client only fills its own
+    queue until the overflow policy applies. The limits are meant for clients that
+    stopped reading, bursts of a healthy client fit. The queue is drained by a
+    writer thread (get_all() blocking) or an event loop (get_all(block=False)).
+
+    Messages queued as not droppable (e.g. classification results, class lists
+    binary results refer to) are never discarded by the policy. If they do not fit
+    the client is disconnected, on reconnect it starts over with a consistent
+    state.
+    """
+
+    def __init__(
+        self,
+        max_count=100000,
+        max_bytes=64 * 1024 * 1024,
+        overflow_policy=SendOverflowPolicy.DROP_OLDEST,
+    ) -> None:
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+
+        self.mutex = threading.Lock()
+        self.condition = threading.Condition(self.mutex)
+        self.items = collections.deque()  # (data, droppable)
+        self.queued_bytes = 0
+        self.closed = False
+        self.overflowed = False  # client to be disconnected, queue closed
+        self.overflow_claimed = False
+
+        # statistics
+        self.count_sent = 0
+        self.bytes_sent = 0
+        self.count_dropped = 0
+        self.bytes_dropped = 0
+        self.max_queued_bytes = 0
+
+    def is_full(self, data) -> bool:
+        return (
+            len(self.items) >= self.max_count
+            or self.queued_bytes + len(data) > self.max_bytes
+        )
+
+    def put(self, data: bytes, droppable=True) -> bool:
+        """
+        Queue data, returns False if it was dropped (overflow) or the queue is closed
+        """
+        added = False
+        self.mutex.acquire()
+
+        if self.closed:
+            pass
+        elif (
+            self.is_full(data) and self.overflow_policy == SendOverflowPolicy.DISCONNECT
+        ):
+            self.disconnect(data)
+        else:
+            # room made by dropping older droppable messages, w/ DROP_OLDEST or for a
+            # message that must not be dropped (a message larger than the queue does
+            # not push out the others)
+            if (
+                self.overflow_policy == SendOverflowPolicy.DROP_OLDEST or not droppable
+            ) and len(data) <= self.max_bytes:
+                self.drop_oldest(data)
+
+            if not self.is_full(data):
+                self.items.append((data, droppable))
+                self.queued_bytes += len(data)
+                self.max_queued_bytes = max(self.max_queued_bytes, self.queued_bytes)
+                added = True
+                self.condition.notify_all()
+            elif droppable:
+                # DROP_NEWEST or a single message larger than the queue
+                self.count_dropped += 1
+                self.bytes_dropped += len(data)
+            else:
+                self.disconnect(data)
+
+        self.mutex.release()
+        return added
+
+    def drop_oldest(self, data):
+        """
+        Discard droppable messages, oldest first, until data fits (mutex held)
+        """
+        while len(self.items) > 0 and self.items[0][1] and self.is_full(data):
+            self.discard(self.items.popleft())
+        if len(self.items) == 0 or not self.is_full(data):
+            return
+
+        # not droppable messages in front stay queued in order
+        count = len(self.items)
+        kept_list = []
+        for item in self.items:
+            if item[1] and (
+                count >= self.max_count
+                or self.queued_bytes + len(data) > self.max_bytes
+            ):
+                self.discard(item)
+                count -= 1
+            else:
+                kept_list.append(item)
+        self.items = collections.deque(kept_list)
+
+    def discard(self, item):
+        self.queued_bytes -= len(item[0])
+        self.count_dropped += 1
+        self.bytes_dropped += len(item[0])
+
+    def disconnect(self, data):
+        """
+        Overflow handled by disconnecting: queue closed and emptied (mutex held)
+        """
+        self.count_dropped += len(self.items) + 1
+        self.bytes_dropped += self.queued_bytes + len(data)
+        self.items.clear()
+        self.queued_bytes = 0
+        self.closed = True
+        self.overflowed = True
+        self.condition.notify_all()
+
+    def get_all(self, block=True) -> list:
+        """
+        All queued data (sent as one write), empty if closed and drained (or
+        nothing queued w/o blocking)
+        """
+        self.mutex.acquire()
+        while block and len(self.items) == 0 and not self.closed:
+            self.condition.wait()
+        data_list = [data for data, _ in self.items]
+        self.items.clear()
+        self.count_sent += len(data_list)
+        self.bytes_sent += self.queued_bytes
+        self.queued_bytes = 0
+        self.mutex.release()
+        return data_list
+
+    def close(self):
+        """
+        Stop accepting data, queued data is still handed out
+        """
+        self.mutex.acquire()
+        self.closed = True
+        self.condition.notify_all()
+        self.mutex.release()
+
+    def claim_overflow(self) -> bool:
+        """
+        True once after an overflow closed the queue (DISCONNECT policy or a message
+        that must not be dropped, client to be disconnected by the caller)
+        """
+        self.mutex.acquire()
+        claimed = self.overflowed and not self.overflow_claimed
+        self.overflow_claimed = self.overflowed
+        self.mutex.release()
+        return claimed
+
+    def get_statistics(self):
+        self.mutex.acquire()
+        statistics = {
+            "depth": len(self.items),
+            "queued_bytes": self.queued_bytes,
+            "max_queued_bytes": self.max_queued_bytes,
+            "count_sent": self.count_sent,
+            "bytes_sent": self.bytes_sent,
+            "count_dropped": self.count_dropped,
+            "bytes_dropped": self.bytes_dropped,
+            "overflow_policy": self.overflow_policy.name,
+            "overflowed": self.overflowed,
+        }
+        self.mutex.release()
+        return statistics
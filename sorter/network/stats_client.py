@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import sorter.network.tcp_client
+
+
+class StatsClient(sorter.network.tcp_client.TcpClient):
+    """
+    Queries statistics of services via the machine controller
+
+    Sends "STA <target>", every service of that name (or worker pool) answers with
+    "STR <requester> <json>".
+    """
+
+    def __init__(self, host, port=5005) -> None:
+        super().__init__(
+            host,
+            port,
+            name=f"StatsClient-{os.getpid()}",
+            type="StatsClient",
+            retry_connection=False,
+            auto_reconnect=False,
+        )
+        self.mutex = threading.Lock()
+        self.statistics_list = []
+
+    def event_msg_received(self, msg):
+        part_list = str(msg, "utf-8").split(" ", 2)
+        if part_list[0] == "STR":
+            self.mutex.acquire()
+            self.statistics_list.append(json.loads(part_list[2]))
+            self.mutex.release()
+
+    def query(self, target, expected_count=1, timeout_sec=2.0):
+        """
+        Statistics of target services, list of dicts (may be shorter than
+        expected_count on timeout)
+        """
+        self.mutex.acquire()
+        self.statistics_list = []
+        self.mutex.release()
+        self.send_msg(b"STA %s" % bytes(target, "utf-8"))
+
+        dt_end = time.monotonic() + timeout_sec
+        while len(self.statistics_list) < expected_count and time.monotonic() < dt_end:
+            time.sleep(0.05)
+        if len(self.statistics_list) < expected_count:
+            logging.warning(
+                f"Statistics of {len(self.statistics_list)}/{expected_count} {target}"
+                " received"
+            )
+        return list(self.statistics_list)
+
+    @staticmethod
+    def format_stage_table(statistics):
+        """
+        Text table of the stage percentiles of one service
+        """
+        line_list = [
+            f'{statistics["name"]} ({statistics["state"]}, '
+            f'{statistics["count_item"]} items)',
+            f'{"stage":<14}{"count":>8}{"p50_ms":>10}{"p95_ms":>10}{"p99_ms":>10}'
+            f'{"max_ms":>10}',
+        ]
+        for stage, s in statistics["stage"].items():
+            line_list.append(
+                f'{stage:<14}{s["count"]:>8}{s["p50_ms"]:>10.1f}{s["p95_ms"]:>10.1f}'
+                f'{s["p99_ms"]:>10.1f}{s["max_ms"]:>10.1f}'
+            )
+        if "overlap_ratio" in statistics:
+            line_list.append(
+                f'preprocessing/inference overlap: {statistics["overlap_ratio"]:.0%}'
+            )
+        if "first_stage_hit_rate" in statistics:
+            line_list.append(
+                "cascade first stage hit rate: "
+                f'{statistics["first_stage_hit_rate"]:.0%}'
+            )
+        return "\n".join(line_list)
@@ -0,0 +1,86 @@
+import logging
+import threading
+
+
+class SubscriptionTable:
+    """
+    Clients subscribed to message types (HLO ... sub=CLR,CSS), the server fans a
+    message out to all subscribers of its type
+
+    The subscriber tuple per message type is precomputed when clients subscribe or
+    disconnect, looking up the subscribers of a message is a single dict access
+    w/o lock (the dict is replaced on change, never modified).
+    """
+
+    def __init__(self) -> None:
+        self.mutex = threading.Lock()
+        self.subscriber_dict = {}  # message type (e.g. b"CLR") -> (handler, ...)
+
+        # statistics
+        self.count_published_dict = {}  # message type -> messages fanned out
+
+    def subscribe(self, handler, message_type_list):
+        self.mutex.acquire()
+        subscriber_dict = dict(self.subscriber_dict)
+        for message_type in message_type_list:
+            subscriber_list = subscriber_dict.get(message_type, ())
+            if handler not in subscriber_list:
+                subscriber_dict[message_type] = subscriber_list + (handler,)
+        self.subscriber_dict = subscriber_dict
+        self.mutex.release()
+        logging.info(
+            f'Subscriptions of "{handler.get_name()}": '
+            f'{",".join(str(t, "utf-8") for t in message_type_list)}'
+        )
+
+    def unsubscribe(self, handler):
+        """
+        Remove handler from all message types
+        """
+        self.mutex.acquire()
+        subscriber_dict = {}
+        for message_type, subscriber_list in self.subscriber_dict.items():
+            subscriber_list = tuple(h for h in subscriber_list if h is not handler)
+            if len(subscriber_list) > 0:
+                subscriber_dict[message_type] = subscriber_list
+        self.subscriber_dict = subscriber_dict
+        self.mutex.release()
+
+    def get_subscriber_list(self, message_type):
+        return self.subscriber_dict.get(message_type, ())
+
+    def publish(self, message_type, message) -> int:
+        """
+        Send message to all subscribers of the type, returns the number of
+        subscribers
+        """
+        subscriber_list = self.subscriber_dict.get(message_type, ())
+        for handler in subscriber_list:
+            handler.sendall(message)
+        self.count_published(message_type)
+        return len(subscriber_list)
+
+    def count_published(self, message_type):
+        # not locked: statistics only, a lost increment is acceptable
+        self.count_published_dict[message_type] = (
+            self.count_published_dict.get(message_type, 0) + 1
+        )
+
+    def get_statistics(self):
+        return {
+            "subscribers": {
+                str(message_type, "utf-8"): [h.get_name() for h in subscriber_list]
+                for message_type, subscriber_list in self.subscriber_dict.items()
+            },
+            "count_published": {
+                str(message_type, "utf-8"): count
+                for message_type, count in self.count_published_dict.items()
+            },
+        }
+
+
+def parse_message_type_list(s: str):
+    """
+    Value of HLO sub=, e.g. "CLR,CSS" -> [b"CLR", b"CSS"]
+    """
+    return [bytes(t, "utf-8") for t in s.split(",") if t != ""]
@@ -4,13 +4,34 @@ import sys
 import threading
 import time
 
+import sorter.network.message_framer
+
 
 class TcpClient:
-    def __init__(self, host, port, name, type, retry_connection, auto_reconnect):
+    def __init__(
+        self,
+        host,
+        port,
+        name,
+        type,
+        retry_connection,
+        auto_reconnect,
+        pool=None,
+        binary_version=None,
+        subscription_list=None,
+    ):
         self.host = host
         self.port = port
         self.name = name
         self.type = type
+        self.pool = pool  # worker pool to join, e.g. several classification services
+        # binary messages (version of the format, e.g. CLR) - length prefixed framing
+        # after HLO instead of newlines
+        self.binary_version = binary_version
+        # message types to receive from the server (e.g. ["CLR", "HMV"]), None for
+        # the server's defaults of the client name
+        self.subscription_list = subscription_list
+        self.framing = sorter.network.message_framer.Framing.LINE
         self.client_thread = None
         self.last_message = None
         self.sock = None
@@ -20,6 +41,8 @@ class TcpClient:
         self.stop_requested = False
         self.retry_connection = retry_connection
         self.auto_reconnect = auto_reconnect
+        self.send_mutex = threading.Lock()  # messages are sent from several threads
+        self.framer = None  # per connection, messages split from the byte stream
 
     def event_connected(self):
         """
@@ -31,7 +54,7 @@ class TcpClient:
     def event_msg_received(self, msg):
         """
         Called when message was received - to be overwritten by derived detail
-        implementation.
+        implementation. Called once per complete message (w/o newline).
         """
         pass
 
@@ -57,6 +80,8 @@ class TcpClient:
             self.connect()
             if self.connected:
                 # connection established, authenticate
+                self.framing = sorter.network.message_framer.Framing.LINE
+                self.framer = sorter.network.message_framer.MessageFramer()
                 self.send_hello()
                 self.event_connected()
 
@@ -65,7 +90,7 @@ class TcpClient:
                     # Receive data from the server and shut down
                     received = None
                     try:
-                        received = self.sock.recv(1024)
+                        received = self.framer.recv_from(self.sock)
                     except socket.timeout:
                         if self.stop_requested:
                             # break inner loop, on stop requested
@@ -84,7 +109,7 @@ class TcpClient:
                         self.thread_active = False
                         break
                     if received is not None:
-                        if received == b"":
+                        if received == 0:
                             self.connected = False
                             logging.info("Client: Connection disconnected")
                             try:
@@ -94,10 +119,11 @@ class TcpClient:
                             self.sock.close()
                             self.thread_active = False
                             break
-                        if self.log_received_messages:
-                            logging.info("Received msg: '%s'" % received)
-                        self.last_message = received
-                        self.event_msg_received(received)
+                        for msg in self.framer.messages():
+                            if self.log_received_messages:
+                                logging.info("Received msg: '%s'" % msg)
+                            self.last_message = msg
+                            self.event_msg_received(msg)
             if self.stop_requested or not self.auto_reconnect:
                 logging.info(
                     "Client: Stop requested or no-auto-reconnect - stopping ..."
@@ -150,12 +176,37 @@ class TcpClient:
             bytes(self.name, "utf-8"),
             bytes(self.type, "utf-8"),
         )
-        self.send_msg(msg)
+        if self.pool is not None:
+            msg += b" pool=%s" % bytes(self.pool, "utf-8")
+        if self.subscription_list is not None:
+            msg += b" sub=%s" % bytes(",".join(self.subscription_list), "utf-8")
+        if self.binary_version is None:
+            self.send_msg(msg)
+            return
+
+        # framing switched right after HLO, in both directions
+        msg += b" binary=%d" % self.binary_version
+        self.send_mutex.acquire()
+        try:
+            self.send_msg_locked(msg)
+            self.framing = sorter.network.message_framer.Framing.LENGTH_PREFIXED
+            self.framer.framing = self.framing
+        finally:
+            self.send_mutex.release()
 
     def send_msg(self, msg: bytes):
         if not self.connected:
             raise Exception("TcpClient: Trying to send message while not connected")
-        self.sock.sendall(msg + b"\n")
+        self.send_mutex.acquire()
+        try:
+            self.send_msg_locked(msg)
+        finally:
+            self.send_mutex.release()
+
+    def send_msg_locked(self, msg: bytes):
+        self.sock.sendall(
+            sorter.network.message_framer.frame_message(msg, self.framing)
+        )
 
     def get_last_msg(self):
         return self.last_message
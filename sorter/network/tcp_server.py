@@ -3,19 +3,41 @@ import socket
 import socketserver
 import threading
 
+import sorter.network.message_framer
+import sorter.network.send_queue
+import sorter.network.subscription_table
+import sorter.network.worker_pool
+
 
 class TcpServer:
     """
     Basics TcpServer with multiple connection handling (w/o control server or city specific aspects)
     """
 
-    def __init__(self, host, port, server_command_handler_class):
+    def __init__(
+        self,
+        host,
+        port,
+        server_command_handler_class,
+        send_queue_max_count=100000,
+        send_queue_max_bytes=64 * 1024 * 1024,
+        send_overflow_policy=sorter.network.send_queue.SendOverflowPolicy.DROP_OLDEST,
+    ):
         self.host = host
         self.port = port
         self.server_command_handler_class = server_command_handler_class
+        # outbound queue of each client, a slow client does not block its senders
+        self.send_queue_param_dict = {
+            "max_count": send_queue_max_count,
+            "max_bytes": send_queue_max_bytes,
+            "overflow_policy": send_overflow_policy,
+        }
         self.server_socket = None
         self.server_thread = None
         self.handler_list = []
+        self.worker_pool_dict = {}  # pool name -> WorkerPool
+        self.subscription_table = sorter.network.subscription_table.SubscriptionTable()
+        self.event_loop_driven = False  # connections served by a thread each
 
     def start(self):
         socketserver.ThreadingMixIn.daemon_threads = True
@@ -35,6 +57,7 @@ class TcpServer:
         self.server_socket.shutdown()
         self.server_socket.server_close()
         self.server_thread.join()
+        self.subscription_table = sorter.network.subscription_table.SubscriptionTable()
 
     def broadcast(self, message):
         for handler in self.handler_list:
@@ -47,12 +70,37 @@ class TcpServer:
         logging.info("Server: Client connected")
         self.handler_list.append(handler)
 
+    def client_identified(self, handler):
+        """
+        HLO received, handler can be found by its name (called by its thread)
+        """
+        threading.current_thread().name = (
+            "TcpServer RequestHandler (id: " + handler.get_name() + ")"
+        )
+
     def client_disconnected(self, handler):
         logging.info("Server: Client disconnected")
         connection_count_before = len(self.handler_list)
         self.handler_list = list(filter(lambda h: h != handler, self.handler_list))
         connection_count_after = len(self.handler_list)
         assert connection_count_before - 1 == connection_count_after
+        self.subscription_table.unsubscribe(handler)
+        self.worker_disconnected(handler)
+
+    def get_worker_pool(self, name):
+        """
+        Pool of clients registered with this pool name (created on first use)
+        """
+        if name not in self.worker_pool_dict:
+            self.worker_pool_dict[name] = sorter.network.worker_pool.WorkerPool(name)
+        return self.worker_pool_dict[name]
+
+    def worker_disconnected(self, handler):
+        pool_name = handler.get_pool_name()
+        if pool_name is None:
+            return
+        pool = self.get_worker_pool(pool_name)
+        pool.redispatch(pool.remove_worker(handler))
 
     def get_handler_name_list(self):
         return list(map(lambda handler: handler.get_name(), self.handler_list))
@@ -81,6 +129,8 @@ class TcpServer:
         self.handler_list = list(filter(lambda h: h != handler, self.handler_list))
         connection_count_after = len(self.handler_list)
         assert connection_count_before - 1 == connection_count_after
+        self.subscription_table.unsubscribe(handler)
+        self.worker_disconnected(handler)
 
     def server_fct(self):
         # create server inside deamon thread so that deamon status is inherited by connection threads
@@ -96,13 +146,30 @@ class TcpServer:
     def get_handler_list(self):
         return self.handler_list
 
+    def get_statistics(self):
+        return {
+            "send_queue": {
+                handler.get_name(): handler.send_queue.get_statistics()
+                for handler in self.handler_list
+            },
+            "subscription": self.subscription_table.get_statistics(),
+        }
+
 
 class RequestHandler(socketserver.BaseRequestHandler):
     def __init__(self, request, client_address, server) -> None:
         # assignments needed before super().__init__() since needed in there
         self.name = None
+        self.pool_name = None
         self.request = request
         self.tcp_server = server.tcp_server
+        self.send_mutex = threading.Lock()  # messages are sent from several threads
+        self.framer = sorter.network.message_framer.MessageFramer()
+        self.binary_version = None  # binary=<version> of HLO, length prefixed framing
+        self.send_queue = sorter.network.send_queue.SendQueue(
+            **self.tcp_server.send_queue_param_dict
+        )
+        self.writer_thread = None
 
         super().__init__(request, client_address, server)
 
@@ -111,21 +178,87 @@ class RequestHandler(socketserver.BaseRequestHandler):
         Asking for handler to stop (check get_stopped() to check if stopped successfully)
         """
         self.stop_requested = True
+        self.send_queue.close()
+
+    def sendall(self, msg, droppable=True):
+        """
+        Queue message (w/o newline) framed for the client, returns w/o waiting for
+        the client to receive it
 
-    def sendall(self, msg):
+        Messages not droppable are not discarded on overflow, the client is
+        disconnected instead.
+        """
         logging.info("Sending: %s" % msg)
-        self.request.sendall(msg)
+        self.send_mutex.acquire()
+        try:
+            added = self.send_queue.put(
+                sorter.network.message_framer.frame_message(msg, self.framer.framing),
+                droppable,
+            )
+        finally:
+            self.send_mutex.release()
+
+        # asyncio server: queue drained by its event loop instead of a writer thread
+        if added and self.tcp_server.event_loop_driven:
+            self.request.schedule_flush()
+
+        # client not keeping up (disconnect policy or message not droppable), it can
+        # reconnect
+        if not added and self.send_queue.claim_overflow():
+            logging.warning(
+                f'Server: Send queue of "{self.name}" overflowed - disconnecting'
+            )
+            if self in self.tcp_server.get_handler_list():
+                self.tcp_server.remove_client(self)
+
+    def writer_fct(self):
+        """
+        Send queued messages until the queue is closed, partial sends are continued
+        (socket has a receive timeout)
+        """
+        while True:
+            data_list = self.send_queue.get_all()
+            if len(data_list) == 0:
+                break
+            data = memoryview(b"".join(data_list))
+            offset = 0
+            try:
+                while offset < len(data) and not self.stop_requested:
+                    try:
+                        offset += self.request.send(data[offset:])
+                    except socket.timeout:
+                        pass
+            except OSError as e:
+                logging.info(f'Server: Sending to "{self.name}" failed: {e}')
+                break
+        logging.info("Request handler writer stopped.")
 
     def get_name(self):
         return self.name
 
+    def get_pool_name(self):
+        return self.pool_name
+
+    def get_binary_version(self):
+        return self.binary_version
+
     def handle(self):
+        self.stop_requested = False
+        self.stopped = False
+
+        # asyncio server: received messages are passed to process_message() by its
+        # event loop, there is no thread per connection
+        if self.tcp_server.event_loop_driven:
+            return
+
         threading.current_thread().name = "TcpServer RequestHandler"
 
         self.tcp_server.client_connected(self)
+        self.writer_thread = threading.Thread(target=self.writer_fct)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+        self.writer_thread.name = "TcpServer RequestHandler Writer"
         self.event_client_connected()
-        self.stop_requested = False
-        self.stopped = False
 
         while True:
             # timeout receive frequently to detect server to be closed
@@ -133,8 +266,7 @@ class RequestHandler(socketserver.BaseRequestHandler):
             client_disconnected = False
             while True:
                 try:
-                    self.data = self.request.recv(1024)
-                    if len(self.data) == 0:
+                    if self.framer.recv_from(self.request) == 0:
                         client_disconnected = True
                     break
                 except socket.timeout:
@@ -145,55 +277,92 @@ class RequestHandler(socketserver.BaseRequestHandler):
                     # client disconnected unexpectedly
                     client_disconnected = True
                     break
-            # empty string means connection closed
+            # empty string means connection closed, removed by the server before
+            # (stop, duplicate name): no disconnect events
             if client_disconnected:
-                self.tcp_server.client_disconnected(self)
-                self.event_client_disconnected()
+                if not self.stop_requested:
+                    self.tcp_server.client_disconnected(self)
+                    self.event_client_disconnected()
                 break
             if self.stop_requested:
                 # break outer loop, on stop
                 break
 
-            # check message is complete, i.e. last byte is newline
-            assert self.data[-1] == b"\n"[0]
-            self.data = self.data.strip()
-
-            # break multiple messages received together
-            msg_list = self.data.split(b"\n")
-
-            for msg in msg_list:
-                # HLO
-                if len(msg) >= 3 and msg[:3] == b"HLO":
-                    message_parts = str(msg, "utf-8").split(" ")
-                    # not directly assign name otherwise found as duplicate name below
-                    name = message_parts[1].split("=")[1]
-
-                    # already connected handlers with same name
-                    same_name_handler = self.tcp_server.get_handler_by_name(name)
-                    if same_name_handler is not None:
-                        logging.warning(
-                            "Previous connection with same name exists - disconnecting the old one"
-                        )
-                        self.tcp_server.remove_client(same_name_handler)
-
-                    self.name = name
-                    logging.info('Server: Client identified as "%s"' % self.name)
-                    threading.current_thread().name = (
-                        "TcpServer RequestHandler (id: " + self.name + ")"
-                    )
-                    self.event_client_hello()
-
-                else:
-                    # forwards unknown commands to specific implementation
-                    if msg != b"":
-                        self.process_custom_command(msg)
+            # complete messages, the rest stays buffered until the next receive
+            for msg in self.framer.messages():
+                self.process_message(msg)
 
+        # remaining messages sent before the connection is closed
+        self.send_queue.close()
+        self.writer_thread.join(timeout=2)
         self.stopped = True
         logging.info("Request handler stopped.")
 
+    def process_message(self, msg):
+        # HLO
+        if len(msg) >= 3 and msg[:3] == b"HLO":
+            message_parts = str(msg, "utf-8").split(" ")
+            param_dict = dict(p.split("=", 1) for p in message_parts[1:] if "=" in p)
+            # not directly assign name otherwise found as duplicate name below
+            name = param_dict["name"]
+
+            # already connected handlers with same name
+            same_name_handler = self.tcp_server.get_handler_by_name(name)
+
+            # client switched to length prefixed framing after HLO, before it
+            # can be found by name or pool
+            if "binary" in param_dict:
+                self.send_mutex.acquire()
+                self.binary_version = int(param_dict["binary"])
+                self.framer.framing = (
+                    sorter.network.message_framer.Framing.LENGTH_PREFIXED
+                )
+                self.send_mutex.release()
+
+            # each client is a worker of its pool, by default the pool of its name,
+            # added before the old connection is removed: requests in flight there
+            # are redispatched to this one (e.g. the only worker reconnecting)
+            self.pool_name = param_dict.get("pool", name)
+            self.tcp_server.get_worker_pool(self.pool_name).add_worker(self)
+
+            if same_name_handler is not None:
+                logging.warning(
+                    "Previous connection with same name exists - disconnecting the old one"
+                )
+                self.tcp_server.remove_client(same_name_handler)
+
+            self.name = name
+            logging.info('Server: Client identified as "%s"' % self.name)
+            self.tcp_server.client_identified(self)
+
+            # message types to receive, w/o sub= the defaults for the client
+            if "sub" in param_dict:
+                message_type_list = (
+                    sorter.network.subscription_table.parse_message_type_list(
+                        param_dict["sub"]
+                    )
+                )
+            else:
+                message_type_list = self.get_default_subscription_list()
+            if len(message_type_list) > 0:
+                self.tcp_server.subscription_table.subscribe(self, message_type_list)
+            self.event_client_hello()
+
+        else:
+            # forwards unknown commands to specific implementation
+            if msg != b"":
+                self.process_custom_command(msg)
+
     def get_stopped(self):
         return self.stopped
 
+    def get_default_subscription_list(self):
+        """
+        Message types subscribed for clients w/o sub= in their HLO, to be
+        re-implemented in specialization class if needed
+        """
+        return []
+
     def event_client_connected(self):
         """
         To be re-implemented in specialization class if needed
@@ -0,0 +1,123 @@
+import logging
+import threading
+
+
+class WorkerPool:
+    """
+    Clients registered under one pool name (HLO ... pool=<name>), serving the same
+    kind of requests, e.g. several classification services
+
+    Requests are dispatched to the worker with the least outstanding requests and
+    tracked by id until completed. When a worker disconnects its in-flight requests
+    are handed back to be dispatched to the remaining workers.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.mutex = threading.Lock()
+        self.in_flight_dict = {}  # handler -> {request id: message}
+
+        # statistics
+        self.count_dispatched = 0
+        self.count_completed = 0
+        self.count_redispatched = 0
+        self.count_dropped = 0
+
+    def add_worker(self, handler):
+        self.mutex.acquire()
+        if handler not in self.in_flight_dict:
+            self.in_flight_dict[handler] = {}
+        worker_count = len(self.in_flight_dict)
+        self.mutex.release()
+        logging.info(f'Worker pool "{self.name}": {worker_count} worker(s)')
+
+    def remove_worker(self, handler):
+        """
+        Returns the worker's in-flight requests as list of (request id, message)
+        """
+        self.mutex.acquire()
+        in_flight = self.in_flight_dict.pop(handler, {})
+        worker_count = len(self.in_flight_dict)
+        self.mutex.release()
+        logging.info(
+            f'Worker pool "{self.name}": worker removed with {len(in_flight)} '
+            f"request(s) in flight, {worker_count} worker(s) left"
+        )
+        return list(in_flight.items())
+
+    def get_worker_count(self):
+        return len(self.in_flight_dict)
+
+    def get_worker_list(self):
+        self.mutex.acquire()
+        worker_list = list(self.in_flight_dict)
+        self.mutex.release()
+        return worker_list
+
+    def select_worker(self, request_id, message):
+        """
+        Worker with the least outstanding requests (None if pool is empty), the
+        request is accounted as in flight for it
+        """
+        self.mutex.acquire()
+        handler = None
+        if len(self.in_flight_dict) > 0:
+            handler = min(
+                self.in_flight_dict, key=lambda h: len(self.in_flight_dict[h])
+            )
+            self.in_flight_dict[handler][request_id] = message
+            self.count_dispatched += 1
+        self.mutex.release()
+        return handler
+
+    def dispatch(self, request_id, message) -> bool:
+        """
+        Send request to the least busy worker, False if no worker is connected
+        """
+        handler = self.select_worker(request_id, message)
+        if handler is None:
+            return False
+        handler.sendall(message)
+        return True
+
+    def redispatch(self, request_list):
+        """
+        Requests of a removed worker to the remaining workers
+        """
+        for request_id, message in request_list:
+            if self.dispatch(request_id, message):
+                self.count_redispatched += 1
+            else:
+                self.count_dropped += 1
+                logging.warning(
+                    f'Worker pool "{self.name}": no worker left, dropped request '
+                    f"{request_id}"
+                )
+
+    def complete(self, request_id):
+        """
+        Result for request received, no longer in flight
+        """
+        self.mutex.acquire()
+        for in_flight in self.in_flight_dict.values():
+            if request_id in in_flight:
+                del in_flight[request_id]
+                self.count_completed += 1
+                break
+        self.mutex.release()
+
+    def get_statistics(self):
+        self.mutex.acquire()
+        statistics = {
+            "worker_count": len(self.in_flight_dict),
+            "in_flight": {
+                h.get_name(): len(in_flight)
+                for h, in_flight in self.in_flight_dict.items()
+            },
+            "count_dispatched": self.count_dispatched,
+            "count_completed": self.count_completed,
+            "count_redispatched": self.count_redispatched,
+            "count_dropped": self.count_dropped,
+        }
+        self.mutex.release()
+        return statistics
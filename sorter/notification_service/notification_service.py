@@ -24,7 +24,15 @@ class NSTcpClient(sorter.network.tcp_client.TcpClient):
         auto_reconnect,
         notificaiton_service,
     ):
-        super().__init__(host, port, name, type, retry_connection, auto_reconnect)
+        super().__init__(
+            host,
+            port,
+            name,
+            type,
+            retry_connection,
+            auto_reconnect,
+            subscription_list=["NTF"],
+        )
         self.notificaiton_service: NotificationService = notificaiton_service
 
     def event_msg_received(self, msg):
@@ -1,6 +1,6 @@
 import logging
 
-import sorter.classification_service.classification_service
+import sorter.classification_service.classification_result_codec as crc
 import sorter.network.tcp_client
 import sorter.serial_service.serial_connection_manager
 import sorter.serial_service.slide_serial_connection_handler
@@ -10,28 +10,30 @@ class SSTcpClient(sorter.network.tcp_client.TcpClient):
     def __init__(
         self, host, port, name, type, retry_connection, auto_reconnect, serial_service
     ):
-        super().__init__(host, port, name, type, retry_connection, auto_reconnect)
+        super().__init__(
+            host,
+            port,
+            name,
+            type,
+            retry_connection,
+            auto_reconnect,
+            binary_version=crc.binary_version,
+            subscription_list=["CLR"],
+        )
         self.serial_service: SerialService = serial_service
+        self.clr_codec = crc.ClassificationResultCodec(crc.binary_version)
 
     def event_msg_received(self, msg):
-        part_list = str(msg, "utf-8").split(" ")
-
         logging.info(f'SSTcpClient: Received message "{msg}"')
 
-        # classification result
-        if part_list[0] == "CLR":
-            logging.info(f"Received classification result - msg: {msg}")
-            predicted_class = part_list[2]
-            pred_low_serialized = part_list[6]
-            pred_high_serialized = part_list[7]
-            pred_low_list = sorter.classification_service.classification_service.ClassificationService.deserialize(
-                pred_low_serialized
-            )
-            pred_high_list = sorter.classification_service.classification_service.ClassificationService.deserialize(
-                pred_high_serialized
-            )
+        # classification result, text or binary (class list: no result)
+        if crc.is_classification_result(msg):
+            m = self.clr_codec.decode(msg)
+            if m is None:
+                return
+            logging.info(f"Received classification result - msg: {m}")
             self.serial_service.event_receive_classification_result(
-                predicted_class, pred_low_list, pred_high_list
+                m.predicted_class, m.low_list, m.high_list
             )
 
 
@@ -0,0 +1,126 @@
+import collections
+import enum
+import threading
+import time
+
+
+class OverflowPolicy(enum.Enum):
+    BLOCK = 0  # producer waits for free space, nothing is dropped
+    DROP_NEWEST = 1  # item to be added is discarded
+    DROP_OLDEST = 2  # oldest queued item is discarded to make room
+
+
+class BoundedQueue:
+    """
+    Bounded FIFO queue connecting two pipeline stages
+
+    The overflow policy defines what happens if the consumer falls behind. Closing
+    the queue wakes up all waiting threads, consumers still receive the remaining
+    items before get() signals the end of the stream by returning None.
+    """
+
+    def __init__(self, name: str, max_size: int, overflow_policy: OverflowPolicy):
+        assert max_size > 0
+        self.name = name
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+
+        self.mutex = threading.Lock()
+        self.condition = threading.Condition(self.mutex)
+        self.items = collections.deque()
+        self.closed = False
+
+        # statistics
+        self.count_put = 0
+        self.count_dropped = 0
+        self.max_depth = 0
+        self.blocked_sec = 0.0
+
+    def put(self, item) -> bool:
+        """
+        Add item, returns False if the item itself was dropped or the queue is closed
+        """
+        assert item is not None
+        added = False
+        self.mutex.acquire()
+
+        if not self.closed and len(self.items) >= self.max_size:
+            if self.overflow_policy == OverflowPolicy.BLOCK:
+                dt_start = time.perf_counter()
+                while not self.closed and len(self.items) >= self.max_size:
+                    self.condition.wait()
+                self.blocked_sec += time.perf_counter() - dt_start
+            elif self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                self.items.popleft()
+                self.count_dropped += 1
+
+        if self.closed:
+            pass
+        elif len(self.items) >= self.max_size:
+            # only reached with DROP_NEWEST
+            self.count_dropped += 1
+        else:
+            self.items.append(item)
+            self.count_put += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            added = True
+            self.condition.notify_all()
+
+        self.mutex.release()
+        return added
+
+    def get(self, timeout=None):
+        """
+        Oldest item, None on timeout or if the queue is closed and drained
+        """
+        item = None
+        self.mutex.acquire()
+
+        if timeout is not None:
+            dt_end = time.monotonic() + timeout
+        while len(self.items) == 0 and not self.closed:
+            if timeout is None:
+                self.condition.wait()
+            else:
+                remaining_sec = dt_end - time.monotonic()
+                if remaining_sec <= 0:
+                    break
+                self.condition.wait(remaining_sec)
+
+        if len(self.items) > 0:
+            item = self.items.popleft()
+            self.condition.notify_all()
+
+        self.mutex.release()
+        return item
+
+    def close(self):
+        """
+        Stop accepting items and wake up all waiting producers and consumers
+        """
+        self.mutex.acquire()
+        self.closed = True
+        self.condition.notify_all()
+        self.mutex.release()
+
+    def is_finished(self):
+        """
+        Closed and all items consumed
+        """
+        self.mutex.acquire()
+        finished = self.closed and len(self.items) == 0
+        self.mutex.release()
+        return finished
+
+    def __len__(self):
+        return len(self.items)
+
+    def get_statistics(self):
+        return {
+            "name": self.name,
+            "depth": len(self.items),
+            "max_depth": self.max_depth,
+            "count_put": self.count_put,
+            "count_dropped": self.count_dropped,
+            "blocked_sec": self.blocked_sec,
+        }
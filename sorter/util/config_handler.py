@@ -3,6 +3,9 @@ import pathlib
 
 import sorter.util.singleton
 
+# get_param() w/o default, the key is required (None is a valid default)
+no_default = object()
+
 
 class ConfigHandler(metaclass=sorter.util.singleton.Singleton):
     def __init__(self):
@@ -18,5 +21,10 @@ class ConfigHandler(metaclass=sorter.util.singleton.Singleton):
         with open(self.json_file_path) as json_file:
             self.data = json.load(json_file)
 
-    def get_param(self, key):
+    def get_param(self, key, default=no_default):
+        """
+        Value from config.json - optional keys fall back to default when given
+        """
+        if key not in self.data and default is not no_default:
+            return default
         return self.data[key]
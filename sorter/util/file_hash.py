@@ -1,4 +1,8 @@
 import hashlib
+import json
+import logging
+import os
+import pathlib
 
 
 def file_hash(file_name: str):
@@ -11,3 +15,41 @@ def file_hash(file_name: str):
                 break
             sha1.update(data)
     return "{0}".format(sha1.hexdigest())
+
+
+def cached_file_hash(file_name, cache_fp):
+    """
+    file_hash() remembered in a json cache file, keyed by path, size and mtime
+
+    Unchanged files (e.g. the model after a restart) are not hashed again.
+    """
+    stat = os.stat(file_name)
+    key = str(pathlib.Path(file_name).resolve())
+    cache_fp = pathlib.Path(cache_fp)
+
+    cache = {}
+    if cache_fp.exists():
+        try:
+            with open(cache_fp) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            logging.warning(f"Corrupt hash cache file {cache_fp}, ignoring")
+
+    entry = cache.get(key)
+    if (
+        entry is not None
+        and entry["size"] == stat.st_size
+        and entry["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return entry["hash"]
+
+    hash = file_hash(file_name)
+    cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": hash}
+
+    # write + rename, a concurrent reader never sees a partial file
+    cache_fp.parent.mkdir(parents=True, exist_ok=True)
+    fp_tmp = cache_fp.with_suffix(f".{os.getpid()}.tmp")
+    with open(fp_tmp, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(fp_tmp, cache_fp)
+    return hash
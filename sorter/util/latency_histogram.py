@@ -0,0 +1,77 @@
+import bisect
+import threading
+
+# upper bucket edges in ms, roughly log-spaced from 0.1ms to 60s, last bucket open
+default_bucket_edge_ms_list = [
+    edge * scale
+    for scale in (0.1, 1.0, 10.0, 100.0, 1000.0, 10000.0)
+    for edge in (1.0, 1.5, 2.0, 3.0, 5.0, 7.5)
+]
+
+
+class LatencyHistogram:
+    """
+    Durations counted in fixed buckets, constant memory regardless of sample count
+
+    Percentiles are interpolated linearly within their bucket, i.e. accurate to the
+    bucket resolution (~50% steps).
+    """
+
+    def __init__(self, bucket_edge_ms_list=None) -> None:
+        self.bucket_edge_ms_list = list(
+            bucket_edge_ms_list
+            if bucket_edge_ms_list is not None
+            else default_bucket_edge_ms_list
+        )
+        self.count_list = [0] * (len(self.bucket_edge_ms_list) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.mutex = threading.Lock()
+
+    def record(self, duration_sec: float):
+        duration_ms = 1000.0 * duration_sec
+        index = bisect.bisect_left(self.bucket_edge_ms_list, duration_ms)
+        self.mutex.acquire()
+        self.count_list[index] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.mutex.release()
+
+    def percentile(self, p: float) -> float:
+        """
+        Estimated p-th percentile (0..100) in ms, 0 without samples
+        """
+        self.mutex.acquire()
+        try:
+            if self.count == 0:
+                return 0.0
+            rank = p / 100.0 * self.count
+            cumulative = 0
+            for index, bucket_count in enumerate(self.count_list):
+                if bucket_count > 0 and cumulative + bucket_count >= rank:
+                    lower_ms = self.bucket_edge_ms_list[index - 1] if index > 0 else 0.0
+                    upper_ms = (
+                        self.bucket_edge_ms_list[index]
+                        if index < len(self.bucket_edge_ms_list)
+                        else self.max_ms
+                    )
+                    value_ms = lower_ms + (upper_ms - lower_ms) * (
+                        (rank - cumulative) / bucket_count
+                    )
+                    return min(value_ms, self.max_ms)
+                cumulative += bucket_count
+            return self.max_ms
+        finally:
+            self.mutex.release()
+
+    def get_statistics(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count > 0 else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+        }
@@ -0,0 +1,124 @@
+import logging
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+ring_magic = 0x42534D52  # "BSMR"
+header_size = 16  # int64: magic, slot count, ndim, shape...
+empty_stamp = -1
+
+# rings created by this process, registered with the resource tracker
+owned_name_set = set()
+
+
+class SharedFrameRing:
+    """
+    Ring of fixed size uint8 images in shared memory, one writer, any number of
+    readers (other processes on the same host)
+
+    Every slot carries a stamp (object id) next to the image. The writer clears the
+    stamp while copying, a reader checks the stamp before and after copying the
+    image, so a slot overwritten in the meantime is detected (get() returns None)
+    and the reader can fall back to the image on disk.
+    """
+
+    def __init__(self, name: str, slot_count=None, item_shape=None) -> None:
+        """
+        Creates the ring if slot_count and item_shape are given, otherwise attaches
+        to the existing ring with this name
+        """
+        self.name = name
+        self.owner = slot_count is not None
+        if self.owner:
+            item_shape = tuple(item_shape)
+            assert len(item_shape) <= header_size - 3
+            self.item_nbytes = int(np.prod(item_shape))
+            size = 8 * (header_size + slot_count) + slot_count * self.item_nbytes
+
+            # stale segment left over by a crashed writer
+            try:
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                logging.warning(f"Removed stale shared memory {name}")
+            except FileNotFoundError:
+                pass
+
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            owned_name_set.add(name)
+            header = np.ndarray((header_size,), dtype=np.int64, buffer=self.shm.buf)
+            header[:] = 0
+            header[1] = slot_count
+            header[2] = len(item_shape)
+            header[3 : 3 + len(item_shape)] = item_shape
+            header[0] = ring_magic
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+            # reader in another process must not unlink the writer's segment at exit
+            if name not in owned_name_set:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+
+            header = np.ndarray((header_size,), dtype=np.int64, buffer=self.shm.buf)
+            if header[0] != ring_magic:
+                self.shm.close()
+                raise Exception(f"Shared memory {name} is not a frame ring")
+            slot_count = int(header[1])
+            item_shape = tuple(int(v) for v in header[3 : 3 + int(header[2])])
+            self.item_nbytes = int(np.prod(item_shape))
+
+        self.slot_count = slot_count
+        self.item_shape = item_shape
+        self.header = header
+        self.stamps = np.ndarray(
+            (slot_count,), dtype=np.int64, buffer=self.shm.buf, offset=8 * header_size
+        )
+        self.items = np.ndarray(
+            (slot_count,) + item_shape,
+            dtype=np.uint8,
+            buffer=self.shm.buf,
+            offset=8 * (header_size + slot_count),
+        )
+        if self.owner:
+            self.stamps[:] = empty_stamp
+
+    def put(self, stamp: int, part_list) -> int:
+        """
+        Copy item, given as list of its parts along the first axis (e.g. two crops),
+        into the slot of stamp (object id), returns slot index
+        """
+        assert self.owner and stamp >= 0
+        if len(part_list) != self.item_shape[0]:
+            raise Exception(
+                f"Part count {len(part_list)} != ring item count {self.item_shape[0]}"
+            )
+        slot = stamp % self.slot_count
+        self.stamps[slot] = empty_stamp
+        for i, part in enumerate(part_list):
+            self.items[slot, i] = part
+        self.stamps[slot] = stamp
+        return slot
+
+    def get(self, slot: int, stamp: int):
+        """
+        Copy of the item in slot, None if the slot doesn't hold stamp (anymore)
+        """
+        if slot < 0 or slot >= self.slot_count or self.stamps[slot] != stamp:
+            return None
+        item = self.items[slot].copy()
+        if self.stamps[slot] != stamp:
+            return None
+        return item
+
+    def close(self):
+        """
+        Detach, the owner also removes the segment
+        """
+        # views into the buffer have to be released before closing
+        self.header = None
+        self.stamps = None
+        self.items = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            owned_name_set.discard(self.name)
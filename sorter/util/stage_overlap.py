@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class StageOverlap:
+    """
+    Busy time of pipeline stages running in different threads and the time all of
+    them were busy at once
+
+    A stage is busy while at least one of its threads is between begin() and end().
+    The overlap ratio is the share of the least busy stage hidden behind the other
+    stages, 1.0 = fully overlapped, 0.0 = stages ran strictly one after another.
+    """
+
+    def __init__(self, stage_name_list) -> None:
+        self.mutex = threading.Lock()
+        self.active_count_dict = {stage: 0 for stage in stage_name_list}
+        self.busy_sec_dict = {stage: 0.0 for stage in stage_name_list}
+        self.overlap_sec = 0.0
+        self.dt_last = time.perf_counter()
+
+    def update(self):
+        """
+        Account time since the last update to the busy stages (mutex held)
+        """
+        dt_now = time.perf_counter()
+        delta_sec = dt_now - self.dt_last
+        busy_count = 0
+        for stage, active_count in self.active_count_dict.items():
+            if active_count > 0:
+                self.busy_sec_dict[stage] += delta_sec
+                busy_count += 1
+        if busy_count == len(self.active_count_dict):
+            self.overlap_sec += delta_sec
+        self.dt_last = dt_now
+
+    def begin(self, stage):
+        self.mutex.acquire()
+        self.update()
+        self.active_count_dict[stage] += 1
+        self.mutex.release()
+
+    def end(self, stage):
+        self.mutex.acquire()
+        self.update()
+        self.active_count_dict[stage] -= 1
+        self.mutex.release()
+
+    def get_statistics(self):
+        self.mutex.acquire()
+        self.update()
+        min_busy_sec = min(self.busy_sec_dict.values())
+        statistics = {
+            f"{stage}_busy_sec": busy_sec
+            for stage, busy_sec in self.busy_sec_dict.items()
+        } | {
+            "overlap_sec": self.overlap_sec,
+            "overlap_ratio": (
+                self.overlap_sec / min_busy_sec if min_busy_sec > 0 else 0.0
+            ),
+        }
+        self.mutex.release()
+        return statistics
@@ -0,0 +1,168 @@
+import cv2
+import numpy as np
+
+
+class BackgroundModel:
+    """
+    Background model interface used by ObjectDetector
+
+    apply() updates the model with the current roi and writes the foreground mask
+    (0 = background, 255 = foreground) into the passed fg_mask buffer.
+    """
+
+    def apply(self, roi, fg_mask):
+        raise NotImplementedError()
+
+
+class Mog2BackgroundModel(BackgroundModel):
+    def __init__(self, learning_rate=0.001) -> None:
+        self.learning_rate = learning_rate
+        self.back_sub = cv2.createBackgroundSubtractorMOG2(
+            history=5000, varThreshold=400, detectShadows=False
+        )  # 30pfs
+
+    def apply(self, roi, fg_mask):
+        return self.back_sub.apply(roi, fg_mask, self.learning_rate)
+
+
+class KnnBackgroundModel(BackgroundModel):
+    # automatic learning rate (1 / frame count at the start) - with a fixed low rate
+    # the sample set fills too slowly and the whole roi stays foreground
+    def __init__(self, learning_rate=-1) -> None:
+        self.learning_rate = learning_rate
+        self.back_sub = cv2.createBackgroundSubtractorKNN(
+            history=5000, dist2Threshold=400, detectShadows=False
+        )
+
+    def apply(self, roi, fg_mask):
+        return self.back_sub.apply(roi, fg_mask, self.learning_rate)
+
+
+class NumpyBackgroundModel(BackgroundModel):
+    """
+    Base for the simple per-pixel models: foreground where any channel differs
+    more than threshold from the background estimate
+
+    All operations write into buffers allocated on the first frame.
+    """
+
+    def __init__(self, threshold) -> None:
+        self.threshold = threshold
+        self.background = None  # uint8 estimate used for differencing
+        self.abs_diff = None
+        self.max_diff = None
+
+    def init_buffers(self, roi):
+        self.background = roi.copy()
+        self.abs_diff = np.empty(roi.shape, dtype=np.uint8)
+        self.max_diff = np.empty(roi.shape[:2], dtype=np.uint8)
+
+    def foreground(self, roi, fg_mask):
+        cv2.absdiff(roi, self.background, dst=self.abs_diff)
+
+        # max over channels
+        np.maximum(self.abs_diff[:, :, 0], self.abs_diff[:, :, 1], out=self.max_diff)
+        np.maximum(self.max_diff, self.abs_diff[:, :, 2], out=self.max_diff)
+
+        cv2.threshold(
+            self.max_diff, self.threshold, 255, cv2.THRESH_BINARY, dst=fg_mask
+        )
+        return fg_mask
+
+
+class RunningAverageBackgroundModel(NumpyBackgroundModel):
+    """
+    Exponential running average: bg += alpha * (roi - bg)
+    """
+
+    def __init__(self, alpha=0.01, threshold=30) -> None:
+        super().__init__(threshold)
+        self.alpha = alpha
+        self.average = None
+
+    def apply(self, roi, fg_mask):
+        if self.background is None:
+            self.init_buffers(roi)
+            self.average = roi.astype(np.float32)
+
+        self.foreground(roi, fg_mask)
+
+        # update
+        cv2.accumulateWeighted(roi, self.average, self.alpha)
+        cv2.convertScaleAbs(self.average, dst=self.background)
+        return fg_mask
+
+
+class RunningMedianBackgroundModel(NumpyBackgroundModel):
+    """
+    Approximate running median: bg moves one gray level towards roi per frame
+    """
+
+    def __init__(self, threshold=30) -> None:
+        super().__init__(threshold)
+        self.greater = None
+        self.less = None
+
+    def apply(self, roi, fg_mask):
+        if self.background is None:
+            self.init_buffers(roi)
+            self.greater = np.empty(roi.shape, dtype=bool)
+            self.less = np.empty(roi.shape, dtype=bool)
+
+        self.foreground(roi, fg_mask)
+
+        # update, no overflow since only moving towards roi
+        np.greater(roi, self.background, out=self.greater)
+        np.less(roi, self.background, out=self.less)
+        np.add(self.background, self.greater, out=self.background, casting="unsafe")
+        np.subtract(self.background, self.less, out=self.background, casting="unsafe")
+        return fg_mask
+
+
+class StaticReferenceBackgroundModel(NumpyBackgroundModel):
+    """
+    Plain difference against a static reference of the empty belt
+
+    The reference is the average of the first frames unless passed explicitly.
+    """
+
+    def __init__(self, reference=None, reference_frame_count=5, threshold=30):
+        super().__init__(threshold)
+        self.reference = reference
+        self.reference_frame_count = reference_frame_count
+        self.frame_count = 0
+        self.average = None
+
+    def apply(self, roi, fg_mask):
+        if self.background is None:
+            self.init_buffers(roi)
+            if self.reference is not None:
+                self.background[:] = self.reference
+                self.frame_count = self.reference_frame_count
+            else:
+                self.average = np.zeros(roi.shape, dtype=np.float32)
+
+        # learn reference
+        if self.frame_count < self.reference_frame_count:
+            self.frame_count += 1
+            cv2.accumulateWeighted(roi, self.average, 1.0 / self.frame_count)
+            cv2.convertScaleAbs(self.average, dst=self.background)
+
+        return self.foreground(roi, fg_mask)
+
+
+background_model_class_map = {
+    "mog2": Mog2BackgroundModel,
+    "knn": KnnBackgroundModel,
+    "running_average": RunningAverageBackgroundModel,
+    "running_median": RunningMedianBackgroundModel,
+    "static_reference": StaticReferenceBackgroundModel,
+}
+
+
+def create_background_model(name: str) -> BackgroundModel:
+    if name not in background_model_class_map:
+        raise Exception(
+            f'Background model "{name}" not in list {",".join(background_model_class_map)}'
+        )
+    return background_model_class_map[name]()
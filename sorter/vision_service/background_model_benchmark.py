@@ -0,0 +1,79 @@
+import logging
+import time
+from dataclasses import dataclass, field
+
+import sorter.vision_service.object_detector
+
+
+@dataclass
+class BackgroundModelBenchmarkResult:
+    background_model: str = None
+    bg_downscale_factor: int = None
+    frame_count: int = 0
+    ms_per_frame: float = None
+    trigger_frame_index_list: list = field(default_factory=list)
+    count_double_object: int = 0
+
+
+def run_benchmark(
+    camera, background_model_list, bg_downscale_factor=1, max_frame_count=None
+):
+    """
+    Replay recording through ObjectDetector once per background model
+
+    camera needs capture() (None at end of sequence) and rewind(), e.g. a
+    pre-recorded CameraCapture with loop count 0.
+    """
+    result_list = []
+    for background_model in background_model_list:
+        logging.info(f'Benchmarking background model "{background_model}" ...')
+        camera.rewind()
+        od = sorter.vision_service.object_detector.ObjectDetector(
+            notification_client=None,
+            bg_downscale_factor=bg_downscale_factor,
+            background_model=background_model,
+        )
+
+        result = BackgroundModelBenchmarkResult(
+            background_model=background_model,
+            bg_downscale_factor=bg_downscale_factor,
+        )
+        total_sec = 0.0
+        while max_frame_count is None or result.frame_count < max_frame_count:
+            frame = camera.capture()
+            if frame is None:
+                break
+
+            dt_start = time.perf_counter()
+            trigger, _, _, _ = od.process_frame(result.frame_count, frame)
+            total_sec += time.perf_counter() - dt_start
+
+            if trigger:
+                result.trigger_frame_index_list.append(result.frame_count)
+            result.frame_count += 1
+
+        if result.frame_count > 0:
+            result.ms_per_frame = 1000.0 * total_sec / result.frame_count
+        result.count_double_object = od.get_statistics()["count_double_object"]
+        result_list.append(result)
+
+    return result_list
+
+
+def format_result_table(result_list):
+    line_list = [
+        f'{"Background Model":<18} {"Scale":>5} {"Frames":>6} {"ms/frame":>8} '
+        f'{"Double":>6}  Trigger Frames'
+    ]
+    result: BackgroundModelBenchmarkResult
+    for result in result_list:
+        ms_per_frame = (
+            f"{result.ms_per_frame:8.2f}" if result.ms_per_frame is not None else "-"
+        )
+        line_list.append(
+            f"{result.background_model:<18} {result.bg_downscale_factor:>5} "
+            f"{result.frame_count:>6} {ms_per_frame:>8} "
+            f"{result.count_double_object:>6}  "
+            + ",".join(str(i) for i in result.trigger_frame_index_list)
+        )
+    return line_list
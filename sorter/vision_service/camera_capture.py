@@ -382,5 +382,13 @@ class CameraCapture:
     def get_exposure(self):
         return self.exposure_level
 
+    def rewind(self):
+        """
+        Restart pre-recorded sequence from first frame
+        """
+        if not self.pre_recorded_enabled:
+            raise Exception("Rewind only supported for pre-recorded sequences")
+        self.dummy_frame_index = 0
+
     def set_pre_recorded_loop_count(self, pre_recorded_loop_count):
         self.pre_recorded_loop_count = pre_recorded_loop_count
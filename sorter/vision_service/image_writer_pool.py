@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from dataclasses import dataclass
+
+import cv2
+
+import sorter.util.bounded_queue
+
+image_format_suffix_map = {
+    "png": ".png",
+    "webp": ".webp",  # lossless
+}
+
+
+@dataclass
+class ImageWriteJob:
+    object_id: int = None
+    fp_wo_suffix: pathlib.Path = None
+    frame: object = None
+    json_data: dict = None
+    extra_image_list: list = None  # (name suffix, image), e.g. ("_crops", crops)
+    on_written: object = None  # callback(job), called by the worker thread
+    on_failed: object = None  # callback(job), writing failed, called in order too
+    image_suffix: str = None  # set by the pool
+    sequence: int = None  # set by the pool, order of submission
+
+
+class ImageWriterPool:
+    """
+    Worker threads writing part images and their json in the background
+
+    Files are written under a temporary name and renamed when complete, so a
+    reader (e.g. the classifier) never sees a partially written file. The
+    on_written callback is only called after both files are in place, in the
+    order the jobs were submitted (a job written early waits for the ones before).
+
+    The job queue blocks when full, i.e. the producer is slowed down instead of
+    dropping images (backpressure), blocked time is part of the statistics.
+    """
+
+    def __init__(
+        self,
+        worker_count=2,
+        max_queue_size=16,
+        image_format="png",
+        png_compression=None,
+    ) -> None:
+        if image_format not in image_format_suffix_map:
+            raise Exception(
+                f'Image format "{image_format}" not in list {",".join(image_format_suffix_map)}'
+            )
+        self.worker_count = worker_count
+        self.max_queue_size = max_queue_size
+        self.image_format = image_format
+        self.image_suffix = image_format_suffix_map[image_format]
+
+        # encoder params, png: 0 (none, fastest) .. 9 (smallest), None = OpenCV default
+        if image_format == "png":
+            self.encode_params = (
+                []
+                if png_compression is None
+                else [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+            )
+        else:
+            self.encode_params = [cv2.IMWRITE_WEBP_QUALITY, 101]  # >100 = lossless
+
+        self.queue = None
+        self.thread_list = []
+
+        # completion in submission order, jobs finished early wait in the dict,
+        # callbacks are called by one worker at a time w/o holding the mutex
+        self.count_submitted = 0
+        self.completion_mutex = threading.Lock()
+        self.count_completed = 0
+        self.finished_job_dict = {}  # sequence -> (job, written)
+        self.dispatching = False
+
+        # statistics
+        self.mutex = threading.Lock()
+        self.count_written = 0
+        self.count_failed = 0
+        self.total_write_sec = 0.0
+        self.max_write_sec = 0.0
+
+    def start(self):
+        if len(self.thread_list) > 0:
+            return
+        self.queue = sorter.util.bounded_queue.BoundedQueue(
+            "image_writer",
+            self.max_queue_size,
+            sorter.util.bounded_queue.OverflowPolicy.BLOCK,
+        )
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self.thread_fct)
+            thread.daemon = True
+            thread.name = f"Image Writer {i}"
+            thread.start()
+            self.thread_list.append(thread)
+
+    def stop(self):
+        """
+        Write all queued jobs, then stop the workers
+        """
+        if len(self.thread_list) == 0:
+            return
+        self.queue.close()
+        for thread in self.thread_list:
+            thread.join()
+        self.thread_list = []
+        logging.info(f"Image writer statistics: {self.get_statistics()}")
+
+    def submit(self, job: ImageWriteJob):
+        """
+        Queue job, blocks while the queue is full
+        """
+        if len(self.thread_list) == 0:
+            raise Exception("ImageWriterPool: Submitting job while not started")
+        job.image_suffix = self.image_suffix
+        self.mutex.acquire()
+        job.sequence = self.count_submitted
+        self.count_submitted += 1
+        self.mutex.release()
+        self.queue.put(job)
+
+    def thread_fct(self):
+        while True:
+            job: ImageWriteJob = self.queue.get()
+            if job is None:
+                break
+
+            dt_start = time.perf_counter()
+            try:
+                self.write(job)
+                written = True
+            except Exception as e:
+                logging.error(f"Writing {job.fp_wo_suffix} failed: {e}")
+                written = False
+            write_sec = time.perf_counter() - dt_start
+
+            self.mutex.acquire()
+            if written:
+                self.count_written += 1
+                self.total_write_sec += write_sec
+                self.max_write_sec = max(self.max_write_sec, write_sec)
+            else:
+                self.count_failed += 1
+            self.mutex.release()
+
+            self.complete(job, written)
+
+    def complete(self, job: ImageWriteJob, written):
+        """
+        Callbacks of all jobs finished in sequence, called by the worker which found
+        none dispatching (others continue writing meanwhile)
+        """
+        self.completion_mutex.acquire()
+        self.finished_job_dict[job.sequence] = (job, written)
+        if self.dispatching:
+            self.completion_mutex.release()
+            return
+        self.dispatching = True
+        while True:
+            ready_list = []
+            while self.count_completed in self.finished_job_dict:
+                ready_list.append(self.finished_job_dict.pop(self.count_completed))
+                self.count_completed += 1
+            if len(ready_list) == 0:
+                break
+            self.completion_mutex.release()
+            for ready_job, ready_written in ready_list:
+                ImageWriterPool.call_back(ready_job, ready_written)
+            self.completion_mutex.acquire()
+        self.dispatching = False
+        self.completion_mutex.release()
+
+    @staticmethod
+    def call_back(job: ImageWriteJob, written):
+        callback = job.on_written if written else job.on_failed
+        if callback is None:
+            return
+        try:
+            callback(job)
+        except Exception:
+            logging.exception(f"Callback of {job.fp_wo_suffix} failed")
+
+    def write(self, job: ImageWriteJob):
+        folder_path = job.fp_wo_suffix.parent
+        folder_path.mkdir(parents=True, exist_ok=True)
+
+        # json first, image appears last
+        if job.json_data is not None:
+            ImageWriterPool.write_atomic(
+                str(job.fp_wo_suffix) + ".json",
+                bytes(json.dumps(job.json_data, indent=2), "utf-8"),
+            )
+
+        # main image last
+        image_list = list(job.extra_image_list or []) + [("", job.frame)]
+        for name_suffix, image in image_list:
+            success, buffer = cv2.imencode(job.image_suffix, image, self.encode_params)
+            if not success:
+                raise Exception(f"Encoding {job.image_suffix} failed")
+            ImageWriterPool.write_atomic(
+                str(job.fp_wo_suffix) + name_suffix + job.image_suffix, buffer
+            )
+        logging.info("Wrote " + str(job.fp_wo_suffix))
+
+    @staticmethod
+    def write_atomic(fp, data):
+        fp_tmp = fp + ".tmp"
+        with open(fp_tmp, "wb") as f:
+            f.write(data)
+        os.replace(fp_tmp, fp)
+
+    def get_statistics(self):
+        self.mutex.acquire()
+        statistics = {
+            "count_written": self.count_written,
+            "count_failed": self.count_failed,
+            "average_write_ms": (
+                1000.0 * self.total_write_sec / self.count_written
+                if self.count_written > 0
+                else 0.0
+            ),
+            "max_write_ms": 1000.0 * self.max_write_sec,
+        }
+        self.mutex.release()
+        if self.queue is not None:
+            queue_statistics = self.queue.get_statistics()
+            statistics["queue_max_depth"] = queue_statistics["max_depth"]
+            statistics["queue_blocked_sec"] = queue_statistics["blocked_sec"]
+        return statistics
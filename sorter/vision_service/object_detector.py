@@ -1,10 +1,14 @@
+import collections
 import dataclasses
 import logging
+import threading
 
 import cv2
 import numpy as np
 
 import sorter.notification_service.notification_client
+import sorter.vision_service.background_model
+import sorter.vision_service.roi_mask
 
 
 @dataclasses.dataclass
@@ -20,34 +24,120 @@ class ObjectDetectorStatistics:
         yield from dataclasses.astuple(self)
 
 
-def create_mask(shape, A, B):
-    """
-    Function to create a mask based on points A and B
-    """
-    mask = np.ones(shape, dtype=np.uint8)
-    for y in range(shape[0]):
-        for x in range(shape[1]):
-            result = (B[1] - A[1]) * x - (B[0] - A[0]) * y + B[0] * A[1] - A[0] * B[1]
-            if result > 0:
-                mask[y, x] = 0
-    return mask
-
-
 def blit_img(dst, src, offset_x, offset_y):
     dst[
         offset_y : (offset_y + src.shape[0]), offset_x : (offset_x + src.shape[1])
     ] = src
 
 
+def same_buffer(a, b):
+    """
+    OpenCV returns new array objects even if it wrote into the passed dst buffer
+    """
+    return a is not None and b is not None and a.ctypes.data == b.ctypes.data
+
+
+def default_corner_lines(mask_width, mask_height):
+    return [
+        ((mask_width - 50, 0), (mask_width, 50)),  # top right corner
+        (
+            (mask_width, mask_height - 80),
+            (mask_width - 100, mask_height),
+        ),  # bottom right
+    ]
+
+
+class ObjectDetectorWorkspace:
+    """
+    Buffers living for the detector's lifetime, reused by every process_frame call
+
+    OpenCV writes into the passed dst buffers as long as shape and type match, so
+    in steady state a frame allocates (almost) nothing. Every buffer OpenCV had to
+    (re-)allocate is counted, e.g. stats/centroids when the number of components
+    changes.
+    """
+
+    def __init__(self, mask_height, mask_width, kernel_size=13) -> None:
+        self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+        self.fg_mask = np.zeros((mask_height, mask_width), dtype=np.uint8)
+        self.closing = np.zeros((mask_height, mask_width), dtype=np.uint8)
+        self.opening = np.zeros((mask_height, mask_width), dtype=np.uint8)
+        self.labels = np.zeros((mask_height, mask_width), dtype=np.int32)
+        self.stats = None
+        self.centroids = None
+
+        # reduced resolution mode - downscaled roi, mask upscaled for visualization
+        self.roi_small = None
+        self.mask_full = None
+
+        # visualization, size of camera frame known on first frame
+        self.viz_mono = None
+        self.viz_free_list = collections.deque()
+        self.viz_last_acquired = None
+
+        # allocation counter
+        self.frame_allocation_count = 0
+        self.total_allocation_count = 0
+
+    def begin_frame(self):
+        self.frame_allocation_count = 0
+
+    def count_allocation(self):
+        self.frame_allocation_count += 1
+        self.total_allocation_count += 1
+
+    def reuse(self, name, result):
+        """
+        Keep result of an OpenCV call as buffer for the next frame
+        """
+        if not same_buffer(getattr(self, name), result):
+            self.count_allocation()
+            setattr(self, name, result)
+        return result
+
+    def acquire_viz_buffer(self, shape):
+        """
+        Free visualization buffer (color frame) - allocated only if none is free
+        """
+        while len(self.viz_free_list) > 0:
+            buffer = self.viz_free_list.pop()
+            if buffer.shape == shape:
+                self.viz_last_acquired = buffer
+                return buffer
+        self.count_allocation()
+        self.viz_last_acquired = np.empty(shape, dtype=np.uint8)
+        return self.viz_last_acquired
+
+    def release_viz_buffer(self, buffer):
+        """
+        Hand back visualization buffer when it's not used anymore (thread-safe)
+        """
+        if buffer is not None:
+            self.viz_free_list.append(buffer)
+
+    def get_statistics(self):
+        return {
+            "frame_allocation_count": self.frame_allocation_count,
+            "total_allocation_count": self.total_allocation_count,
+        }
+
+
 class ObjectDetector:
     def __init__(
         self,
         notification_client: sorter.notification_service.notification_client.NotificationClient,
+        auto_release_viz_buffer=True,
+        bg_downscale_factor=1,
+        background_model="mog2",
+        roi_mask_cache_dir=None,
     ) -> None:
         # bg model
-        self.backSub = cv2.createBackgroundSubtractorMOG2(
-            history=5000, varThreshold=400, detectShadows=False
-        )  # 30pfs
+        self.background_model_name = background_model
+        self.background_model = (
+            sorter.vision_service.background_model.create_background_model(
+                background_model
+            )
+        )
 
         # busy area
         self.busy_area_min_x = 150
@@ -55,6 +145,16 @@ class ObjectDetector:
         self.busy_area_min_y = 400
         self.busy_area_max_y = 700
 
+        # exclusions in busy area coordinates - half-planes (line A->B) and polygons
+        self.corner_lines = default_corner_lines(
+            self.busy_area_max_x - self.busy_area_min_x,
+            self.busy_area_max_y - self.busy_area_min_y,
+        )
+        self.exclusion_polygons = []
+        self.roi_mask_cache = sorter.vision_service.roi_mask.RoiMaskCache(
+            roi_mask_cache_dir
+        )
+
         # trigger area
         self.trigger_area_min_x = 350
         self.trigger_area_max_x = 400
@@ -63,6 +163,7 @@ class ObjectDetector:
 
         # frame count after start where bg learns and no components are detected
         self.start_up_inhibition = 5
+        self.bg_model_start_frame = 0
 
         # assume first frame is trigger because background model needs to learn first
         self.last_trigger_frame = 0
@@ -78,70 +179,227 @@ class ObjectDetector:
 
         self.notification_client = notification_client
 
-        # mask out corners
+        # reduced resolution mode - bg subtraction + morphology on a downscaled roi,
+        # component stats are mapped back to full resolution
+        if not isinstance(bg_downscale_factor, int) or bg_downscale_factor < 1:
+            raise Exception(
+                f"bg_downscale_factor must be a positive integer (is {bg_downscale_factor})"
+            )
+        self.bg_downscale_factor = bg_downscale_factor
+
+        # live roi edits, applied by the detecting thread at the next frame
+        self.mutex = threading.Lock()
+        self.pending_busy_area = None
+
+        self.auto_release_viz_buffer = auto_release_viz_buffer
+        self.workspace = None
+        self.init_busy_area()
+
+    def init_busy_area(self):
+        """
+        (Re-)compute everything depending on the busy area geometry
+        """
+        bg_downscale_factor = self.bg_downscale_factor
         self.bg_mask_height = self.busy_area_max_y - self.busy_area_min_y
         self.bg_mask_width = self.busy_area_max_x - self.busy_area_min_x
-        self.corner_lines = [
-            (
-                (self.bg_mask_width - 50, 0),
-                (self.bg_mask_width, 50),
-            ),  # top right corner
-            (
-                (self.bg_mask_width, self.bg_mask_height - 80),
-                (self.bg_mask_width - 100, self.bg_mask_height),
-            ),  # bottom right
-        ]
-        self.overall_mask = None
-        self.pre_compute_corner_bg_substraction_mask()
 
-    def pre_compute_corner_bg_substraction_mask(self):
-        self.overall_mask = np.ones(
-            (self.bg_mask_height, self.bg_mask_width), dtype=np.uint8
+        # mask out corners
+        self.overall_mask = self.roi_mask_cache.get(
+            (self.bg_mask_height, self.bg_mask_width),
+            self.corner_lines,
+            self.exclusion_polygons,
+        )
+
+        self.bg_small_width = self.bg_mask_width // bg_downscale_factor
+        self.bg_small_height = self.bg_mask_height // bg_downscale_factor
+        self.overall_mask_small = cv2.resize(
+            self.overall_mask,
+            (self.bg_small_width, self.bg_small_height),
+            interpolation=cv2.INTER_NEAREST,
+        )
+
+        # kernel scaled with the roi, kept odd: 13 -> 7 (2x) -> 3 (4x)
+        kernel_size = max(1, int(round(13 / bg_downscale_factor))) | 1
+
+        # preallocated buffers
+        # auto release: returned frame_viz is reused by the next process_frame call,
+        # otherwise the caller hands it back via release_viz_buffer()
+        workspace = ObjectDetectorWorkspace(
+            self.bg_small_height, self.bg_small_width, kernel_size
         )
+        if self.workspace is not None:
+            # visualization buffers are camera frame sized, keep pool
+            workspace.viz_free_list = self.workspace.viz_free_list
+            workspace.viz_last_acquired = self.workspace.viz_last_acquired
+            workspace.total_allocation_count = self.workspace.total_allocation_count
+        self.workspace = workspace
+
+    def set_busy_area(
+        self,
+        min_x,
+        max_x,
+        min_y,
+        max_y,
+        corner_lines=None,
+        exclusion_polygons=None,
+    ):
+        """
+        Change roi while running (thread-safe), takes effect with the next frame
 
-        # mask based on line
-        for A, B in self.corner_lines:
-            mask = create_mask((self.bg_mask_height, self.bg_mask_width), A, B)
-            self.overall_mask &= mask
+        Exclusions are in busy area coordinates, corner_lines=None uses the default
+        corner cut-outs for the new size. The background model starts learning anew.
+        API only, the vision service keeps the fixed default busy area of __init__.
+        """
+        if min_x >= max_x or min_y >= max_y:
+            raise Exception(
+                f"Invalid busy area x=[{min_x}, {max_x}] y=[{min_y}, {max_y}]"
+            )
+        if corner_lines is None:
+            corner_lines = default_corner_lines(max_x - min_x, max_y - min_y)
+        if exclusion_polygons is None:
+            exclusion_polygons = []
+
+        self.mutex.acquire()
+        self.pending_busy_area = (
+            min_x,
+            max_x,
+            min_y,
+            max_y,
+            corner_lines,
+            exclusion_polygons,
+        )
+        self.mutex.release()
+
+    def apply_pending_busy_area(self, frame_index):
+        self.mutex.acquire()
+        pending_busy_area = self.pending_busy_area
+        self.pending_busy_area = None
+        self.mutex.release()
+        if pending_busy_area is None:
+            return
+
+        (
+            self.busy_area_min_x,
+            self.busy_area_max_x,
+            self.busy_area_min_y,
+            self.busy_area_max_y,
+            self.corner_lines,
+            self.exclusion_polygons,
+        ) = pending_busy_area
+        self.init_busy_area()
+
+        # new roi size, bg model has to learn again
+        self.background_model = (
+            sorter.vision_service.background_model.create_background_model(
+                self.background_model_name
+            )
+        )
+        self.bg_model_start_frame = frame_index
+        logging.info(
+            f"Busy area changed to x=[{self.busy_area_min_x}, {self.busy_area_max_x}] "
+            f"y=[{self.busy_area_min_y}, {self.busy_area_max_y}]"
+        )
 
     def process_frame(
         self, frame_index, frame, enable_visualization=False, enable_viz_mask=False
     ):
+        if self.pending_busy_area is not None:
+            self.apply_pending_busy_area(frame_index)
+
         # create cutout
         bg_subtraction_roi = frame[
             self.busy_area_min_y : self.busy_area_max_y,
             self.busy_area_min_x : self.busy_area_max_x,
         ]
 
+        ws = self.workspace
+        ws.begin_frame()
+        if self.auto_release_viz_buffer:
+            ws.release_viz_buffer(ws.viz_last_acquired)
+            ws.viz_last_acquired = None
+
+        # downscale
+        f = self.bg_downscale_factor
+        if f > 1:
+            bg_subtraction_roi = ws.reuse(
+                "roi_small",
+                cv2.resize(
+                    bg_subtraction_roi,
+                    (self.bg_small_width, self.bg_small_height),
+                    dst=ws.roi_small,
+                    interpolation=cv2.INTER_AREA,
+                ),
+            )
+
         # subtract BG
-        fg_mask = self.backSub.apply(bg_subtraction_roi, None, 0.001)
+        fg_mask = ws.reuse(
+            "fg_mask", self.background_model.apply(bg_subtraction_roi, ws.fg_mask)
+        )
         if enable_viz_mask:
             debug_viz_mask_after_bg_model = fg_mask.copy()
 
         # mask out corners
-        fg_mask *= self.overall_mask
+        np.multiply(fg_mask, self.overall_mask_small, out=fg_mask)
 
         # close objects
-        kernel = np.ones((13, 13), np.uint8)
-        closing = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
+        closing = ws.reuse(
+            "closing",
+            cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, ws.kernel, dst=ws.closing),
+        )
         if enable_viz_mask:
             debug_viz_mask_after_close = closing.copy()
 
         # open, remove small objects
-        closing = cv2.morphologyEx(closing, cv2.MORPH_OPEN, kernel)
+        closing = ws.reuse(
+            "opening",
+            cv2.morphologyEx(closing, cv2.MORPH_OPEN, ws.kernel, dst=ws.opening),
+        )
         if enable_viz_mask:
             debug_viz_mask_after_open = closing.copy()
 
         # connected components
         connectivity = 4  # 8
-        output = cv2.connectedComponentsWithStats(closing, connectivity, cv2.CV_32S)
+        output = cv2.connectedComponentsWithStats(
+            closing,
+            labels=ws.labels,
+            stats=ws.stats,
+            centroids=ws.centroids,
+            connectivity=connectivity,
+            ltype=cv2.CV_32S,
+        )
         (numLabels, labels, stats, centroids) = output
+        ws.reuse("labels", labels)
+        ws.reuse("stats", stats)
+        ws.reuse("centroids", centroids)
+
+        # mask in full roi resolution for visualization
+        if f > 1 and enable_visualization:
+            closing = ws.reuse(
+                "mask_full",
+                cv2.resize(
+                    closing,
+                    (self.bg_mask_width, self.bg_mask_height),
+                    dst=ws.mask_full,
+                    interpolation=cv2.INTER_NEAREST,
+                ),
+            )
+            if enable_viz_mask:
+                debug_viz_mask_after_bg_model = self.upscale_mask(
+                    debug_viz_mask_after_bg_model
+                )
+                debug_viz_mask_after_close = self.upscale_mask(
+                    debug_viz_mask_after_close
+                )
+                debug_viz_mask_after_open = closing.copy()
 
         # viz image in color
         if enable_visualization:
             # gray image + color highlight
-            frame_viz_mono = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            frame_viz = cv2.cvtColor(frame_viz_mono, cv2.COLOR_GRAY2BGR)
+            frame_viz_mono = ws.reuse(
+                "viz_mono", cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=ws.viz_mono)
+            )
+            frame_viz = ws.acquire_viz_buffer(frame.shape)
+            cv2.cvtColor(frame_viz_mono, cv2.COLOR_GRAY2BGR, dst=frame_viz)
 
             if enable_viz_mask:
                 # viz individual steps
@@ -240,17 +498,22 @@ class ObjectDetector:
 
         # loop components (1 to skip BG comp)
         component_list = []
-        if frame_index > self.start_up_inhibition:
+        if frame_index - self.bg_model_start_frame > self.start_up_inhibition:
             for i in range(1, numLabels):
                 # offset from background substraction roi to full image
-                x = stats[i, cv2.CC_STAT_LEFT] + self.busy_area_min_x
-                y = stats[i, cv2.CC_STAT_TOP] + self.busy_area_min_y
+                x = stats[i, cv2.CC_STAT_LEFT] * f + self.busy_area_min_x
+                y = stats[i, cv2.CC_STAT_TOP] * f + self.busy_area_min_y
 
-                w = stats[i, cv2.CC_STAT_WIDTH]
-                h = stats[i, cv2.CC_STAT_HEIGHT]
-                area = stats[i, cv2.CC_STAT_AREA]
+                w = stats[i, cv2.CC_STAT_WIDTH] * f
+                h = stats[i, cv2.CC_STAT_HEIGHT] * f
+                area = stats[i, cv2.CC_STAT_AREA] * f * f
                 (cx, cy) = centroids[i]
 
+                # centroid stays in roi coordinates, pixel centers scaled
+                if f > 1:
+                    cx = (cx + 0.5) * f - 0.5
+                    cy = (cy + 0.5) * f - 0.5
+
                 # check for overlap component and trigger area
                 if cx == cx and cy == cy:
                     component_list.append(
@@ -330,6 +593,16 @@ class ObjectDetector:
 
         return trigger, frame_viz, component_list, belt_busy
 
+    def upscale_mask(self, mask):
+        """
+        Downscaled mask to roi resolution (debug visualization only)
+        """
+        return cv2.resize(
+            mask,
+            (self.bg_mask_width, self.bg_mask_height),
+            interpolation=cv2.INTER_NEAREST,
+        )
+
     def eval_trigger(self, frame_index, component_list):
         trigger = False
 
@@ -387,8 +660,15 @@ class ObjectDetector:
         inhib_delta = frame_index - self.last_trigger_frame
         return inhib_delta < self.trigger_frame_count_inhibition
 
+    def release_viz_buffer(self, frame_viz):
+        """
+        Only needed with auto_release_viz_buffer=False
+        """
+        self.workspace.release_viz_buffer(frame_viz)
+
     def get_statistics(self):
         return {
             "count_triggered": self.count_triggered,
             "count_double_object": self.count_double_object,
+            "frame_allocation_count": self.workspace.frame_allocation_count,
         }
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+
+import cv2
+import numpy as np
+
+
+def half_plane_mask(shape, A, B):
+    """
+    Mask with 0 on the positive side of the line through points A and B, 1 elsewhere
+
+    Same sign convention as the former per-pixel loop: a line from top-left to
+    bottom-right excludes the area above it.
+    """
+    y, x = np.ogrid[: shape[0], : shape[1]]
+    result = (B[1] - A[1]) * x - (B[0] - A[0]) * y + B[0] * A[1] - A[0] * B[1]
+    return (result <= 0).astype(np.uint8)
+
+
+def polygon_mask(shape, polygon):
+    """
+    Mask with 0 inside the polygon (list of (x, y) points), 1 elsewhere
+    """
+    mask = np.ones(shape, dtype=np.uint8)
+    points = np.array(polygon, dtype=np.int32).reshape((-1, 1, 2))
+    cv2.fillPoly(mask, [points], 0)
+    return mask
+
+
+def exclusion_mask(shape, line_list=(), polygon_list=()):
+    """
+    Combined mask, 0 wherever any line half-plane or polygon excludes the pixel
+    """
+    mask = np.ones(shape, dtype=np.uint8)
+    for A, B in line_list:
+        mask &= half_plane_mask(shape, A, B)
+    for polygon in polygon_list:
+        mask &= polygon_mask(shape, polygon)
+    return mask
+
+
+class RoiMaskCache:
+    """
+    Exclusion masks cached in memory and as .npy files, keyed by the roi geometry
+
+    Without cache_dir only the memory cache is used.
+    """
+
+    def __init__(self, cache_dir=None) -> None:
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir is not None else None
+        self.mask_dict = {}
+
+    @staticmethod
+    def key(shape, line_list, polygon_list):
+        geometry = {
+            "shape": [int(v) for v in shape],
+            "lines": [[[int(v) for v in p] for p in line] for line in line_list],
+            "polygons": [
+                [[int(v) for v in p] for p in polygon] for polygon in polygon_list
+            ],
+        }
+        return hashlib.sha1(
+            json.dumps(geometry, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def get(self, shape, line_list=(), polygon_list=()):
+        key = RoiMaskCache.key(shape, line_list, polygon_list)
+        if key in self.mask_dict:
+            return self.mask_dict[key]
+
+        mask = None
+        fp = None
+        if self.cache_dir is not None:
+            fp = self.cache_dir / f"roi_mask_{key}.npy"
+            if fp.exists():
+                try:
+                    mask = np.load(fp)
+                except (OSError, ValueError):
+                    logging.warning(f"Corrupt roi mask cache file {fp}, recomputing")
+                    mask = None
+                if mask is not None and mask.shape != tuple(shape):
+                    mask = None
+
+        if mask is None:
+            mask = exclusion_mask(shape, line_list, polygon_list)
+            if fp is not None:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+                # write + rename, concurrent readers never see a partial file
+                fp_tmp = fp.with_suffix(f".{os.getpid()}.tmp")
+                with open(fp_tmp, "wb") as f:
+                    np.save(f, mask)
+                os.replace(fp_tmp, fp)
+                logging.info(f"Roi mask cached to {fp}")
+
+        self.mask_dict[key] = mask
+        return mask
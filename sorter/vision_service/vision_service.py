@@ -4,20 +4,25 @@ import logging
 import os
 import pathlib
 import sys
+import threading
 from dataclasses import dataclass
 from enum import Enum
 
 import cv2
+import numpy as np
 
-import sorter.classification_service.classification_service
+import sorter.classification_service.classification_result_codec as crc
 import sorter.classification_service.config
 import sorter.classification_service.crop_image
 import sorter.network.tcp_client
 import sorter.notification_service.notification_client
+import sorter.util.bounded_queue
 import sorter.util.config_handler
+import sorter.util.shared_frame_ring
 import sorter.util.time_delta_format
 import sorter.vision_service.camera_capture
 import sorter.vision_service.draw_bg_box
+import sorter.vision_service.image_writer_pool
 import sorter.vision_service.object_detector
 
 
@@ -30,6 +35,24 @@ class CollectLoopDataItem:
     uniqueness: float = None
     average_process_time_sec: float = None
     dt: datetime.datetime = None
+    image_suffix: str = ".png"
+    crops_written: bool = False
+
+
+@dataclass
+class PersistItem:
+    object_id: int = None
+    frame_index: int = None
+    frame: object = None
+    component_list: list = None
+    fp_wo_suffix: pathlib.Path = None
+    write: bool = False
+
+
+@dataclass
+class RenderItem:
+    frame_viz: object = None
+    sec_since_last_busy: float = None
 
 
 class CollectionMode(Enum):
@@ -44,46 +67,52 @@ class VSTcpClient(sorter.network.tcp_client.TcpClient):
     def __init__(
         self, host, port, name, type, retry_connection, auto_reconnect, vision_service
     ):
-        super().__init__(host, port, name, type, retry_connection, auto_reconnect)
+        super().__init__(
+            host,
+            port,
+            name,
+            type,
+            retry_connection,
+            auto_reconnect,
+            binary_version=crc.binary_version,
+            subscription_list=["CLR", "CSS", "HMV"],
+        )
         self.vision_service: VisionService = vision_service
+        self.clr_codec = crc.ClassificationResultCodec(crc.binary_version)
 
     def event_msg_received(self, msg):
-        part_list = str(msg, "utf-8").split(" ")
-
         try:
-            # classification result
-            if part_list[0] == "CLR":
-                object_id = int(part_list[1])
-                predicted_class = part_list[2]
-                probability = float(part_list[3])
-                uniqueness = float(part_list[4])
-                average_process_time_sec = float(part_list[5])
-                pred_low_serialized = part_list[6]
-                pred_high_serialized = part_list[7]
-                pred_low_list = sorter.classification_service.classification_service.ClassificationService.deserialize(
-                    pred_low_serialized
-                )
-                pred_high_list = sorter.classification_service.classification_service.ClassificationService.deserialize(
-                    pred_high_serialized
-                )
+            # classification result, text or binary (class list: no result)
+            if crc.is_classification_result(msg):
+                m = self.clr_codec.decode(msg)
+                if m is None:
+                    return
                 logging.info(
-                    f"Received classification result - id: {object_id} pc: {predicted_class}"
+                    f"Received classification result - id: {m.object_id} pc: {m.predicted_class}"
                     " prob: {probability*100:.0f}% uniqueness: {uniqueness:.0f}"
                 )
                 self.vision_service.receive_classification_result(
-                    object_id,
-                    predicted_class,
-                    probability,
-                    uniqueness,
-                    average_process_time_sec,
-                    pred_low_list,
-                    pred_high_list,
+                    m.object_id,
+                    m.predicted_class,
+                    m.probability,
+                    m.uniqueness,
+                    m.average_process_time_sec,
+                    m.low_list,
+                    m.high_list,
+                    model_hash=m.model_hash,
                 )
+                return
+
+            part_list = str(msg, "utf-8").split(" ")
 
             # hour meter
-            elif part_list[0] == "HMV":
+            if part_list[0] == "HMV":
                 hour_meter_sec = float(part_list[1])
                 self.vision_service.receive_hour_meter_value(hour_meter_sec)
+
+            # classification service state
+            elif part_list[0] == "CSS":
+                self.vision_service.receive_classifier_state(part_list[1])
         except ValueError:
             logging.error(
                 "Decoding network message error - could be malformed/entangled messages"
@@ -99,6 +128,14 @@ class VisionService:
         host,
         disable_network,
         enable_visualization_fullscreen,
+        enable_pipeline=False,
+        bg_downscale_factor=1,
+        background_model="mog2",
+        image_format="png",
+        png_compression=None,
+        image_writer_count=2,
+        enable_shared_memory=False,
+        enable_crops_at_source=False,
     ):
         self.max_sec_since_last_busy = 60
         self.time_since_last_busy_msg_interval_sec = 120
@@ -108,6 +145,7 @@ class VisionService:
         self.no_write = no_write
         self.count_written = 0
         self.last_received_hour_meter_sec = None
+        self.last_received_classifier_state = None
 
         self.soft_estop_enabled = True
         self.soft_estop_last_sent_frame_index = -1  # estop is resent periodically
@@ -137,8 +175,13 @@ class VisionService:
         self.camera_fisheye = sorter.vision_service.camera_capture.CameraCapture(
             camera_name="fisheye", recording=recording
         )
+        # pipelined: frame_viz buffers are handed back by the render stage
         self.od = sorter.vision_service.object_detector.ObjectDetector(
-            self.notification_client
+            self.notification_client,
+            auto_release_viz_buffer=not enable_pipeline,
+            bg_downscale_factor=bg_downscale_factor,
+            background_model=background_model,
+            roi_mask_cache_dir=sorter.classification_service.config.roi_mask_cache_dir_path,
         )
 
         c = sorter.classification_service.config
@@ -181,29 +224,215 @@ class VisionService:
         self.last_pred_low_list = None
         self.last_pred_high_list = None
 
+        # pipelined mode - capture, detect, persist and render in separate threads
+        # detection never drops frames, rendering drops the newest frame if behind
+        self.enable_pipeline = enable_pipeline
+        self.pipeline_stop_requested = False
+        self.pipeline_thread_list = []
+        self.detect_queue = None
+        self.persist_queue = None
+        self.render_queue = None
+
+        # images and json are written in the background, classification requested
+        # when written
+        self.image_writer_pool = (
+            sorter.vision_service.image_writer_pool.ImageWriterPool(
+                worker_count=image_writer_count,
+                image_format=image_format,
+                png_compression=png_compression,
+            )
+        )
+
+        # same host: crops handed to the classifier via shared memory, the CLF is
+        # sent right away, results arriving before the image is written are kept
+        # pending
+        self.shared_crop_ring = None
+        if enable_shared_memory:
+            self.shared_crop_ring = sorter.util.shared_frame_ring.SharedFrameRing(
+                f"bsm_crops_{os.getpid()}",
+                c.shared_crop_ring_slot_count,
+                c.shared_crop_ring_item_shape,
+            )
+        self.collect_loop_data_mutex = threading.Lock()
+
+        # crops (low | high side by side) written as small extra image, classifier
+        # reads these instead of the full frame
+        self.enable_crops_at_source = enable_crops_at_source
+        self.image_pending_object_id_set = set()
+        self.pending_classification_result_dict = {}
+
     def stop(self):
+        self.stop_pipeline()
+        self.image_writer_pool.stop()
+        if self.shared_crop_ring is not None:
+            self.shared_crop_ring.close()
+            self.shared_crop_ring = None
         if not self.disable_network:
             self.tcp_client.stop()
 
     def collect(self):
+        if self.enable_pipeline:
+            return self.collect_pipelined()
+
         self.loop_setup()
         while True:
             b = self.loop_step()
             if b:
                 break
+        self.image_writer_pool.stop()
+        return self.collect_loop_data_list
+
+    def collect_pipelined(self):
+        self.loop_setup()
+        self.start_pipeline()
+
+        # render stage runs on the calling thread, OpenCV windows need the main thread
+        if self.enable_visualization:
+            while not self.render_queue.is_finished():
+                render_item: RenderItem = self.render_queue.get(timeout=0.1)
+                if render_item is None:
+                    continue
+                quit = self.render_step(
+                    render_item.frame_viz, render_item.sec_since_last_busy
+                )
+                self.od.release_viz_buffer(render_item.frame_viz)
+                if quit:
+                    self.stop_pipeline()
+                    break
+
+        # sequence ended
+        self.join_pipeline()
+        self.image_writer_pool.stop()
         return self.collect_loop_data_list
 
+    def start_pipeline(self):
+        self.pipeline_stop_requested = False
+        self.detect_queue = sorter.util.bounded_queue.BoundedQueue(
+            "detect", 8, sorter.util.bounded_queue.OverflowPolicy.BLOCK
+        )
+        self.persist_queue = sorter.util.bounded_queue.BoundedQueue(
+            "persist", 16, sorter.util.bounded_queue.OverflowPolicy.BLOCK
+        )
+        self.render_queue = sorter.util.bounded_queue.BoundedQueue(
+            "render", 2, sorter.util.bounded_queue.OverflowPolicy.DROP_NEWEST
+        )
+
+        self.pipeline_thread_list = []
+        for name, fct in [
+            ("Vision Capture", self.capture_thread_fct),
+            ("Vision Detect", self.detect_thread_fct),
+            ("Vision Persist", self.persist_thread_fct),
+        ]:
+            thread = threading.Thread(target=fct)
+            thread.daemon = True
+            thread.name = name
+            thread.start()
+            self.pipeline_thread_list.append(thread)
+
+    def stop_pipeline(self):
+        """
+        Stop capturing, already captured frames are still detected and persisted
+        """
+        self.pipeline_stop_requested = True
+        if self.detect_queue is not None:
+            self.detect_queue.close()
+            self.render_queue.close()
+        self.join_pipeline()
+
+    def join_pipeline(self):
+        if len(self.pipeline_thread_list) == 0:
+            return
+
+        for thread in self.pipeline_thread_list:
+            thread.join()
+        self.pipeline_thread_list = []
+
+        for q in [self.detect_queue, self.persist_queue, self.render_queue]:
+            logging.info(f"Pipeline queue statistics: {q.get_statistics()}")
+        logging.info(
+            f"Image writer statistics: {self.image_writer_pool.get_statistics()}"
+        )
+
+    def capture_thread_fct(self):
+        logging.info("Capture stage started ...")
+        while not self.pipeline_stop_requested:
+            frame = self.camera_fisheye.capture()
+            if frame is None:
+                logging.info("Sequence ended.")
+                break
+            if not self.detect_queue.put(frame):
+                break
+        self.detect_queue.close()
+        logging.info("Capture stage stopped.")
+
+    def detect_thread_fct(self):
+        logging.info("Detect stage started ...")
+        try:
+            while True:
+                frame = self.detect_queue.get()
+                if frame is None:
+                    break
+
+                frame_viz, sec_since_last_busy, persist_item = self.detect_step(frame)
+                if persist_item is not None:
+                    self.persist_queue.put(persist_item)
+                self.update_fps()
+                if self.enable_visualization:
+                    added = self.render_queue.put(
+                        RenderItem(
+                            frame_viz=frame_viz,
+                            sec_since_last_busy=sec_since_last_busy,
+                        )
+                    )
+                    if not added:
+                        self.od.release_viz_buffer(frame_viz)
+                self.end_frame_step()
+        finally:
+            # no more frames, let downstream stages drain and stop
+            self.detect_queue.close()
+            self.persist_queue.close()
+            self.render_queue.close()
+        logging.info("Detect stage stopped.")
+
+    def persist_thread_fct(self):
+        logging.info("Persist stage started ...")
+        while True:
+            persist_item = self.persist_queue.get()
+            if persist_item is None:
+                break
+            self.persist_step(persist_item)
+        logging.info("Persist stage stopped.")
+
     def loop_setup(self):
         self.collect_loop_frame_index = 0
         self.collect_loop_data_list = []
         self.collect_loop_last_frame_inhibited = False
         self.collect_loop_last_frame_belt_busy = False
+        self.image_writer_pool.start()
 
     def loop_step(self):
         frame = self.camera_fisheye.capture()
         if frame is None:
             logging.info("Sequence ended.")
             return True
+
+        frame_viz, sec_since_last_busy, persist_item = self.detect_step(frame)
+        if persist_item is not None:
+            self.persist_step(persist_item)
+        self.update_fps()
+
+        if self.enable_visualization:
+            quit = self.render_step(frame_viz, sec_since_last_busy)
+            if quit:
+                return True
+
+        self.end_frame_step()
+        return False
+
+    def detect_step(self, frame):
+        """
+        Latency critical part of the loop: object detection, belt status and trigger
+        """
         trigger, frame_viz, component_list, belt_busy = self.od.process_frame(
             self.collect_loop_frame_index,
             frame,
@@ -241,13 +470,11 @@ class VisionService:
         self.collect_loop_last_frame_inhibited = inhibitted
 
         # detection
+        persist_item = None
         if trigger:
             logging.info("Triggered ...")
             self.notification_client.notify_part_scanned()
 
-            # write image
-            object_id = self.count_written
-
             # image folder
             if self.collection_mode == CollectionMode.TRAINING:
                 folder_path = self.incoming_data_known_class_train_folder_path
@@ -262,70 +489,164 @@ class VisionService:
             else:
                 raise Exception("Unknown collection mode")
 
-            fp_wo_suffix = folder_path / (
-                "train_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            persist_item = PersistItem(
+                object_id=self.count_written,
+                frame_index=self.collect_loop_frame_index,
+                frame=frame,
+                component_list=component_list,
+                fp_wo_suffix=folder_path
+                / ("train_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")),
+                write=not self.no_write and not self.soft_estop_enabled,
             )
-            if not self.no_write and not self.soft_estop_enabled:
-                if not folder_path.exists():
-                    folder_path.mkdir()
-                assert folder_path.is_dir()
-
-                cv2.imwrite(str(fp_wo_suffix) + ".png", frame)
-                logging.info("Wrote " + str(fp_wo_suffix))
-
-                # object json
-                with open(str(fp_wo_suffix) + ".json", "w") as f:
-                    json.dump(
-                        {
-                            "object_class": self.object_class,
-                            "component_list": component_list,
-                        },
-                        f,
-                        indent=2,
-                    )
-                self.collect_loop_data_list.append(
-                    CollectLoopDataItem(
-                        object_id=object_id,
-                        filepath=str(fp_wo_suffix),
-                        dt=datetime.datetime.now(),
+
+            # write count
+            self.count_written += 1
+
+        return frame_viz, sec_since_last_busy, persist_item
+
+    def persist_step(self, persist_item: "PersistItem"):
+        """
+        Queue image and json of a triggered part for writing, classification is
+        requested once written (see image_written)
+        """
+        frame = persist_item.frame
+        object_id = persist_item.object_id
+
+        # coutout for viz
+        self.detected_crop_low = sorter.classification_service.crop_image.crop_image(
+            frame, low=True
+        )
+        self.detected_crop_high = sorter.classification_service.crop_image.crop_image(
+            frame, low=False
+        )
+        self.last_pred_low_list = None
+        self.last_pred_high_list = None
+
+        if persist_item.write:
+            self.collect_loop_data_mutex.acquire()
+            self.image_pending_object_id_set.add(object_id)
+            self.collect_loop_data_mutex.release()
+
+            extra_image_list = None
+            if self.enable_crops_at_source:
+                extra_image_list = [
+                    (
+                        sorter.classification_service.config.crops_name_suffix,
+                        np.hstack([self.detected_crop_low, self.detected_crop_high]),
                     )
+                ]
+            self.image_writer_pool.submit(
+                sorter.vision_service.image_writer_pool.ImageWriteJob(
+                    object_id=persist_item.object_id,
+                    fp_wo_suffix=persist_item.fp_wo_suffix,
+                    frame=frame,
+                    json_data={
+                        "object_class": self.object_class,
+                        "component_list": persist_item.component_list,
+                    },
+                    extra_image_list=extra_image_list,
+                    on_written=self.image_written,
+                    on_failed=self.image_write_failed,
                 )
-                self.update_average_collection_frequency()
-
-                # upload via scp
-                if sys.platform == "win32":
-                    cmd = (
-                        f'scp {str(fp_wo_suffix) + ".png"} '
-                        + sorter.util.config_handler.ConfigHandler().get_param(
-                            "vision_service_win32_scp_target"
-                        )
-                    )
-                    return_code = os.system(cmd)
-                    logging.info(f"SCP command: {cmd}")
-                    logging.info(f"Return Code: {return_code}")
-
-                # classifier
-                # rel to data_dir
-                relative_path = fp_wo_suffix.relative_to(
-                    sorter.classification_service.config.data_dir_path
+            )
+
+            # classify from shared memory, image on disk is archive only
+            if self.shared_crop_ring is not None:
+                slot = self.shared_crop_ring.put(
+                    object_id, [self.detected_crop_low, self.detected_crop_high]
                 )
                 self.send_classification_request(
-                    object_id, relative_path.with_suffix(".png")
+                    object_id,
+                    self.relative_image_path(persist_item.fp_wo_suffix),
+                    ring_name=self.shared_crop_ring.name,
+                    slot=slot,
+                    crops_filepath=self.relative_crops_path(persist_item.fp_wo_suffix),
                 )
 
-            # write count
-            self.count_written += 1
-
-            # coutout for viz
-            self.detected_crop_low = (
-                sorter.classification_service.crop_image.crop_image(frame, low=True)
+    def image_written(self, job):
+        """
+        Called by an image writer thread when image and json are completely written,
+        in the order the parts were submitted
+        """
+        object_id = job.object_id
+        fp_wo_suffix = job.fp_wo_suffix
+        item = CollectLoopDataItem(
+            object_id=object_id,
+            filepath=str(fp_wo_suffix),
+            dt=datetime.datetime.now(),
+            image_suffix=job.image_suffix,
+            crops_written=job.extra_image_list is not None,
+        )
+        self.collect_loop_data_mutex.acquire()
+        self.collect_loop_data_list.append(item)
+        self.image_pending_object_id_set.discard(object_id)
+        pending_result = self.pending_classification_result_dict.pop(object_id, None)
+        self.collect_loop_data_mutex.release()
+        self.update_average_collection_frequency()
+
+        # result received before image was written
+        if pending_result is not None:
+            self.apply_classification_result(item, *pending_result)
+
+        # upload via scp
+        if sys.platform == "win32":
+            cmd = (
+                f"scp {str(fp_wo_suffix) + job.image_suffix} "
+                + sorter.util.config_handler.ConfigHandler().get_param(
+                    "vision_service_win32_scp_target"
+                )
             )
-            self.detected_crop_high = (
-                sorter.classification_service.crop_image.crop_image(frame, low=False)
+            return_code = os.system(cmd)
+            logging.info(f"SCP command: {cmd}")
+            logging.info(f"Return Code: {return_code}")
+
+        # classifier, already requested if crops are in shared memory
+        if self.shared_crop_ring is None:
+            self.send_classification_request(
+                object_id,
+                self.relative_image_path(fp_wo_suffix),
+                crops_filepath=self.relative_crops_path(fp_wo_suffix),
             )
-            self.last_pred_low_list = None
-            self.last_pred_high_list = None
 
+    def image_write_failed(self, job):
+        """
+        Called by an image writer thread if the image could not be written, the part
+        is not classified
+        """
+        self.collect_loop_data_mutex.acquire()
+        self.image_pending_object_id_set.discard(job.object_id)
+        pending_result = self.pending_classification_result_dict.pop(
+            job.object_id, None
+        )
+        self.collect_loop_data_mutex.release()
+        if pending_result is not None:
+            logging.warning(
+                f"Classification result of {job.object_id} w/o image - discarded"
+            )
+
+    def relative_image_path(self, fp_wo_suffix):
+        """
+        Image path relative to data_dir, as expected by the classifier
+        """
+        relative_path = fp_wo_suffix.relative_to(
+            sorter.classification_service.config.data_dir_path
+        )
+        return relative_path.with_suffix(self.image_writer_pool.image_suffix)
+
+    def relative_crops_path(self, fp_wo_suffix):
+        """
+        Crops image path relative to data_dir, None if crops aren't written
+        """
+        if not self.enable_crops_at_source:
+            return None
+        relative_path = self.relative_image_path(fp_wo_suffix)
+        return relative_path.with_name(
+            relative_path.stem
+            + sorter.classification_service.config.crops_name_suffix
+            + relative_path.suffix
+        )
+
+    def update_fps(self):
         # fps
         delta_sec = (
             datetime.datetime.now() - self.collect_loop_dt_last_frame
@@ -351,142 +672,153 @@ class VisionService:
         if not self.enable_visualization and self.collect_loop_frame_index % 30 == 0:
             logging.info(f"SmoothFps: {self.collect_loop_smooth_fps:.1f}fps")
 
-        if self.enable_visualization:
-            # bg box
-            w = frame_viz.shape[1]
-            top_box_height = 30
-            x = 0
-            y = 0
-            sorter.vision_service.draw_bg_box.draw_bg_box(
-                frame_viz, x, y, w, top_box_height
-            )
+    def end_frame_step(self):
+        # e-stop
+        self.periodically_send_soft_estop_state()
 
-            detector_stat = self.od.get_statistics()
+        self.collect_loop_frame_index += 1
+        self.collect_loop_dt_last_frame = datetime.datetime.now()
 
-            # top text
-            if self.collection_mode == CollectionMode.TRAINING:
-                col_mode_str = "TRAIN"
-            elif self.collection_mode == CollectionMode.TESTING:
-                col_mode_str = "TEST"
-            elif self.collection_mode == CollectionMode.TRASH:
-                col_mode_str = "TRASH"
-            elif self.collection_mode == CollectionMode.INCONSISTENT:
-                col_mode_str = "INC"
-            elif self.collection_mode == CollectionMode.KEEP_INCORRECT:
-                col_mode_str = "KIC"
-            else:
-                raise Exception("Unknown collection mode")
-            msg = (
-                "Label: "
-                + self.object_class
-                + "  Writing: "
-                + ("False" if self.no_write else "True")
-            )
-            msg += f"  Scanned: {self.count_written}"
-            msg += f'  Double: {detector_stat["count_double_object"]}'
-            msg += f"  Mode: {col_mode_str}"
-            msg += "  Net: " + (
-                "True"
-                if not self.disable_network and self.tcp_client.get_connected()
-                else "False"
-            )
-            msg += "  Scanner: " + (
-                "Busy" if self.collect_loop_last_frame_belt_busy else "Free"
-            )
-            msg += "  FPS: %.2f" % self.collect_loop_smooth_fps
-            msg += f"  LB: {sec_since_last_busy:03.0f}s"
-            # msg += f'  Frame: {self.collect_loop_frame_index:05d}'
-            msg += f"  HM: {sorter.util.time_delta_format.time_delta_format(self.last_received_hour_meter_sec)}"
-            msg += f"  PPM: {self.collect_loop_average_part_per_sec*60:.1f}"
+    def render_step(self, frame_viz, sec_since_last_busy):
+        """
+        Draw overlays, show visualization and handle keyboard input
+
+        Returns True if quit was requested.
+        """
+        # bg box
+        w = frame_viz.shape[1]
+        top_box_height = 30
+        x = 0
+        y = 0
+        sorter.vision_service.draw_bg_box.draw_bg_box(
+            frame_viz, x, y, w, top_box_height
+        )
+
+        detector_stat = self.od.get_statistics()
+
+        # top text
+        if self.collection_mode == CollectionMode.TRAINING:
+            col_mode_str = "TRAIN"
+        elif self.collection_mode == CollectionMode.TESTING:
+            col_mode_str = "TEST"
+        elif self.collection_mode == CollectionMode.TRASH:
+            col_mode_str = "TRASH"
+        elif self.collection_mode == CollectionMode.INCONSISTENT:
+            col_mode_str = "INC"
+        elif self.collection_mode == CollectionMode.KEEP_INCORRECT:
+            col_mode_str = "KIC"
+        else:
+            raise Exception("Unknown collection mode")
+        msg = (
+            "Label: "
+            + self.object_class
+            + "  Writing: "
+            + ("False" if self.no_write else "True")
+        )
+        msg += f"  Scanned: {self.count_written}"
+        msg += f'  Double: {detector_stat["count_double_object"]}'
+        msg += f"  Mode: {col_mode_str}"
+        msg += "  Net: " + (
+            "True"
+            if not self.disable_network and self.tcp_client.get_connected()
+            else "False"
+        )
+        msg += "  Scanner: " + (
+            "Busy" if self.collect_loop_last_frame_belt_busy else "Free"
+        )
+        msg += "  FPS: %.2f" % self.collect_loop_smooth_fps
+        msg += f"  LB: {sec_since_last_busy:03.0f}s"
+        # msg += f'  Frame: {self.collect_loop_frame_index:05d}'
+        msg += f"  HM: {sorter.util.time_delta_format.time_delta_format(self.last_received_hour_meter_sec)}"
+        msg += f"  PPM: {self.collect_loop_average_part_per_sec*60:.1f}"
+        if self.last_received_classifier_state not in (None, "ready"):
+            msg += f"  CLS: {self.last_received_classifier_state}"
+        cv2.putText(
+            frame_viz,
+            msg,
+            (10, 20),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            (255, 255, 255),
+            1,
+            2,
+        )
+
+        # object list
+        w = 220
+        margin = 10
+        img_height = frame_viz.shape[0]
+        h = img_height - 2 * margin - top_box_height
+        x = frame_viz.shape[1] - w - margin
+        y = top_box_height + margin
+        sorter.vision_service.draw_bg_box.draw_bg_box(frame_viz, x, y, w, h)
+        y = top_box_height + 3 * margin
+        for line in self.make_object_list():
             cv2.putText(
                 frame_viz,
-                msg,
-                (10, 20),
+                line,
+                (x + 10, y),
                 cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
+                0.4,
                 (255, 255, 255),
                 1,
                 2,
             )
+            y += 20
 
-            # object list
-            w = 220
-            margin = 10
-            img_height = frame_viz.shape[0]
-            h = img_height - 2 * margin - top_box_height
-            x = frame_viz.shape[1] - w - margin
-            y = top_box_height + margin
-            sorter.vision_service.draw_bg_box.draw_bg_box(frame_viz, x, y, w, h)
-            y = top_box_height + 3 * margin
-            for line in self.make_object_list():
-                cv2.putText(
-                    frame_viz,
-                    line,
-                    (x + 10, y),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.4,
-                    (255, 255, 255),
-                    1,
-                    2,
-                )
-                y += 20
-
-            self.draw_soft_estop(frame_viz)
+        self.draw_soft_estop(frame_viz)
 
-            self.draw_classifier_result(frame_viz)
+        self.draw_classifier_result(frame_viz)
 
-            # show
-            window_name = "Vision Service"
-            if self.enable_visualization_fullscreen:
-                cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-                cv2.setWindowProperty(
-                    window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN
-                )
-
-            cv2.imshow(window_name, frame_viz)
-            if not self.enable_visualization_fullscreen:
-                cv2.moveWindow(window_name, 50, 50)
-
-            # keyboard input
-            # http://www.asciitable.com/  (DEC column)
-            k = cv2.waitKey(1)
-            if k != -1:
-                if k == 27:  # ESC
-                    self.soft_estop_enabled = True
-                elif k == 115 or k == 32:  # s, space
-                    self.soft_estop_enabled = not self.soft_estop_enabled
-                elif k == 99:  # c
-                    if self.collection_mode == CollectionMode.TRASH:
-                        self.collection_mode = CollectionMode.TRAINING
-                    elif self.collection_mode == CollectionMode.TRAINING:
-                        self.collection_mode = CollectionMode.TESTING
-                    elif self.collection_mode == CollectionMode.TESTING:
-                        self.collection_mode = CollectionMode.INCONSISTENT
-                    elif self.collection_mode == CollectionMode.INCONSISTENT:
-                        self.collection_mode = CollectionMode.KEEP_INCORRECT
-                    elif self.collection_mode == CollectionMode.KEEP_INCORRECT:
-                        self.collection_mode = CollectionMode.TRASH
-                    else:
-                        raise Exception("Unknown collection mode")
-                elif k == ord("m"):  # m
-                    self.enable_viz_mask = not self.enable_viz_mask
-                elif k == 113:  # q, quit
-                    cv2.destroyAllWindows()
-                    return True
-        # e-stop
-        self.periodically_send_soft_estop_state()
+        # show
+        window_name = "Vision Service"
+        if self.enable_visualization_fullscreen:
+            cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+            cv2.setWindowProperty(
+                window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN
+            )
 
-        self.collect_loop_frame_index += 1
-        self.collect_loop_dt_last_frame = datetime.datetime.now()
+        cv2.imshow(window_name, frame_viz)
+        if not self.enable_visualization_fullscreen:
+            cv2.moveWindow(window_name, 50, 50)
+
+        # keyboard input
+        # http://www.asciitable.com/  (DEC column)
+        k = cv2.waitKey(1)
+        if k != -1:
+            if k == 27:  # ESC
+                self.soft_estop_enabled = True
+            elif k == 115 or k == 32:  # s, space
+                self.soft_estop_enabled = not self.soft_estop_enabled
+            elif k == 99:  # c
+                if self.collection_mode == CollectionMode.TRASH:
+                    self.collection_mode = CollectionMode.TRAINING
+                elif self.collection_mode == CollectionMode.TRAINING:
+                    self.collection_mode = CollectionMode.TESTING
+                elif self.collection_mode == CollectionMode.TESTING:
+                    self.collection_mode = CollectionMode.INCONSISTENT
+                elif self.collection_mode == CollectionMode.INCONSISTENT:
+                    self.collection_mode = CollectionMode.KEEP_INCORRECT
+                elif self.collection_mode == CollectionMode.KEEP_INCORRECT:
+                    self.collection_mode = CollectionMode.TRASH
+                else:
+                    raise Exception("Unknown collection mode")
+            elif k == ord("m"):  # m
+                self.enable_viz_mask = not self.enable_viz_mask
+            elif k == 113:  # q, quit
+                cv2.destroyAllWindows()
+                return True
         return False
 
     def update_average_collection_frequency(self):
-        last_N_items = self.collect_loop_data_list[-20:]  # last 20 items
+        self.collect_loop_data_mutex.acquire()
+        dt_list = sorted(item.dt for item in self.collect_loop_data_list[-20:])
+        self.collect_loop_data_mutex.release()
 
         # deltas
         delta_sec_list = []
-        for current, next in zip(last_N_items, last_N_items[1:]):
-            delta_sec_list.append((next.dt - current.dt).total_seconds())
+        for current, next in zip(dt_list, dt_list[1:]):
+            delta_sec_list.append((next - current).total_seconds())
 
         # average
         self.collect_loop_average_part_per_sec = 0
@@ -508,7 +840,14 @@ class VisionService:
                 2,
             )
 
-    def send_classification_request(self, object_id, filepath: pathlib.Path):
+    def send_classification_request(
+        self,
+        object_id,
+        filepath: pathlib.Path,
+        ring_name=None,
+        slot=None,
+        crops_filepath: pathlib.Path = None,
+    ):
         if self.disable_network:
             return
 
@@ -516,8 +855,14 @@ class VisionService:
             # on win convert to linux path
             if sys.platform == "win32":
                 filepath = pathlib.PurePosixPath(filepath)
+                if crops_filepath is not None:
+                    crops_filepath = pathlib.PurePosixPath(crops_filepath)
 
             msg = b"CLF %d %s" % (object_id, bytes(str(filepath), "utf-8"))
+            if slot is not None:
+                msg += b" ring=%s slot=%d" % (bytes(ring_name, "utf-8"), slot)
+            if crops_filepath is not None:
+                msg += b" crops=%s" % bytes(str(crops_filepath), "utf-8")
             logging.info(f'Classification Request: "{str(msg, "utf-8")}"')
             self.tcp_client.send_msg(msg)
 
@@ -530,18 +875,58 @@ class VisionService:
         average_process_time_sec: float,
         pred_low_list: list,
         pred_high_list: list,
+        model_hash: str = None,
     ):
         # find stored image
         item: CollectLoopDataItem
         found_item: CollectLoopDataItem = None
+        self.collect_loop_data_mutex.acquire()
         for item in self.collect_loop_data_list:
             if item.object_id == object_id:
                 found_item = item
+        pending = found_item is None and object_id in self.image_pending_object_id_set
+        if pending:
+            # image still being written, applied by image_written()
+            self.pending_classification_result_dict[object_id] = (
+                predicted_class,
+                probability,
+                uniqueness,
+                average_process_time_sec,
+                pred_low_list,
+                pred_high_list,
+                model_hash,
+            )
+        self.collect_loop_data_mutex.release()
+        if pending:
+            logging.info(f"Classification result for {object_id} pending until written")
+            return
         if found_item is None:
             raise Exception(
                 f"Received classification result for object_id {object_id} which is not not in collect loop"
                 " data list"
             )
+        self.apply_classification_result(
+            found_item,
+            predicted_class,
+            probability,
+            uniqueness,
+            average_process_time_sec,
+            pred_low_list,
+            pred_high_list,
+            model_hash,
+        )
+
+    def apply_classification_result(
+        self,
+        found_item: CollectLoopDataItem,
+        predicted_class: str,
+        probability: float,
+        uniqueness: float,
+        average_process_time_sec: float,
+        pred_low_list: list,
+        pred_high_list: list,
+        model_hash: str = None,
+    ):
         found_item.predicted_class = predicted_class
         found_item.probability = probability
         found_item.uniqueness = uniqueness
@@ -560,6 +945,8 @@ class VisionService:
         data["predicted_class"] = predicted_class
         data["pred_low_list"] = pred_low_list
         data["pred_high_list"] = pred_high_list
+        if model_hash is not None:
+            data["model_hash"] = model_hash
         logging.info(data)
 
         # write json
@@ -588,13 +975,26 @@ class VisionService:
         logging.info(f"Deleting {fp} ...")
         fp.unlink()
 
-        fp = pathlib.Path(found_item.filepath + ".png")
+        fp = pathlib.Path(found_item.filepath + found_item.image_suffix)
         logging.info(f"Deleting {fp} ...")
         fp.unlink()
 
+        if found_item.crops_written:
+            fp = pathlib.Path(
+                found_item.filepath
+                + sorter.classification_service.config.crops_name_suffix
+                + found_item.image_suffix
+            )
+            logging.info(f"Deleting {fp} ...")
+            fp.unlink()
+
     def receive_hour_meter_value(self, hour_meter_sec):
         self.last_received_hour_meter_sec = hour_meter_sec
 
+    def receive_classifier_state(self, state):
+        logging.info(f"Classification service state: {state}")
+        self.last_received_classifier_state = state
+
     def make_object_list(self):
         txt_list = ["Object List"]
         item: CollectLoopDataItem
@@ -0,0 +1,45 @@
+import numpy as np
+
+# plain belt color and part color (BGR)
+belt_color = 90
+part_color = (40, 200, 230)
+
+
+def synthetic_belt_frame(frame_index, part_start_frame_list, speed=12, size=60):
+    """
+    Camera frame of the belt with rectangular parts moving right to left
+
+    Each part enters on the right side at its start frame.
+    """
+    frame = np.full((720, 1280, 3), belt_color, dtype=np.uint8)
+    for start_frame in part_start_frame_list:
+        if frame_index < start_frame:
+            continue
+        x = 1150 - (frame_index - start_frame) * speed
+        if x > 100:
+            frame[500 : 500 + size, x : x + size] = part_color
+    return frame
+
+
+class SyntheticBeltCamera:
+    """
+    Replacement for CameraCapture replaying a generated belt sequence
+    """
+
+    def __init__(self, frame_count, part_start_frame_list, speed=12) -> None:
+        self.frame_count = frame_count
+        self.part_start_frame_list = part_start_frame_list
+        self.speed = speed
+        self.frame_index = 0
+
+    def capture(self):
+        if self.frame_index >= self.frame_count:
+            return None
+        frame = synthetic_belt_frame(
+            self.frame_index, self.part_start_frame_list, self.speed
+        )
+        self.frame_index += 1
+        return frame
+
+    def rewind(self):
+        self.frame_index = 0
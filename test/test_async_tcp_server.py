@@ -0,0 +1,204 @@
+import logging
+import time
+import unittest
+
+import test_helpers
+import test_message_framer
+import test_tcp_server
+
+import sorter.network.async_tcp_server
+import sorter.network.tcp_client
+
+
+def connect_client(name, **kwargs):
+    c = sorter.network.tcp_client.TcpClient(
+        "localhost",
+        5005,
+        name=name,
+        type="client",
+        retry_connection=False,
+        auto_reconnect=False,
+        **kwargs,
+    )
+    c.start()
+    return c
+
+
+class TestAsyncTcpServer(unittest.TestCase, test_helpers.BaseTest):
+    def test_broadcast(self):
+        self.setup_logging()
+
+        s = sorter.network.async_tcp_server.AsyncTcpServer(
+            "0.0.0.0", 5005, test_tcp_server.ExampleCommandHandler
+        )
+        s.start()
+
+        c1 = connect_client("client01")
+        c2 = connect_client("client02", binary_version=1)
+        time.sleep(0.5)
+
+        # names registered
+        self.assertEqual(["client01", "client02"], s.get_handler_name_list())
+        self.assertEqual("client02", s.get_handler_by_name("client02").get_name())
+        self.assertIsNone(s.get_handler_by_name("client03"))
+
+        # line and length prefixed framing
+        for i in range(5):
+            s.broadcast(b"msg %d" % i)
+            time.sleep(0.2)
+            self.assertEqual(c1.get_last_msg(), b"msg %d" % i)
+            self.assertEqual(c2.get_last_msg(), b"msg %d" % i)
+
+        # client disconnecting
+        c1.stop()
+        time.sleep(0.5)
+        self.assertEqual(["client02"], s.get_handler_name_list())
+        self.assertIsNone(s.get_handler_by_name("client01"))
+
+        c2.stop()
+        s.stop()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_2_clients_same_name(self):
+        """
+        2nd client with same name replaces the 1st one
+        """
+        self.setup_logging()
+
+        s = sorter.network.async_tcp_server.AsyncTcpServer(
+            "0.0.0.0", 5005, test_tcp_server.ExampleCommandHandler
+        )
+        s.start()
+
+        c1 = connect_client("client1")
+        time.sleep(0.5)
+        request_handler = s.get_handler_by_name("client1")
+        self.assertFalse(request_handler.get_stopped())
+
+        c2 = connect_client("client1")
+        time.sleep(0.5)
+        self.assertEqual(["client1"], s.get_handler_name_list())
+        self.assertIsNot(request_handler, s.get_handler_by_name("client1"))
+        self.assertTrue(request_handler.get_stopped())
+        self.assertTrue(c2.get_connected())
+
+        c2.stop()
+        c1.stop()
+        s.stop()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_stop_immediately(self):
+        """
+        Stopping with clients connected does not wait for receive timeouts, the
+        clients see the connection closed and the server can be started again
+        """
+        self.setup_logging()
+
+        s = sorter.network.async_tcp_server.AsyncTcpServer(
+            "0.0.0.0", 5005, test_tcp_server.ExampleCommandHandler
+        )
+        s.start()
+        c = sorter.network.tcp_client.TcpClient(
+            "localhost",
+            5005,
+            name="client1",
+            type="client",
+            retry_connection=True,
+            auto_reconnect=True,
+        )
+        c.start()
+        time.sleep(0.5)
+        self.assertTrue(c.get_connected())
+
+        dt_start = time.perf_counter()
+        s.stop()
+        stop_sec = time.perf_counter() - dt_start
+        logging.info(f"Server stopped in {stop_sec * 1000:.1f} ms")
+        self.assertLess(stop_sec, 0.5)
+        time.sleep(0.5)
+        self.assertFalse(c.get_connected())
+
+        # client reconnecting to restarted server
+        s.start()
+        time.sleep(2)
+        self.assertTrue(c.get_connected())
+        self.assertEqual(["client1"], s.get_handler_name_list())
+
+        c.stop()
+        s.stop()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_port_in_use(self):
+        """
+        start() fails instead of waiting for the event loop forever
+        """
+        self.setup_logging()
+
+        s1 = sorter.network.async_tcp_server.AsyncTcpServer(
+            "0.0.0.0", 5005, test_tcp_server.ExampleCommandHandler
+        )
+        s1.start()
+        s2 = sorter.network.async_tcp_server.AsyncTcpServer(
+            "0.0.0.0", 5005, test_tcp_server.ExampleCommandHandler
+        )
+        with self.assertRaises(Exception):
+            s2.start()
+        s2.server_thread.join()
+        s1.stop()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_stress(self):
+        """
+        Thousands of messages per second in both directions, none lost
+        """
+        self.setup_logging()
+
+        s = sorter.network.async_tcp_server.AsyncTcpServer(
+            "0.0.0.0", 5005, test_message_framer.CountingCommandHandler
+        )
+        s.start()
+        c = test_message_framer.CountingTcpClient(
+            "127.0.0.1",
+            5005,
+            name="StressClient",
+            type="StressClient",
+            retry_connection=False,
+            auto_reconnect=False,
+        )
+        c.set_log_received_messages(False)
+        c.start()
+        time.sleep(0.5)
+        handler = s.get_handler_by_name("StressClient")
+
+        message_count = 5000
+        msg_list = [test_message_framer.message(i) for i in range(message_count)]
+        logging.getLogger().disabled = True
+        dt_start = time.perf_counter()
+        for msg in msg_list:
+            c.send_msg(msg)
+            handler.sendall(msg)
+        dt_end = time.monotonic() + 10
+        while (
+            len(c.message_list) < message_count
+            or len(handler.message_list) < message_count
+        ) and time.monotonic() < dt_end:
+            time.sleep(0.01)
+        duration_sec = time.perf_counter() - dt_start
+        logging.getLogger().disabled = False
+        logging.info(f"Both directions: {message_count / duration_sec:.0f} messages/s")
+        self.assertEqual(msg_list, handler.message_list)
+        self.assertEqual(msg_list, c.message_list)
+        self.assertGreater(message_count / duration_sec, 1000)
+
+        c.stop()
+        s.stop()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import synthetic_belt
+import test_helpers
+
+import sorter.vision_service.background_model
+import sorter.vision_service.background_model_benchmark
+
+
+class BackgroundModelTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_all_models_detect_parts(self):
+        """
+        Every background model triggers once per part on the synthetic belt
+        """
+        self.setup_logging()
+
+        bm = sorter.vision_service.background_model_benchmark
+        camera = synthetic_belt.SyntheticBeltCamera(220, [60, 140])
+        result_list = bm.run_benchmark(
+            camera,
+            list(sorter.vision_service.background_model.background_model_class_map),
+            bg_downscale_factor=2,
+        )
+
+        self.assertEqual(5, len(result_list))
+        for result in result_list:
+            self.assertEqual(220, result.frame_count, result.background_model)
+            self.assertEqual(
+                [123, 203], result.trigger_frame_index_list, result.background_model
+            )
+            self.assertEqual(0, result.count_double_object)
+            self.assertIsNotNone(result.ms_per_frame)
+
+        line_list = bm.format_result_table(result_list)
+        self.assertEqual(6, len(line_list))
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_unknown_model(self):
+        """
+        Unknown background model name raises
+        """
+        with self.assertRaises(Exception):
+            sorter.vision_service.background_model.create_background_model("foo")
@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+
+import test_helpers
+
+import sorter.util.bounded_queue as bq
+
+
+class BoundedQueueTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_drop_newest(self):
+        self.setup_logging()
+
+        q = bq.BoundedQueue("test", 2, bq.OverflowPolicy.DROP_NEWEST)
+        self.assertTrue(q.put(1))
+        self.assertTrue(q.put(2))
+        self.assertFalse(q.put(3))
+
+        self.assertEqual(1, q.get())
+        self.assertEqual(2, q.get())
+        self.assertIsNone(q.get(timeout=0.01))
+        self.assertEqual(1, q.get_statistics()["count_dropped"])
+
+    def test_drop_oldest(self):
+        self.setup_logging()
+
+        q = bq.BoundedQueue("test", 2, bq.OverflowPolicy.DROP_OLDEST)
+        for i in range(5):
+            self.assertTrue(q.put(i))
+
+        self.assertEqual(3, q.get())
+        self.assertEqual(4, q.get())
+        self.assertEqual(3, q.get_statistics()["count_dropped"])
+
+    def test_block_never_drops(self):
+        """
+        Slow consumer, producer must wait instead of dropping
+        """
+        self.setup_logging()
+
+        q = bq.BoundedQueue("test", 2, bq.OverflowPolicy.BLOCK)
+        received_list = []
+
+        def consumer_fct():
+            while True:
+                item = q.get()
+                if item is None:
+                    break
+                time.sleep(0.001)
+                received_list.append(item)
+
+        thread = threading.Thread(target=consumer_fct)
+        thread.start()
+        for i in range(100):
+            self.assertTrue(q.put(i))
+        q.close()
+        thread.join()
+
+        self.assertEqual(list(range(100)), received_list)
+        statistics = q.get_statistics()
+        self.assertEqual(0, statistics["count_dropped"])
+        self.assertEqual(2, statistics["max_depth"])
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_close_wakes_blocked_producer(self):
+        self.setup_logging()
+
+        q = bq.BoundedQueue("test", 1, bq.OverflowPolicy.BLOCK)
+        q.put(0)
+        result_list = []
+
+        thread = threading.Thread(target=lambda: result_list.append(q.put(1)))
+        thread.start()
+        time.sleep(0.1)
+        q.close()
+        thread.join()
+
+        self.assertEqual([False], result_list)
+
+        # remaining item still delivered, then end of stream
+        self.assertFalse(q.is_finished())
+        self.assertEqual(0, q.get())
+        self.assertIsNone(q.get())
+        self.assertTrue(q.is_finished())
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
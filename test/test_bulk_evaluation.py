@@ -0,0 +1,158 @@
+import json
+import logging
+import pathlib
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+import test_helpers
+
+import sorter.classification_service.evaluation_report
+
+# run only if tensorflow / jinja2 available
+tensorflow_available = False
+try:
+    import tensorflow as tf
+
+    import sorter.classification_service.bulk_evaluation
+    import sorter.classification_service.classifier
+    import sorter.classification_service.inference_engine
+
+    tensorflow_available = True
+except ImportError:
+    pass
+
+jinja2_available = False
+try:
+    import jinja2  # noqa: F401
+
+    jinja2_available = True
+except ImportError:
+    pass
+
+
+def write_labeled_image(folder, name, object_class, shape=(720, 1280, 3)):
+    fp = pathlib.Path(folder) / f"{name}.png"
+    cv2.imwrite(str(fp), np.full(shape, 128, dtype=np.uint8))
+    with open(fp.with_suffix(".json"), "w") as f:
+        json.dump({"object_class": object_class}, f)
+    return fp
+
+
+class BulkEvaluationTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_list_labeled_images(self):
+        self.setup_logging()
+
+        er = sorter.classification_service.evaluation_report
+        with tempfile.TemporaryDirectory() as folder:
+            (pathlib.Path(folder) / "sub").mkdir()
+            fp_a = write_labeled_image(folder, "train_a", "brick2x")
+            fp_b = write_labeled_image(
+                pathlib.Path(folder) / "sub", "train_b", "plate1x"
+            )
+
+            # crops image and image w/o json
+            write_labeled_image(folder, "train_a_crops", "brick2x", shape=(224, 448, 3))
+            fp_c = pathlib.Path(folder) / "train_c.png"
+            cv2.imwrite(str(fp_c), np.zeros((8, 8, 3), dtype=np.uint8))
+
+            self.assertEqual(
+                [
+                    (str(fp_a), "brick2x"),
+                    (str(fp_c), "unknown"),
+                    (str(fp_b), "plate1x"),
+                ],
+                list(er.list_labeled_images([folder])),
+            )
+
+    def test_write_reports(self):
+        self.setup_logging()
+
+        if not jinja2_available:
+            logging.warning("jinja2 not available - test not run.")
+            return
+
+        er = sorter.classification_service.evaluation_report
+        ev_list = [
+            er.EvaluationItem("a.png", "brick2x", "brick2x", "brick2x", 0.9, 5.0, True),
+            er.EvaluationItem(
+                "b.png", "brick2x", "plate1x", "plate1x", 0.6, 2.0, False
+            ),
+        ]
+        with tempfile.TemporaryDirectory() as folder:
+            statistics_by_label = er.write_reports(
+                iter(ev_list), folder, "model.keras", "Test"
+            )
+            self.assertEqual(["brick2x"], list(statistics_by_label))
+            statistics = statistics_by_label["brick2x"]
+            self.assertEqual(2, statistics.count)
+            self.assertEqual(1, statistics.count_correct)
+            self.assertEqual({"brick2x": 1, "plate1x": 1}, statistics.confusion_dict)
+
+            html = (pathlib.Path(folder) / "evaluation_report.html").read_text()
+            self.assertIn("b.png", html)
+            self.assertIn("(1/2 correct)", html)
+            self.assertNotIn("a.png", html)
+            html_all = (pathlib.Path(folder) / "evaluation_report_all.html").read_text()
+            self.assertIn("a.png", html_all)
+            self.assertEqual(
+                2,
+                len(
+                    (pathlib.Path(folder) / "predictions.jsonl")
+                    .read_text()
+                    .splitlines()
+                ),
+            )
+
+    def test_evaluate(self):
+        """
+        Pipeline gives the same predictions as Classifier.predict_crops
+        """
+        self.setup_logging()
+
+        if not tensorflow_available:
+            logging.warning("Tensorflow not available - test not run.")
+            return
+
+        # classifier w/o model file, small stand-in model
+        input_low = tf.keras.Input(shape=(224, 224, 3))
+        input_high = tf.keras.Input(shape=(224, 224, 3))
+        pooled = tf.keras.layers.Concatenate()(
+            [
+                tf.keras.layers.GlobalAveragePooling2D()(input_low),
+                tf.keras.layers.GlobalAveragePooling2D()(input_high),
+            ]
+        )
+        outputs = tf.keras.layers.Softmax()(tf.keras.layers.Dense(3)(pooled))
+        model = tf.keras.Model(inputs=[input_low, input_high], outputs=outputs)
+        classifier = sorter.classification_service.classifier.Classifier.__new__(
+            sorter.classification_service.classifier.Classifier
+        )
+        classifier.class_list = ["brick2x", "plate1x", "technic"]
+        classifier.inference_engine = (
+            sorter.classification_service.inference_engine.create_inference_engine(
+                "tf_function", model
+            )
+        )
+
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(5):
+                write_labeled_image(folder, f"train_{i}", "brick2x")
+            write_labeled_image(folder, "train_invalid", "brick2x", shape=(8, 8, 3))
+
+            ev_list = list(
+                sorter.classification_service.bulk_evaluation.evaluate(
+                    classifier, [folder], batch_size=2
+                )
+            )
+            self.assertEqual(5, len(ev_list))
+            expected = classifier.predict_crops(*classifier.load_crops(ev_list[0].fp))
+            for ev in ev_list:
+                self.assertEqual("brick2x", ev.label_class)
+                self.assertEqual(expected.predicted_class, ev.predicted_class)
+                self.assertAlmostEqual(expected.probability, ev.probability, places=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+
+import test_helpers
+
+import sorter.classification_service.classification_result_codec as crc
+
+
+def result_message(**kwargs):
+    class_list = ["brick_2x4", "plate_1x1", "tile_2_2"]
+    param_dict = {
+        "object_id": 42,
+        "predicted_class": "plate_1x1",
+        "probability": 0.875,
+        "uniqueness": 12.5,
+        "average_process_time_sec": 0.25,
+        "low_list": [
+            {"class": "plate_1x1", "probability": 0.875},
+            {"class": "brick_2x4", "probability": 0.125},
+        ],
+        "high_list": [{"class": "plate_1x1", "probability": 0.5}],
+        "model_hash": "abc123",
+        "class_list": class_list,
+    }
+    param_dict.update(kwargs)
+    return crc.ClassificationResultMessage(**param_dict)
+
+
+class ClassificationResultCodecTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_round_trip(self):
+        """
+        Text and binary decode to the same result, incl. skip, inconsistent and
+        classes with underscores
+        """
+        self.setup_logging()
+
+        for m in [
+            result_message(),
+            result_message(predicted_class="skip", low_list=[], high_list=[]),
+            result_message(
+                predicted_class="inc_plate_1x1_tile_2_2",
+                high_list=[{"class": "tile_2_2", "probability": 0.5}],
+            ),
+            result_message(
+                low_list=[{"class": "-", "probability": 0.0}],
+                high_list=[{"class": "skip", "probability": 0.0}],
+            ),
+            result_message(average_process_time_sec=None, model_hash=None),
+        ]:
+            text = crc.decode_text(crc.encode_text(m))
+            text.class_list = m.class_list
+            self.assertEqual(m, text)
+
+            binary = crc.encode_binary(m)
+            self.assertIsNotNone(binary)
+            self.assertLess(len(binary), len(crc.encode_text(m)))
+            list_id = crc.class_list_id(m.class_list)
+            self.assertEqual(m, crc.decode_binary(binary, {list_id: m.class_list}))
+
+    def test_not_representable(self):
+        """
+        Results the binary format can not express fall back to text
+        """
+        self.setup_logging()
+
+        codec = crc.ClassificationResultCodec(crc.binary_version)
+        self.assertTrue(codec.binary)
+        for m in [
+            result_message(class_list=None),
+            result_message(predicted_class="unknown"),
+            result_message(low_list=[{"class": "unknown", "probability": 1.0}]),
+        ]:
+            self.assertIsNone(crc.encode_binary(m))
+            msg_list = codec.encode(m)
+            self.assertEqual(1, len(msg_list))
+            self.assertTrue(msg_list[0].startswith(b"CLR "))
+
+    def test_class_list_announced(self):
+        """
+        CLL before the first binary result and again after a reconnect
+        """
+        self.setup_logging()
+
+        sender = crc.ClassificationResultCodec(crc.binary_version)
+        receiver = crc.ClassificationResultCodec(crc.binary_version)
+        m = result_message()
+
+        msg_list = sender.encode(m)
+        self.assertEqual([b"CLL", b"CLB"], [msg[:3] for msg in msg_list])
+        self.assertEqual([b"CLB"], [msg[:3] for msg in sender.encode(m)])
+        self.assertEqual([None, m], [receiver.decode(msg) for msg in msg_list])
+
+        sender.reset()
+        self.assertEqual([b"CLL", b"CLB"], [msg[:3] for msg in sender.encode(m)])
+
+        # result of a class list never announced
+        with self.assertRaises(ValueError):
+            crc.ClassificationResultCodec(crc.binary_version).decode(msg_list[1])
+        with self.assertRaises(ValueError):
+            receiver.decode(msg_list[1][:-5])
+
+    def test_text_only(self):
+        """
+        Connections w/o (supported) binary version keep text
+        """
+        self.setup_logging()
+
+        for version in [None, 999]:
+            codec = crc.ClassificationResultCodec(version)
+            self.assertFalse(codec.binary)
+            self.assertEqual(
+                [b"CLR"], [msg[:3] for msg in codec.encode(result_message())]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
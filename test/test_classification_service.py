@@ -1,5 +1,6 @@
-# All ClassificationService Tests are currently deactivated since there is no
-# public version of the test data available yet.
+# Recording based ClassificationService Tests are currently deactivated since there
+# is no public version of the test data available yet. The batching test at the end
+# of the file runs without CNN.
 
 # import logging
 # import sys
@@ -81,3 +82,331 @@
 #         time.sleep(0.5)
 
 #         test_helpers.BaseTest.assert_threads_stopped(self)
+
+
+import datetime
+import logging
+import pathlib
+import tempfile
+import time
+import unittest
+
+import test_helpers
+
+import sorter.classification_service.classification_result
+import sorter.classification_service.classification_result_codec as crc
+import sorter.classification_service.classification_service
+import sorter.classification_service.config
+import sorter.network.tcp_server
+
+
+class ResultCommandHandler(sorter.network.tcp_server.RequestHandler):
+    def __init__(self, request, client_address, server) -> None:
+        self.result_object_id_list = []
+        self.result_class_list = []
+        self.state_list = []
+        self.clr_codec = crc.ClassificationResultCodec()
+        super().__init__(request, client_address, server)
+
+    def process_custom_command(self, message):
+        command = message[:3]
+
+        # CLR - Classification Result, binary (CLB) with class list (CLL)
+        if crc.is_classification_result(message):
+            result = self.clr_codec.decode(message)
+            if result is not None:
+                self.result_object_id_list.append(result.object_id)
+                self.result_class_list.append(result.predicted_class)
+
+        elif command == b"NTF":
+            logging.info(f"Received notification command: {message}")
+
+        # CSS - Classification Service State
+        elif command == b"CSS":
+            self.state_list.append(str(message, "utf-8").split(" ")[1])
+
+        else:
+            raise Exception("Received unsupported command: " "%s" "" % command)
+
+
+class SwappedClassifier:
+    """
+    Model swapped in after preprocessing, w/o TensorFlow, fails on "corrupt" images
+    """
+
+    model_hash = "swapped"
+    class_list = ["brick2x", "plate1x"]
+
+    @staticmethod
+    def read_image(img_fp: str):
+        return img_fp
+
+    @staticmethod
+    def crop_pair(ocv_img):
+        return ocv_img, ocv_img
+
+    def predict_probability_batch(self, crop_pair_list: list) -> list:
+        if any("corrupt" in crop_pair[0] for crop_pair in crop_pair_list):
+            raise Exception("Corrupt image")
+        return [[0.9, 0.1] for _ in crop_pair_list]
+
+    def pred_list(self, probability_list):
+        return [
+            {"class": c, "probability": p}
+            for c, p in zip(self.class_list, probability_list)
+        ]
+
+    def classification_result(self, pred_low_list):
+        return sorter.classification_service.classification_result.ClassificationResult(
+            predicted_class=pred_low_list[0]["class"],
+            predicted_class_high=pred_low_list[0]["class"],
+            probability=pred_low_list[0]["probability"],
+            uniqueness=9.0,
+            prediction_list=pred_low_list,
+            label_data=None,
+            low_list=pred_low_list,
+            high_list=pred_low_list,
+        )
+
+
+class ClassificationServiceBatchTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_batching(self):
+        """
+        Burst of requests classified in batches, one result per request
+        """
+        self.setup_logging()
+
+        s = sorter.network.tcp_server.TcpServer("0.0.0.0", 5005, ResultCommandHandler)
+        s.start()
+        time.sleep(1)
+
+        cs = sorter.classification_service.classification_service.ClassificationService(
+            host="127.0.0.1",
+            enable_cnn=False,
+            model_fp=None,
+            max_batch_size=4,
+            max_batch_wait_ms=200,
+        )
+        time.sleep(1)
+
+        data_dir_path = sorter.classification_service.config.data_dir_path
+        with tempfile.TemporaryDirectory(dir=data_dir_path) as folder:
+            for object_id in range(6):
+                fp = pathlib.Path(folder) / f"obj_{object_id}.png"
+                fp.touch()
+                cs.add_queue(object_id, str(fp.relative_to(data_dir_path)))
+
+            # dummy classification takes 1.2s per batch
+            dt_end = time.monotonic() + 10
+            handler = s.get_handler_list()[0]
+            while len(handler.result_object_id_list) < 6 and time.monotonic() < dt_end:
+                time.sleep(0.1)
+
+        self.assertEqual(list(range(6)), handler.result_object_id_list)
+        self.assertEqual(["ready"], handler.state_list)
+        statistics = cs.get_statistics()
+        self.assertEqual(2, statistics["count_batch"])
+        self.assertEqual(4, statistics["max_batch_size"])
+        self.assertGreater(statistics["max_latency_ms"], 1200)
+        self.assertEqual(6, statistics["stage"]["queue_wait"]["count"])
+        self.assertEqual(2, statistics["stage"]["inference"]["count"])
+        self.assertGreater(statistics["stage"]["inference"]["p50_ms"], 1000)
+        self.assertEqual(6, statistics["stage"]["send"]["count"])
+
+        cs.stop()
+        s.stop()
+        time.sleep(0.5)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_pipelining(self):
+        """
+        Next request loaded while the previous one is on the model
+        """
+        self.setup_logging()
+
+        s = sorter.network.tcp_server.TcpServer("0.0.0.0", 5005, ResultCommandHandler)
+        s.start()
+        time.sleep(1)
+
+        cs = sorter.classification_service.classification_service.ClassificationService(
+            host="127.0.0.1",
+            enable_cnn=False,
+            model_fp=None,
+        )
+        time.sleep(1)
+
+        data_dir_path = sorter.classification_service.config.data_dir_path
+        with tempfile.TemporaryDirectory(dir=data_dir_path) as folder:
+            fp_list = [pathlib.Path(folder) / f"obj_{i}.png" for i in range(2)]
+            fp_list[0].touch()
+            for object_id, fp in enumerate(fp_list):
+                cs.add_queue(object_id, str(fp.relative_to(data_dir_path)))
+
+            # image of request 1 written during classification of request 0
+            time.sleep(0.6)
+            fp_list[1].touch()
+
+            # dummy classification takes 1.2s per batch
+            dt_end = time.monotonic() + 10
+            handler = s.get_handler_list()[0]
+            while len(handler.result_object_id_list) < 2 and time.monotonic() < dt_end:
+                time.sleep(0.1)
+
+        self.assertEqual([0, 1], handler.result_object_id_list)
+        statistics = cs.get_statistics()
+        self.assertEqual(2, statistics["count_batch"])
+        self.assertGreater(statistics["overlap"]["overlap_sec"], 0.3)
+        self.assertGreater(statistics["overlap"]["overlap_ratio"], 0.5)
+
+        cs.stop()
+        s.stop()
+        time.sleep(0.5)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_preprocessing_failed(self):
+        """
+        Request w/o image skipped, results stay in request order although the next
+        request is preprocessed first by another thread
+        """
+        self.setup_logging()
+
+        s = sorter.network.tcp_server.TcpServer("0.0.0.0", 5005, ResultCommandHandler)
+        s.start()
+        time.sleep(1)
+
+        cs = sorter.classification_service.classification_service.ClassificationService(
+            host="127.0.0.1",
+            enable_cnn=False,
+            model_fp=None,
+        )
+        time.sleep(1)
+
+        data_dir_path = sorter.classification_service.config.data_dir_path
+        with tempfile.TemporaryDirectory(dir=data_dir_path) as folder:
+            fp_list = [pathlib.Path(folder) / f"obj_{i}.png" for i in range(2)]
+            fp_list[1].touch()
+            for object_id, fp in enumerate(fp_list):
+                cs.add_queue(object_id, str(fp.relative_to(data_dir_path)))
+
+            # image of request 0 waited for 5s, dummy classification takes 1.2s
+            dt_end = time.monotonic() + 15
+            handler = s.get_handler_list()[0]
+            while len(handler.result_object_id_list) < 2 and time.monotonic() < dt_end:
+                time.sleep(0.1)
+
+        self.assertEqual([0, 1], handler.result_object_id_list)
+        self.assertEqual(1, cs.get_statistics()["count_batch"])
+        self.assertEqual(0, cs.stage_overlap.active_count_dict["preprocess"])
+
+        cs.stop()
+        s.stop()
+        time.sleep(0.5)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_inference_failed(self):
+        """
+        Model swapped between preprocessing and inference, cache hit w/o image and
+        batch failing in the model are skipped, the inference thread keeps running
+        """
+        self.setup_logging()
+
+        s = sorter.network.tcp_server.TcpServer("0.0.0.0", 5005, ResultCommandHandler)
+        s.start()
+        time.sleep(1)
+
+        cs = sorter.classification_service.classification_service.ClassificationService(
+            host="127.0.0.1",
+            enable_cnn=False,
+            model_fp=None,
+        )
+        time.sleep(1)
+        cs.enable_cnn = True
+        cs.classifier = SwappedClassifier()
+
+        data_dir_path = sorter.classification_service.config.data_dir_path
+        with tempfile.TemporaryDirectory(dir=data_dir_path) as folder:
+            fp_list = [
+                pathlib.Path(folder) / fn
+                for fn in ["obj_0.png", "obj_1.png", "corrupt_2.png", "obj_3.png"]
+            ]
+            for fp in fp_list[1:]:
+                fp.touch()
+            queue_item_list = [
+                sorter.classification_service.classification_service.QueueItem(
+                    object_id=object_id,
+                    img_filepath=str(fp.relative_to(data_dir_path)),
+                )
+                for object_id, fp in enumerate(fp_list)
+            ]
+
+            # cache hits of the previous model, image of request 0 gone
+            cs.inference_queue.put(
+                sorter.classification_service.classification_service.PreparedBatch(
+                    queue_item_list=queue_item_list[:2],
+                    crop_pair_list=[None, None],
+                    image_hash_list=[None, None],
+                    probability_list_list=[[0.2, 0.8], [0.2, 0.8]],
+                    model_hash="previous",
+                    dt_start=datetime.datetime.now(),
+                )
+            )
+            for queue_item in queue_item_list[2:]:
+                cs.inference_queue.put(cs.preprocess([queue_item]))
+
+            # image of request 0 waited for 5s
+            dt_end = time.monotonic() + 15
+            handler = s.get_handler_list()[0]
+            while len(handler.result_object_id_list) < 4 and time.monotonic() < dt_end:
+                time.sleep(0.1)
+
+        self.assertEqual([0, 1, 2, 3], handler.result_object_id_list)
+        self.assertEqual(
+            ["skip", "brick2x", "skip", "brick2x"], handler.result_class_list
+        )
+        self.assertEqual(0, cs.stage_overlap.active_count_dict["inference"])
+
+        cs.stop()
+        s.stop()
+        time.sleep(0.5)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_loading_failed(self):
+        """
+        Connected and reporting loading before the model is loaded, requests are
+        skipped if loading fails
+        """
+        self.setup_logging()
+
+        s = sorter.network.tcp_server.TcpServer("0.0.0.0", 5005, ResultCommandHandler)
+        s.start()
+        time.sleep(1)
+
+        cs = sorter.classification_service.classification_service.ClassificationService(
+            host="127.0.0.1",
+            enable_cnn=True,
+            model_fp=pathlib.Path("models/not_existing.keras"),
+        )
+        cs.add_queue(0, "not_existing.png")
+
+        dt_end = time.monotonic() + 30
+        handler = None
+        while time.monotonic() < dt_end:
+            if len(s.get_handler_list()) > 0:
+                handler = s.get_handler_list()[0]
+                if len(handler.result_object_id_list) > 0:
+                    break
+            time.sleep(0.1)
+
+        self.assertEqual(["loading", "failed"], handler.state_list)
+        self.assertEqual([0], handler.result_object_id_list)
+        self.assertEqual("failed", cs.get_statistics()["state"])
+
+        cs.stop()
+        s.stop()
+        time.sleep(0.5)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
@@ -0,0 +1,43 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import test_helpers
+
+import sorter.util.file_hash
+
+
+class FileHashTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_cached_file_hash(self):
+        self.setup_logging()
+
+        with tempfile.TemporaryDirectory() as folder:
+            fp = pathlib.Path(folder) / "model.keras"
+            cache_fp = pathlib.Path(folder) / "hash_cache.json"
+            fp.write_bytes(b"model v1")
+            hash_v1 = sorter.util.file_hash.file_hash(fp)
+
+            self.assertEqual(
+                hash_v1, sorter.util.file_hash.cached_file_hash(fp, cache_fp)
+            )
+            self.assertTrue(cache_fp.exists())
+
+            # same size and mtime -> cached value, even though content differs
+            stat = os.stat(fp)
+            fp.write_bytes(b"model v2")
+            os.utime(fp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            self.assertEqual(
+                hash_v1, sorter.util.file_hash.cached_file_hash(fp, cache_fp)
+            )
+
+            # changed mtime -> re-hashed
+            os.utime(fp, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+            self.assertEqual(
+                sorter.util.file_hash.file_hash(fp),
+                sorter.util.file_hash.cached_file_hash(fp, cache_fp),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
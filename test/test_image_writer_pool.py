@@ -0,0 +1,134 @@
+import json
+import os
+import pathlib
+import tempfile
+import time
+import unittest
+
+import cv2
+import numpy as np
+import synthetic_belt
+import test_helpers
+
+import sorter.vision_service.image_writer_pool
+
+
+class ImageWriterPoolTest(unittest.TestCase, test_helpers.BaseTest):
+    def write_and_check(self, image_format, png_compression=None):
+        frame = synthetic_belt.synthetic_belt_frame(80, [60])
+        written_list = []
+
+        def on_written(job):
+            # complete files at callback time, no temporary files left
+            fp = pathlib.Path(str(job.fp_wo_suffix) + job.image_suffix)
+            np.testing.assert_array_equal(frame, cv2.imread(str(fp)))
+            with open(str(job.fp_wo_suffix) + ".json") as f:
+                self.assertEqual(job.object_id, json.load(f)["object_id"])
+            written_list.append(job.object_id)
+
+        with tempfile.TemporaryDirectory() as folder:
+            pool = sorter.vision_service.image_writer_pool.ImageWriterPool(
+                worker_count=2,
+                max_queue_size=2,
+                image_format=image_format,
+                png_compression=png_compression,
+            )
+            pool.start()
+            for object_id in range(6):
+                pool.submit(
+                    sorter.vision_service.image_writer_pool.ImageWriteJob(
+                        object_id=object_id,
+                        fp_wo_suffix=pathlib.Path(folder) / "sub" / f"obj_{object_id}",
+                        frame=frame,
+                        json_data={"object_id": object_id},
+                        on_written=on_written,
+                    )
+                )
+            pool.stop()
+
+            self.assertEqual(list(range(6)), written_list)
+            fn_list = os.listdir(os.path.join(folder, "sub"))
+            self.assertEqual(12, len(fn_list))
+            self.assertFalse(any(fn.endswith(".tmp") for fn in fn_list))
+
+            statistics = pool.get_statistics()
+            self.assertEqual(6, statistics["count_written"])
+            self.assertEqual(0, statistics["count_failed"])
+            self.assertLessEqual(statistics["queue_max_depth"], 2)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_png(self):
+        """
+        Lossless PNG, files complete before callback, callbacks in order
+        """
+        self.setup_logging()
+        self.write_and_check("png", png_compression=1)
+
+    def test_webp(self):
+        """
+        Lossless WebP, files complete before callback
+        """
+        self.setup_logging()
+        self.write_and_check("webp")
+
+    def test_callbacks(self):
+        """
+        Callbacks in order incl. failed writes, writing continues during a slow
+        callback
+        """
+        self.setup_logging()
+
+        frame = synthetic_belt.synthetic_belt_frame(80, [60])
+        callback_list = []
+        pool = sorter.vision_service.image_writer_pool.ImageWriterPool(worker_count=2)
+
+        def on_written(job):
+            if job.object_id == 0:
+                time.sleep(1.0)
+                callback_list.append(("written during", count_written()))
+            callback_list.append(("written", job.object_id))
+
+        def on_failed(job):
+            callback_list.append(("failed", job.object_id))
+
+        def count_written():
+            statistics = pool.get_statistics()
+            return statistics["count_written"] + statistics["count_failed"]
+
+        with tempfile.TemporaryDirectory() as folder:
+            pool.start()
+            for object_id in range(6):
+                pool.submit(
+                    sorter.vision_service.image_writer_pool.ImageWriteJob(
+                        object_id=object_id,
+                        fp_wo_suffix=pathlib.Path(folder) / f"obj_{object_id}",
+                        frame=frame if object_id != 2 else None,  # not encodable
+                        on_written=on_written,
+                        on_failed=on_failed,
+                    )
+                )
+            pool.stop()
+
+        self.assertEqual(
+            [
+                ("written during", 6),
+                ("written", 0),
+                ("written", 1),
+                ("failed", 2),
+                ("written", 3),
+                ("written", 4),
+                ("written", 5),
+            ],
+            callback_list,
+        )
+        self.assertEqual(1, pool.get_statistics()["count_failed"])
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_unknown_format(self):
+        """
+        Unknown image format raises
+        """
+        with self.assertRaises(Exception):
+            sorter.vision_service.image_writer_pool.ImageWriterPool(image_format="bmp")
@@ -0,0 +1,227 @@
+import json
+import logging
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+import test_helpers
+
+# run only if tensorflow available
+tensorflow_available = False
+try:
+    import tensorflow as tf
+
+    import sorter.classification_service.classifier
+    import sorter.classification_service.inference_engine
+    import sorter.classification_service.tflite_export
+    import sorter.util.file_hash
+
+    tensorflow_available = True
+except ImportError:
+    pass
+
+if tensorflow_available:
+
+    def two_crop_softmax_model(class_count=4):
+        """
+        Small stand-in for the classification model: two crop inputs, softmax output
+        """
+        input_low = tf.keras.Input(shape=(224, 224, 3))
+        input_high = tf.keras.Input(shape=(224, 224, 3))
+        pooled = tf.keras.layers.Concatenate()(
+            [
+                tf.keras.layers.GlobalAveragePooling2D()(input_low),
+                tf.keras.layers.GlobalAveragePooling2D()(input_high),
+            ]
+        )
+        outputs = tf.keras.layers.Softmax()(tf.keras.layers.Dense(class_count)(pooled))
+        return tf.keras.Model(inputs=[input_low, input_high], outputs=outputs)
+
+
+class InferenceEngineTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_tf_function_same_as_keras(self):
+        """
+        Traced engine gives the Keras results for batch sizes 1 and 3
+        """
+        self.setup_logging()
+
+        if not tensorflow_available:
+            logging.warning("Tensorflow not available - test not run.")
+            return
+
+        ie = sorter.classification_service.inference_engine
+        model = two_crop_softmax_model()
+        keras_engine = ie.create_inference_engine("keras", model)
+        tf_function_engine = ie.create_inference_engine("tf_function", model)
+        tf_function_engine.warm_up((1, 3))
+
+        rng = np.random.default_rng(0)
+        for batch_size in [1, 3]:
+            shape = (batch_size, 224, 224, 3)
+            batch_low = rng.integers(0, 256, shape, dtype=np.uint8)
+            batch_high = rng.integers(0, 256, shape, dtype=np.uint8)
+            np.testing.assert_allclose(
+                keras_engine.predict(batch_low, batch_high),
+                tf_function_engine.predict(batch_low, batch_high),
+                rtol=1e-5,
+            )
+
+    def test_tflite_export(self):
+        """
+        Exported TFLite model classifies like the Keras model, batch sizes 1 and 3
+        """
+        self.setup_logging()
+
+        if not tensorflow_available:
+            logging.warning("Tensorflow not available - test not run.")
+            return
+
+        # model saved like a trained one: logits output (list), json next to it
+        input_low = tf.keras.Input(shape=(224, 224, 3))
+        input_high = tf.keras.Input(shape=(224, 224, 3))
+        pooled = tf.keras.layers.Concatenate()(
+            [
+                tf.keras.layers.GlobalAveragePooling2D()(input_low),
+                tf.keras.layers.GlobalAveragePooling2D()(input_high),
+            ]
+        )
+        logits = tf.keras.layers.Dense(3)(pooled)
+        model = tf.keras.Model(inputs=[input_low, input_high], outputs=[logits])
+
+        with tempfile.TemporaryDirectory() as folder:
+            model_fp = pathlib.Path(folder) / "model.keras"
+            model.save(model_fp)
+            with open(model_fp.with_suffix(".json"), "w") as f:
+                json.dump(
+                    {
+                        "label_name_list": ["brick2x", "plate1x", "technic"],
+                        "model_hash": sorter.util.file_hash.file_hash(model_fp),
+                    },
+                    f,
+                )
+
+            tflite_fp = sorter.classification_service.tflite_export.export_tflite(
+                model_fp, quantization="dynamic"
+            )
+            self.assertEqual("model_dynamic.tflite", tflite_fp.name)
+
+            Classifier = sorter.classification_service.classifier.Classifier
+            keras_classifier = Classifier(model_fp)
+            tflite_classifier = Classifier(tflite_fp, intra_op_threads=2)
+
+            rng = np.random.default_rng(0)
+            for batch_size in [1, 3]:
+                shape = (batch_size, 224, 224, 3)
+                crop_pair_list = list(
+                    zip(
+                        rng.integers(0, 256, shape, dtype=np.uint8),
+                        rng.integers(0, 256, shape, dtype=np.uint8),
+                    )
+                )
+                keras_cr_list = keras_classifier.predict_crops_batch(crop_pair_list)
+                tflite_cr_list = tflite_classifier.predict_crops_batch(crop_pair_list)
+                self.assertEqual(batch_size, len(tflite_cr_list))
+                for keras_cr, tflite_cr in zip(keras_cr_list, tflite_cr_list):
+                    self.assertAlmostEqual(
+                        keras_cr.probability, tflite_cr.probability, places=1
+                    )
+
+    def test_cascade(self):
+        """
+        Confident first stage answers alone, uncertain one escalates to the full model
+        """
+        self.setup_logging()
+
+        if not tensorflow_available:
+            logging.warning("Tensorflow not available - test not run.")
+            return
+
+        label_name_list = ["brick2x", "plate1x", "technic"]
+
+        def save_model(model_fp, model):
+            model.save(model_fp)
+            with open(model_fp.with_suffix(".json"), "w") as f:
+                json.dump(
+                    {
+                        "label_name_list": label_name_list,
+                        "model_hash": sorter.util.file_hash.file_hash(model_fp),
+                    },
+                    f,
+                )
+
+        def first_stage_model(bias_list):
+            """
+            Low crop only, constant logits
+            """
+            input_low = tf.keras.Input(shape=(224, 224, 3))
+            dense = tf.keras.layers.Dense(
+                len(bias_list),
+                kernel_initializer="zeros",
+                bias_initializer=tf.keras.initializers.Constant(bias_list),
+            )
+            logits = dense(tf.keras.layers.GlobalAveragePooling2D()(input_low))
+            return tf.keras.Model(inputs=input_low, outputs=[logits])
+
+        with tempfile.TemporaryDirectory() as folder:
+            input_low = tf.keras.Input(shape=(224, 224, 3))
+            input_high = tf.keras.Input(shape=(224, 224, 3))
+            pooled = tf.keras.layers.Concatenate()(
+                [
+                    tf.keras.layers.GlobalAveragePooling2D()(input_low),
+                    tf.keras.layers.GlobalAveragePooling2D()(input_high),
+                ]
+            )
+            logits = tf.keras.layers.Dense(3)(pooled)
+            model_fp = pathlib.Path(folder) / "model.keras"
+            save_model(
+                model_fp,
+                tf.keras.Model(inputs=[input_low, input_high], outputs=[logits]),
+            )
+            confident_fp = pathlib.Path(folder) / "confident.keras"
+            save_model(confident_fp, first_stage_model([10.0, 0.0, 0.0]))
+            uncertain_fp = pathlib.Path(folder) / "uncertain.keras"
+            save_model(uncertain_fp, first_stage_model([0.0, 0.0, 0.0]))
+
+            rng = np.random.default_rng(0)
+            shape = (3, 224, 224, 3)
+            crop_pair_list = list(
+                zip(
+                    rng.integers(0, 256, shape, dtype=np.uint8),
+                    rng.integers(0, 256, shape, dtype=np.uint8),
+                )
+            )
+
+            Classifier = sorter.classification_service.classifier.Classifier
+            full_classifier = Classifier(model_fp)
+            self.assertIsNone(full_classifier.get_statistics())
+            full_probability_list = full_classifier.predict_probability_batch(
+                crop_pair_list
+            )
+
+            # all parts answered by the first stage
+            confident_classifier = Classifier(
+                model_fp, first_stage_model_fp=confident_fp
+            )
+            cr_list = confident_classifier.predict_crops_batch(crop_pair_list)
+            self.assertEqual(["brick2x"] * 3, [cr.predicted_class for cr in cr_list])
+            statistics = confident_classifier.get_statistics()
+            self.assertEqual(3, statistics["count_first_stage"])
+            self.assertEqual(1.0, statistics["first_stage_hit_rate"])
+            self.assertIsNone(statistics["saved_ms"])
+
+            # all parts escalated, results of the full model
+            uncertain_classifier = Classifier(
+                model_fp, first_stage_model_fp=uncertain_fp
+            )
+            np.testing.assert_allclose(
+                full_probability_list,
+                uncertain_classifier.predict_probability_batch(crop_pair_list),
+                rtol=1e-5,
+            )
+            statistics = uncertain_classifier.get_statistics()
+            self.assertEqual(3, statistics["count_escalated"])
+            self.assertEqual(0.0, statistics["first_stage_hit_rate"])
+            self.assertNotEqual(
+                full_classifier.model_hash, uncertain_classifier.model_hash
+            )
@@ -0,0 +1,44 @@
+import unittest
+
+import test_helpers
+
+import sorter.util.latency_histogram
+
+
+class LatencyHistogramTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_percentiles(self):
+        self.setup_logging()
+
+        histogram = sorter.util.latency_histogram.LatencyHistogram()
+        self.assertEqual(0.0, histogram.percentile(50))
+
+        # 1..100ms
+        for i in range(1, 101):
+            histogram.record(i / 1000.0)
+
+        statistics = histogram.get_statistics()
+        self.assertEqual(100, statistics["count"])
+        self.assertAlmostEqual(50.5, statistics["mean_ms"])
+        self.assertEqual(100.0, statistics["max_ms"])
+
+        # accurate to the bucket resolution
+        self.assertGreater(statistics["p50_ms"], 30.0)
+        self.assertLess(statistics["p50_ms"], 75.0)
+        self.assertGreater(statistics["p95_ms"], 75.0)
+        self.assertLessEqual(statistics["p99_ms"], 100.0)
+        self.assertLessEqual(statistics["p50_ms"], statistics["p95_ms"])
+        self.assertLessEqual(statistics["p95_ms"], statistics["p99_ms"])
+
+    def test_overflow_bucket(self):
+        self.setup_logging()
+
+        histogram = sorter.util.latency_histogram.LatencyHistogram([1.0, 10.0])
+        histogram.record(0.5)
+        histogram.record(0.5)
+        # open last bucket bounded by the maximum
+        self.assertGreater(histogram.percentile(50), 10.0)
+        self.assertEqual(500.0, histogram.percentile(100))
+
+
+if __name__ == "__main__":
+    unittest.main()
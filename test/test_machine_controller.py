@@ -3,10 +3,36 @@ import unittest
 
 import test_helpers
 
+import sorter.classification_service.classification_result_codec as crc
+import sorter.classification_service.classification_service
 import sorter.controller.machine_controller
+import sorter.network.stats_client
 import sorter.network.tcp_client
 
 
+class RecordingTcpClient(sorter.network.tcp_client.TcpClient):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.object_id_list = []
+        self.reload_list = []
+
+    def event_msg_received(self, msg):
+        for m in msg.strip().split(b"\n"):
+            if m.startswith(b"RLD"):
+                self.reload_list.append(m.split(b" ")[1])
+            else:
+                self.object_id_list.append(int(m.split(b" ")[1]))
+
+
+class MessageListTcpClient(sorter.network.tcp_client.TcpClient):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.message_list = []
+
+    def event_msg_received(self, msg):
+        self.message_list.append(msg)
+
+
 class MachineControllerTest(unittest.TestCase, test_helpers.BaseTest):
     def test_tcp_busy_command(self):
         """
@@ -119,6 +145,308 @@ class MachineControllerTest(unittest.TestCase, test_helpers.BaseTest):
 
         test_helpers.BaseTest.assert_threads_stopped(self)
 
+    def test_classification_worker_pool(self):
+        """
+        CLF, load-balanced between two classification services of one pool, in-flight
+        requests re-dispatched when a service disconnects
+        """
+        self.setup_logging()
+
+        # server
+        mc = sorter.controller.machine_controller.MachineController(
+            enable_device=False, enable_belt=False, disable_server=False, enable_vf=True
+        )
+        mc.start_control_thread()
+        time.sleep(0.5)
+
+        # clients
+        vision_service = sorter.network.tcp_client.TcpClient(
+            "127.0.0.1",
+            5005,
+            name="VisionService",
+            type="VisionService",
+            retry_connection=False,
+            auto_reconnect=False,
+        )
+        vision_service.start()
+        time.sleep(0.5)
+        worker_list = []
+        for i in range(2):
+            worker = RecordingTcpClient(
+                "127.0.0.1",
+                5005,
+                name=f"ClassificationService-{i}",
+                type="ClassificationService",
+                retry_connection=False,
+                auto_reconnect=False,
+                pool="ClassificationService",
+            )
+            worker.start()
+            worker_list.append(worker)
+            time.sleep(0.5)
+
+        # send CLF to server, result for id 0 already back
+        for object_id in range(4):
+            vision_service.send_msg(b"CLF %d image_%d.png" % (object_id, object_id))
+            time.sleep(0.2)
+        vision_service.send_msg(b"CLR 0 skip 0.0 0.0 0.0 [] []")
+        time.sleep(0.5)
+
+        # requests alternate between the services
+        self.assertEqual([0, 2], worker_list[0].object_id_list)
+        self.assertEqual([1, 3], worker_list[1].object_id_list)
+
+        # in-flight request 2 of the 1st service moves to the 2nd
+        worker_list[0].stop()
+        time.sleep(1.5)
+        self.assertEqual([1, 3, 2], worker_list[1].object_id_list)
+
+        # stop network
+        worker_list[1].stop()
+        vision_service.stop()
+        mc.stop_control_thread()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_reload_request(self):
+        """
+        RLD, model reload forwarded to all services of the pool
+        """
+        self.setup_logging()
+
+        # server
+        mc = sorter.controller.machine_controller.MachineController(
+            enable_device=False, enable_belt=False, disable_server=False, enable_vf=True
+        )
+        mc.start_control_thread()
+        time.sleep(0.5)
+
+        # clients
+        worker_list = []
+        for i in range(2):
+            worker = RecordingTcpClient(
+                "127.0.0.1",
+                5005,
+                name=f"ClassificationService-{i}",
+                type="ClassificationService",
+                retry_connection=False,
+                auto_reconnect=False,
+                pool="ClassificationService",
+            )
+            worker.start()
+            worker_list.append(worker)
+        reload_client = sorter.network.tcp_client.TcpClient(
+            "127.0.0.1",
+            5005,
+            name="ReloadClient",
+            type="ReloadClient",
+            retry_connection=False,
+            auto_reconnect=False,
+        )
+        reload_client.start()
+        time.sleep(0.5)
+
+        reload_client.send_msg(b"RLD ClassificationService models/new.keras")
+        time.sleep(0.5)
+        for worker in worker_list:
+            self.assertEqual([b"models/new.keras"], worker.reload_list)
+
+        # stop network
+        reload_client.stop()
+        for worker in worker_list:
+            worker.stop()
+        mc.stop_control_thread()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_classification_result_encoding(self):
+        """
+        CLR/CLB, results forwarded in the format each client negotiated at HLO
+        """
+        for async_server in [False, True]:
+            with self.subTest(async_server=async_server):
+                self.run_classification_result_encoding(async_server)
+
+    def run_classification_result_encoding(self, async_server):
+        self.setup_logging()
+
+        # server
+        mc = sorter.controller.machine_controller.MachineController(
+            enable_device=False,
+            enable_belt=False,
+            disable_server=False,
+            enable_vf=True,
+            async_server=async_server,
+        )
+        mc.start_control_thread()
+        time.sleep(0.5)
+
+        # clients: text vision service, binary serial and classification service
+        client_dict = {}
+        for name, binary_version in [
+            ("VisionService", None),
+            ("SerialService", crc.binary_version),
+            ("ClassificationService", crc.binary_version),
+        ]:
+            client_dict[name] = MessageListTcpClient(
+                "127.0.0.1",
+                5005,
+                name=name,
+                type=name,
+                retry_connection=False,
+                auto_reconnect=False,
+                binary_version=binary_version,
+            )
+            client_dict[name].start()
+        time.sleep(0.5)
+
+        class_list = ["brick_2x4", "plate_1x1"]
+        m = crc.ClassificationResultMessage(
+            object_id=7,
+            predicted_class="plate_1x1",
+            probability=0.75,
+            uniqueness=10.0,
+            average_process_time_sec=0.5,
+            low_list=[{"class": "plate_1x1", "probability": 0.75}],
+            high_list=[{"class": "brick_2x4", "probability": 0.25}],
+            class_list=class_list,
+        )
+        sender_codec = crc.ClassificationResultCodec(crc.binary_version)
+        for i in range(2):
+            for msg in sender_codec.encode(m):
+                client_dict["ClassificationService"].send_msg(msg)
+        time.sleep(0.5)
+
+        # text: same results, w/o class list
+        vision_list = client_dict["VisionService"].message_list
+        self.assertEqual([b"CLR", b"CLR"], [msg[:3] for msg in vision_list])
+        m_text = crc.decode_text(vision_list[0])
+        m_text.class_list = class_list
+        self.assertEqual(m, m_text)
+
+        # binary: class list once
+        serial_list = client_dict["SerialService"].message_list
+        self.assertEqual([b"CLL", b"CLB", b"CLB"], [msg[:3] for msg in serial_list])
+        receiver_codec = crc.ClassificationResultCodec(crc.binary_version)
+        self.assertEqual(
+            [None, m, m], [receiver_codec.decode(msg) for msg in serial_list]
+        )
+
+        # stop network
+        for client in client_dict.values():
+            client.stop()
+        mc.stop_control_thread()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_statistics_request(self):
+        """
+        STA, statistics of the classification service queried via the server
+        """
+        self.setup_logging()
+
+        # server
+        mc = sorter.controller.machine_controller.MachineController(
+            enable_device=False, enable_belt=False, disable_server=False, enable_vf=True
+        )
+        mc.start_control_thread()
+        time.sleep(0.5)
+
+        # clients
+        cs = sorter.classification_service.classification_service.ClassificationService(
+            host="127.0.0.1", enable_cnn=False, model_fp=None
+        )
+        stats_client = sorter.network.stats_client.StatsClient("127.0.0.1")
+        stats_client.start()
+        time.sleep(1)
+
+        statistics_list = stats_client.query("ClassificationService")
+        self.assertEqual(1, len(statistics_list))
+        self.assertEqual("ClassificationService", statistics_list[0]["name"])
+        self.assertEqual("ready", statistics_list[0]["state"])
+        self.assertEqual(
+            sorter.classification_service.classification_service.stage_name_list,
+            list(statistics_list[0]["stage"]),
+        )
+
+        # one message per call, a length prefixed payload may contain newlines
+        stats_client.event_msg_received(b'STR StatsClient {\n"name": "Multi-line"\n}')
+        self.assertEqual("Multi-line", stats_client.statistics_list[-1]["name"])
+
+        # stop network
+        stats_client.stop()
+        cs.stop()
+        mc.stop_control_thread()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_subscription(self):
+        """
+        CLR, CSS and NTF fanned out to the clients subscribed in their HLO, the
+        defaults of their name otherwise
+        """
+        self.setup_logging()
+
+        # server
+        mc = sorter.controller.machine_controller.MachineController(
+            enable_device=False, enable_belt=False, disable_server=False, enable_vf=True
+        )
+        mc.start_control_thread()
+        time.sleep(0.5)
+
+        # clients: vision w/ defaults of its name, logger and slide subscribing
+        client_dict = {}
+        for name, subscription_list in [
+            ("VisionService", None),
+            ("ClassificationService", None),
+            ("Logger", ["CLR", "NTF"]),
+            ("Slide", ["CLR"]),
+        ]:
+            client_dict[name] = MessageListTcpClient(
+                "127.0.0.1",
+                5005,
+                name=name,
+                type=name,
+                retry_connection=False,
+                auto_reconnect=False,
+                subscription_list=subscription_list,
+            )
+            client_dict[name].start()
+        time.sleep(0.5)
+
+        client_dict["ClassificationService"].send_msg(b"CSS loading")
+        client_dict["ClassificationService"].send_msg(
+            b"CLR 3 skip 0.0 0.0 0.0 W10= W10="
+        )
+        client_dict["VisionService"].send_msg(b"NTF object_detected message")
+        time.sleep(0.5)
+
+        self.assertEqual(
+            [b"CSS", b"CLR"],
+            [m[:3] for m in client_dict["VisionService"].message_list],
+        )
+        self.assertEqual(
+            {b"CLR", b"NTF"}, {m[:3] for m in client_dict["Logger"].message_list}
+        )
+        self.assertEqual([b"CLR"], [m[:3] for m in client_dict["Slide"].message_list])
+        self.assertEqual([], client_dict["ClassificationService"].message_list)
+
+        # disconnected subscriber no longer receives
+        client_dict["Slide"].stop()
+        time.sleep(0.5)
+        statistics = mc.tcp_server.subscription_table.get_statistics()
+        self.assertEqual(
+            ["Logger", "VisionService"], sorted(statistics["subscribers"]["CLR"])
+        )
+
+        # stop network
+        for name, client in client_dict.items():
+            if name != "Slide":
+                client.stop()
+        mc.stop_control_thread()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
     def test_notification_request(self):
         """
         CLF, forward classification request to classification service
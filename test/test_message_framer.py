@@ -0,0 +1,176 @@
+import logging
+import random
+import socket
+import threading
+import time
+import unittest
+
+import test_helpers
+
+import sorter.network.message_framer
+import sorter.network.tcp_client
+import sorter.network.tcp_server
+
+mf = sorter.network.message_framer
+
+
+class CountingCommandHandler(sorter.network.tcp_server.RequestHandler):
+    def __init__(self, request, client_address, server) -> None:
+        self.message_list = []
+        super().__init__(request, client_address, server)
+
+    def process_custom_command(self, message):
+        self.message_list.append(message)
+
+
+class CountingTcpClient(sorter.network.tcp_client.TcpClient):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.message_list = []
+
+    def event_msg_received(self, msg):
+        self.message_list.append(msg)
+
+
+def message(i):
+    """
+    Messages of varying length, some longer than a single 1024 byte receive
+    """
+    return b"MSG %d " % i + b"x" * (i % 3000)
+
+
+class MessageFramerTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_split_and_merged(self):
+        """
+        Stream cut at random positions, messages come out whole
+        """
+        self.setup_logging()
+
+        for framing in [mf.Framing.LINE, mf.Framing.LENGTH_PREFIXED]:
+            msg_list = [message(i) for i in range(200)]
+            stream = b"".join(mf.frame_message(msg, framing) for msg in msg_list)
+
+            framer = mf.MessageFramer(framing, initial_size=64)
+            received_list = []
+            rng = random.Random(0)
+            position = 0
+            while position < len(stream):
+                chunk_size = rng.randint(1, 5000)
+                framer.feed(stream[position : position + chunk_size])
+                position += chunk_size
+                received_list.extend(framer.messages())
+
+            self.assertEqual(msg_list, received_list)
+            self.assertEqual(0, framer.get_statistics()["buffered"])
+
+    def test_binary_length_prefixed(self):
+        """
+        Length prefixed messages may contain newlines
+        """
+        self.setup_logging()
+
+        msg_list = [b"", b"\n\n", bytes(range(256))]
+        a, b = socket.socketpair()
+        for msg in msg_list:
+            a.sendall(mf.frame_message(msg, mf.Framing.LENGTH_PREFIXED))
+        a.close()
+
+        framer = mf.MessageFramer(mf.Framing.LENGTH_PREFIXED, initial_size=16)
+        received_list = []
+        while framer.recv_from(b) > 0:
+            received_list.extend(framer.messages())
+        b.close()
+        self.assertEqual(msg_list, received_list)
+
+    def test_message_too_large(self):
+        self.setup_logging()
+
+        framer = mf.MessageFramer(initial_size=16, max_message_size=100)
+        framer.feed(b"x" * 50)
+        self.assertEqual([], list(framer.messages()))
+        with self.assertRaises(Exception):
+            framer.feed(b"x" * 100)
+            list(framer.messages())
+
+        framer = mf.MessageFramer(mf.Framing.LENGTH_PREFIXED, max_message_size=100)
+        framer.feed(mf.frame_message(b"x" * 101, mf.Framing.LENGTH_PREFIXED))
+        with self.assertRaises(Exception):
+            list(framer.messages())
+
+    def test_stress(self):
+        """
+        Thousands of messages per second in both directions through server and
+        client, none lost, merged or split
+        """
+        self.setup_logging()
+
+        s = sorter.network.tcp_server.TcpServer("0.0.0.0", 5005, CountingCommandHandler)
+        s.start()
+        time.sleep(0.5)
+
+        c = CountingTcpClient(
+            "127.0.0.1",
+            5005,
+            name="StressClient",
+            type="StressClient",
+            retry_connection=False,
+            auto_reconnect=False,
+        )
+        c.set_log_received_messages(False)
+        c.start()
+        time.sleep(0.5)
+        handler = s.get_handler_list()[0]
+
+        # client -> server, from two threads
+        message_count = 5000
+        msg_list = [message(i) for i in range(message_count)]
+        dt_start = time.perf_counter()
+        thread_list = [
+            threading.Thread(
+                target=lambda part: [c.send_msg(m) for m in part],
+                args=(msg_list[i::2],),
+            )
+            for i in range(2)
+        ]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        dt_end = time.monotonic() + 10
+        while len(handler.message_list) < message_count and time.monotonic() < dt_end:
+            time.sleep(0.01)
+        duration_sec = time.perf_counter() - dt_start
+        logging.info(f"Client -> server: {message_count / duration_sec:.0f} messages/s")
+        self.assertEqual(sorted(msg_list), sorted(handler.message_list))
+        # order kept per sending thread
+        for i in range(2):
+            thread_msg_set = set(msg_list[i::2])
+            self.assertEqual(
+                msg_list[i::2],
+                [m for m in handler.message_list if m in thread_msg_set],
+            )
+        self.assertGreater(message_count / duration_sec, 1000)
+
+        # server -> client
+        logging.getLogger().disabled = True
+        dt_start = time.perf_counter()
+        for msg in msg_list:
+            handler.sendall(msg)
+        dt_end = time.monotonic() + 10
+        while len(c.message_list) < message_count and time.monotonic() < dt_end:
+            time.sleep(0.01)
+        duration_sec = time.perf_counter() - dt_start
+        logging.getLogger().disabled = False
+        logging.info(f"Server -> client: {message_count / duration_sec:.0f} messages/s")
+        self.assertEqual(msg_list, c.message_list)
+        self.assertGreater(message_count / duration_sec, 1000)
+
+        c.stop()
+        s.stop()
+        time.sleep(0.5)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+
+if __name__ == "__main__":
+    unittest.main()
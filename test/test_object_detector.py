@@ -1,5 +1,6 @@
-# All ObjectDetector Tests are currently deactivated since there is no
-# public version of the test data available yet.
+# Recording based ObjectDetector Tests are currently deactivated since there is no
+# public version of the test data available yet. Tests at the end of the file use a
+# generated belt sequence instead.
 
 # import logging
 # import os
@@ -278,3 +279,135 @@
 #         self.assertIsNotNone(trigger_frame_index)
 
 #         test_helpers.BaseTest.assert_threads_stopped(self)
+
+
+import unittest
+
+import synthetic_belt
+import test_helpers
+
+import sorter.vision_service.object_detector
+
+
+class ObjectDetectorSyntheticTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_steady_state_allocation(self):
+        """
+        Preallocated workspace, frames w/o change in component count allocate nothing
+        """
+        self.setup_logging()
+
+        od = sorter.vision_service.object_detector.ObjectDetector(
+            notification_client=None
+        )
+
+        allocation_count_list = []
+        for frame_index in range(120):
+            frame = synthetic_belt.synthetic_belt_frame(frame_index, [60])
+            od.process_frame(frame_index, frame, enable_visualization=True)
+            allocation_count_list.append(
+                od.get_statistics()["frame_allocation_count"]
+            )
+
+        # first frame allocates stats/centroids and visualization buffers
+        self.assertGreater(allocation_count_list[0], 0)
+
+        # empty belt and single part on belt
+        self.assertEqual(0, sum(allocation_count_list[10:55]))
+        self.assertEqual(0, sum(allocation_count_list[65:120]))
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_viz_buffer_release(self):
+        """
+        Visualization buffers are only reused after being released
+        """
+        self.setup_logging()
+
+        od = sorter.vision_service.object_detector.ObjectDetector(
+            notification_client=None, auto_release_viz_buffer=False
+        )
+        frame = synthetic_belt.synthetic_belt_frame(0, [])
+        _, frame_viz_0, _, _ = od.process_frame(0, frame, enable_visualization=True)
+        _, frame_viz_1, _, _ = od.process_frame(1, frame, enable_visualization=True)
+        self.assertFalse(
+            sorter.vision_service.object_detector.same_buffer(frame_viz_0, frame_viz_1)
+        )
+
+        od.release_viz_buffer(frame_viz_0)
+        _, frame_viz_2, _, _ = od.process_frame(2, frame, enable_visualization=True)
+        self.assertTrue(
+            sorter.vision_service.object_detector.same_buffer(frame_viz_0, frame_viz_2)
+        )
+        self.assertEqual(0, od.get_statistics()["frame_allocation_count"])
+
+    def replay(self, bg_downscale_factor):
+        od = sorter.vision_service.object_detector.ObjectDetector(
+            notification_client=None, bg_downscale_factor=bg_downscale_factor
+        )
+        trigger_list = []
+        busy_change_list = []
+        last_frame_belt_busy = False
+        for frame_index in range(260):
+            frame = synthetic_belt.synthetic_belt_frame(frame_index, [60, 140])
+            trigger, _, component_list, belt_busy = od.process_frame(
+                frame_index, frame, enable_visualization=frame_index % 2 == 0
+            )
+            if trigger:
+                trigger_list.append((frame_index, component_list))
+            if belt_busy != last_frame_belt_busy:
+                busy_change_list.append(frame_index)
+            last_frame_belt_busy = belt_busy
+        return trigger_list, busy_change_list
+
+    def test_reduced_resolution_same_as_full(self):
+        """
+        Downscaled bg subtraction, same triggers/busy and stats in full resolution
+        """
+        self.setup_logging()
+
+        full_trigger_list, full_busy_change_list = self.replay(1)
+        self.assertEqual(2, len(full_trigger_list))
+
+        for bg_downscale_factor in [2, 4]:
+            trigger_list, busy_change_list = self.replay(bg_downscale_factor)
+            self.assertEqual(full_busy_change_list, busy_change_list)
+            self.assertEqual(
+                [t[0] for t in full_trigger_list], [t[0] for t in trigger_list]
+            )
+            for (_, full_component_list), (_, component_list) in zip(
+                full_trigger_list, trigger_list
+            ):
+                self.assertEqual(len(full_component_list), len(component_list))
+                for full_comp, comp in zip(full_component_list, component_list):
+                    for key in ["x", "y", "w", "h", "area", "cx", "cy"]:
+                        self.assertAlmostEqual(
+                            full_comp[key], comp[key], delta=0.05 * full_comp[key]
+                        )
+
+    def test_set_busy_area(self):
+        """
+        Roi changed while running, parts are detected in the new roi
+        """
+        self.setup_logging()
+
+        od = sorter.vision_service.object_detector.ObjectDetector(
+            notification_client=None
+        )
+        trigger_list = []
+        for frame_index in range(260):
+            if frame_index == 30:
+                od.set_busy_area(
+                    150,
+                    1100,
+                    420,
+                    680,
+                    exclusion_polygons=[[(900, 0), (950, 0), (950, 40), (900, 40)]],
+                )
+            frame = synthetic_belt.synthetic_belt_frame(frame_index, [60, 140])
+            trigger, _, _, _ = od.process_frame(frame_index, frame)
+            if trigger:
+                trigger_list.append(frame_index)
+
+        self.assertEqual((260, 950), od.overall_mask.shape)
+        self.assertEqual(0, od.overall_mask[20, 920])
+        self.assertEqual([123, 203], trigger_list)
@@ -0,0 +1,104 @@
+import pathlib
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import test_helpers
+
+import sorter.classification_service.prediction_cache
+
+
+class PredictionCacheTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_get_put(self):
+        self.setup_logging()
+
+        with tempfile.TemporaryDirectory() as folder:
+            db_fp = pathlib.Path(folder) / "prediction_cache.sqlite"
+            cache = sorter.classification_service.prediction_cache.PredictionCache(
+                db_fp
+            )
+            self.assertIsNone(cache.get("image_a", "model_1"))
+            cache.put("image_a", "model_1", [0.75, 0.25])
+            self.assertEqual([0.75, 0.25], cache.get("image_a", "model_1"))
+
+            # other model, no result
+            self.assertIsNone(cache.get("image_a", "model_2"))
+            self.assertEqual(
+                {"count_hit": 1, "count_miss": 2, "entry_count": 1},
+                cache.get_statistics(),
+            )
+            cache.close()
+
+            # persisted
+            cache = sorter.classification_service.prediction_cache.PredictionCache(
+                db_fp
+            )
+            self.assertEqual([0.75, 0.25], cache.get("image_a", "model_1"))
+            cache.close()
+
+    def test_lru_eviction(self):
+        self.setup_logging()
+
+        with tempfile.TemporaryDirectory() as folder:
+            cache = sorter.classification_service.prediction_cache.PredictionCache(
+                pathlib.Path(folder) / "prediction_cache.sqlite", max_entry_count=2
+            )
+            cache.put("image_a", "model_1", [1.0])
+            time.sleep(0.01)
+            cache.put("image_b", "model_1", [2.0])
+            time.sleep(0.01)
+
+            # a used recently, b is least recently used
+            cache.get("image_a", "model_1")
+            time.sleep(0.01)
+            cache.put("image_c", "model_1", [3.0])
+
+            self.assertEqual(2, len(cache))
+            self.assertIsNone(cache.get("image_b", "model_1"))
+            self.assertEqual([1.0], cache.get("image_a", "model_1"))
+            self.assertEqual([3.0], cache.get("image_c", "model_1"))
+            cache.close()
+
+    def test_access_time_batched(self):
+        """
+        Hits don't write, access times written every flush_hit_count hits and on
+        close
+        """
+        self.setup_logging()
+
+        with tempfile.TemporaryDirectory() as folder:
+            db_fp = pathlib.Path(folder) / "prediction_cache.sqlite"
+            cache = sorter.classification_service.prediction_cache.PredictionCache(
+                db_fp, flush_hit_count=3
+            )
+            for image_hash in ["image_a", "image_b", "image_c"]:
+                cache.put(image_hash, "model_1", [1.0])
+            reader = sqlite3.connect(str(db_fp))
+
+            def last_used(image_hash):
+                return reader.execute(
+                    "SELECT last_used FROM prediction WHERE image_hash = ?",
+                    (image_hash,),
+                ).fetchone()[0]
+
+            last_used_put = last_used("image_a")
+            time.sleep(0.01)
+            cache.get("image_a", "model_1")
+            cache.get("image_b", "model_1")
+            self.assertEqual(last_used_put, last_used("image_a"))
+
+            # 3rd hit flushes
+            cache.get("image_c", "model_1")
+            self.assertGreater(last_used("image_a"), last_used_put)
+
+            last_used_flushed = last_used("image_a")
+            time.sleep(0.01)
+            cache.get("image_a", "model_1")
+            cache.close()
+            self.assertGreater(last_used("image_a"), last_used_flushed)
+            reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import time
+import unittest
+from dataclasses import dataclass
+
+import test_helpers
+
+import sorter.classification_service.request_scheduler as rs
+
+
+@dataclass
+class Request:
+    object_id: int = None
+    dt_enqueued: float = None
+    dt_deadline: float = None
+
+
+class RequestSchedulerTest(unittest.TestCase, test_helpers.BaseTest):
+    def take_all(self, scheduler, max_count=100):
+        item_list, expired_list = scheduler.take(max_count)
+        return [r.object_id for r in item_list], [r.object_id for r in expired_list]
+
+    def test_order(self):
+        """
+        FIFO oldest first, LIFO newest first, EDF by per request budget
+        """
+        for policy, expected in [
+            (rs.SchedulingPolicy.FIFO, [0, 1, 2]),
+            (rs.SchedulingPolicy.LIFO, [2, 1, 0]),
+            (rs.SchedulingPolicy.EDF, [1, 2, 0]),
+        ]:
+            scheduler = rs.RequestScheduler(policy, deadline_sec=10)
+            scheduler.add(Request(object_id=0))
+            scheduler.add(Request(object_id=1), budget_sec=1)
+            scheduler.add(Request(object_id=2), budget_sec=5)
+            self.assertEqual((expected, []), self.take_all(scheduler), policy)
+
+    def test_missed_deadline(self):
+        """
+        Requests past their deadline are handed back separately and counted
+        """
+        scheduler = rs.RequestScheduler(rs.SchedulingPolicy.FIFO, deadline_sec=0.05)
+        scheduler.add(Request(object_id=0))
+        scheduler.add(Request(object_id=1), budget_sec=10)
+        time.sleep(0.1)
+        scheduler.add(Request(object_id=2))
+
+        # max_count limits served requests only
+        self.assertEqual(([1], [0]), self.take_all(scheduler, max_count=1))
+        self.assertEqual(([2], []), self.take_all(scheduler))
+
+        statistics = scheduler.get_statistics()
+        self.assertEqual(1, statistics["count_missed_deadline"])
+        self.assertEqual(0, statistics["queue_depth"])
+        self.assertEqual(3, statistics["queue_max_depth"])
+        self.assertGreater(statistics["max_wait_ms"], 50)
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import test_helpers
+
+import sorter.vision_service.roi_mask
+
+
+def create_mask_per_pixel(shape, A, B):
+    """
+    Reference, former per-pixel implementation
+    """
+    mask = np.ones(shape, dtype=np.uint8)
+    for y in range(shape[0]):
+        for x in range(shape[1]):
+            result = (B[1] - A[1]) * x - (B[0] - A[0]) * y + B[0] * A[1] - A[0] * B[1]
+            if result > 0:
+                mask[y, x] = 0
+    return mask
+
+
+class RoiMaskTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_half_plane_same_as_per_pixel(self):
+        """
+        Vectorized half-plane mask identical to per-pixel evaluation
+        """
+        shape = (60, 210)
+        for A, B in [
+            ((160, 0), (210, 50)),
+            ((210, 20), (110, 60)),
+            ((0, 30), (50, 0)),
+            ((20, 0), (20, 60)),
+        ]:
+            np.testing.assert_array_equal(
+                create_mask_per_pixel(shape, A, B),
+                sorter.vision_service.roi_mask.half_plane_mask(shape, A, B),
+            )
+
+    def test_polygon_exclusion(self):
+        """
+        Polygon excludes its inside, combined with lines
+        """
+        shape = (50, 100)
+        mask = sorter.vision_service.roi_mask.exclusion_mask(
+            shape,
+            line_list=[((90, 0), (100, 10))],
+            polygon_list=[[(10, 10), (30, 10), (30, 20), (10, 20)]],
+        )
+        self.assertEqual(0, mask[15, 20])
+        self.assertEqual(0, mask[0, 99])
+        self.assertEqual(1, mask[40, 50])
+        self.assertEqual(1, mask[15, 40])
+
+    def test_disk_cache(self):
+        """
+        Mask is written once and loaded from disk by a new cache instance
+        """
+        lines = [((160, 0), (210, 50))]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = sorter.vision_service.roi_mask.RoiMaskCache(cache_dir)
+            mask = cache.get((60, 210), lines)
+            self.assertIs(mask, cache.get((60, 210), lines))
+            self.assertEqual(1, len(os.listdir(cache_dir)))
+
+            cache = sorter.vision_service.roi_mask.RoiMaskCache(cache_dir)
+            np.testing.assert_array_equal(mask, cache.get((60, 210), lines))
+
+            # other geometry, other file
+            cache.get((60, 200), lines)
+            self.assertEqual(2, len(os.listdir(cache_dir)))
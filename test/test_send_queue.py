@@ -0,0 +1,154 @@
+import socket
+import time
+import unittest
+
+import test_helpers
+import test_tcp_server
+
+import sorter.network.async_tcp_server
+import sorter.network.send_queue
+import sorter.network.tcp_server
+
+sq = sorter.network.send_queue
+
+
+class SendQueueTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_overflow_policy(self):
+        self.setup_logging()
+
+        # drop oldest: newest messages kept
+        q = sq.SendQueue(max_count=3, overflow_policy=sq.SendOverflowPolicy.DROP_OLDEST)
+        for i in range(5):
+            self.assertTrue(q.put(b"%d" % i))
+        self.assertEqual([b"2", b"3", b"4"], q.get_all(block=False))
+
+        # drop newest: oldest messages kept
+        q = sq.SendQueue(max_count=3, overflow_policy=sq.SendOverflowPolicy.DROP_NEWEST)
+        self.assertEqual(
+            [True, True, True, False, False], [q.put(b"%d" % i) for i in range(5)]
+        )
+        self.assertEqual([b"0", b"1", b"2"], q.get_all(block=False))
+        statistics = q.get_statistics()
+        self.assertEqual(2, statistics["count_dropped"])
+        self.assertEqual(3, statistics["count_sent"])
+
+        # disconnect: queue closed, overflow claimed once
+        q = sq.SendQueue(max_count=3, overflow_policy=sq.SendOverflowPolicy.DISCONNECT)
+        self.assertFalse(q.claim_overflow())
+        self.assertEqual(
+            [True, True, True, False, False], [q.put(b"%d" % i) for i in range(5)]
+        )
+        self.assertTrue(q.claim_overflow())
+        self.assertFalse(q.claim_overflow())
+        self.assertEqual([], q.get_all())
+        self.assertEqual(4, q.get_statistics()["count_dropped"])
+
+    def test_bytes(self):
+        self.setup_logging()
+
+        q = sq.SendQueue(max_bytes=10)
+        q.put(b"x" * 4)
+        q.put(b"y" * 4)
+        self.assertEqual(8, q.get_statistics()["queued_bytes"])
+        q.put(b"z" * 4)  # drops the x
+        self.assertFalse(q.put(b"w" * 11))  # never fits
+        statistics = q.get_statistics()
+        self.assertEqual(8, statistics["queued_bytes"])
+        self.assertEqual(8, statistics["max_queued_bytes"])
+        self.assertEqual(2, statistics["count_dropped"])
+        self.assertEqual(15, statistics["bytes_dropped"])
+        self.assertEqual([b"y" * 4, b"z" * 4], q.get_all())
+        self.assertEqual(0, q.get_statistics()["queued_bytes"])
+
+    def test_not_droppable(self):
+        self.setup_logging()
+
+        # class list and results stay queued, other messages make room for them
+        for policy in [
+            sq.SendOverflowPolicy.DROP_OLDEST,
+            sq.SendOverflowPolicy.DROP_NEWEST,
+        ]:
+            q = sq.SendQueue(max_count=3, overflow_policy=policy)
+            self.assertTrue(q.put(b"CLL", droppable=False))
+            self.assertTrue(q.put(b"a"))
+            self.assertTrue(q.put(b"CLB 1", droppable=False))
+            self.assertTrue(q.put(b"CLB 2", droppable=False))
+            self.assertFalse(q.claim_overflow())
+            self.assertEqual([b"CLL", b"CLB 1", b"CLB 2"], q.get_all(block=False))
+
+        # oldest droppable messages dropped, not droppable ones keep their order
+        q = sq.SendQueue(max_count=4)
+        q.put(b"CLL", droppable=False)
+        for i in range(5):
+            q.put(b"%d" % i)
+        self.assertEqual([b"CLL", b"2", b"3", b"4"], q.get_all(block=False))
+
+        # no room left: client to be disconnected (reconnecting resends class list)
+        q = sq.SendQueue(max_count=2)
+        q.put(b"CLL", droppable=False)
+        q.put(b"CLB 1", droppable=False)
+        self.assertFalse(q.put(b"CLB 2", droppable=False))
+        self.assertTrue(q.claim_overflow())
+        self.assertEqual([], q.get_all())
+
+    def test_stuck_client(self):
+        """
+        Client not reading: sending never blocks, messages are dropped or the client
+        is disconnected
+        """
+        self.setup_logging()
+
+        for server_class in [
+            sorter.network.tcp_server.TcpServer,
+            sorter.network.async_tcp_server.AsyncTcpServer,
+        ]:
+            for policy in [
+                sq.SendOverflowPolicy.DROP_OLDEST,
+                sq.SendOverflowPolicy.DISCONNECT,
+            ]:
+                with self.subTest(server_class=server_class.__name__, policy=policy):
+                    self.run_stuck_client(server_class, policy)
+
+    def run_stuck_client(self, server_class, policy):
+        s = server_class(
+            "0.0.0.0",
+            5005,
+            test_tcp_server.ExampleCommandHandler,
+            send_queue_max_count=100,
+            send_overflow_policy=policy,
+        )
+        s.start()
+        time.sleep(0.5)
+
+        # client sending HLO, never reading
+        sock = socket.create_connection(("127.0.0.1", 5005))
+        sock.sendall(b"HLO name=stuck type=stuck\n")
+        time.sleep(0.5)
+        handler = s.get_handler_by_name("stuck")
+
+        dt_start = time.perf_counter()
+        for i in range(2000):
+            handler.sendall(b"x" * 10000)
+        send_sec = time.perf_counter() - dt_start
+        self.assertLess(send_sec, 2.0)
+        time.sleep(0.5)
+
+        statistics = handler.send_queue.get_statistics()
+        self.assertGreater(statistics["count_dropped"], 0)
+        self.assertLessEqual(statistics["depth"], 100)
+        if policy == sq.SendOverflowPolicy.DISCONNECT:
+            self.assertIsNone(s.get_handler_by_name("stuck"))
+            self.assertTrue(statistics["overflowed"])
+        else:
+            self.assertEqual(["stuck"], s.get_handler_name_list())
+            self.assertIn("stuck", s.get_statistics()["send_queue"])
+
+        sock.close()
+        s.stop()
+        time.sleep(1.5)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import pathlib
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+import test_helpers
+
+import sorter.util.shared_frame_ring
+
+reader_code = """
+import sys
+import sorter.util.shared_frame_ring
+ring = sorter.util.shared_frame_ring.SharedFrameRing(sys.argv[1])
+item = ring.get(int(sys.argv[2]), int(sys.argv[3]))
+print(-1 if item is None else int(item.astype(int).sum()))
+ring.close()
+"""
+
+
+class SharedFrameRingTest(unittest.TestCase, test_helpers.BaseTest):
+    def read_in_other_process(self, name, slot, stamp):
+        result = subprocess.run(
+            [sys.executable, "-c", reader_code, name, str(slot), str(stamp)],
+            capture_output=True,
+            text=True,
+            cwd=pathlib.Path(__file__).parents[1],
+        )
+        self.assertEqual("", result.stderr)
+        return int(result.stdout)
+
+    def test_put_get_other_process(self):
+        """
+        Item written by owner is read by another process, overwritten slot detected
+        """
+        self.setup_logging()
+
+        ring = sorter.util.shared_frame_ring.SharedFrameRing(
+            "bsm_test_ring", slot_count=4, item_shape=(2, 8, 8, 3)
+        )
+        part_list = [np.full((8, 8, 3), 3, np.uint8), np.full((8, 8, 3), 5, np.uint8)]
+        slot = ring.put(6, part_list)
+        self.assertEqual(2, slot)
+
+        self.assertEqual(
+            8 * 8 * 3 * 8, self.read_in_other_process("bsm_test_ring", 2, 6)
+        )
+        np.testing.assert_array_equal(part_list[1], ring.get(2, 6)[1])
+
+        # stamp 10 overwrites slot of 6
+        ring.put(10, part_list)
+        self.assertEqual(-1, self.read_in_other_process("bsm_test_ring", 2, 6))
+        self.assertIsNone(ring.get(2, 6))
+
+        ring.close()
@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+import test_helpers
+
+import sorter.util.stage_overlap
+
+
+class StageOverlapTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_sequential(self):
+        self.setup_logging()
+
+        overlap = sorter.util.stage_overlap.StageOverlap(["preprocess", "inference"])
+        for stage in ["preprocess", "inference"]:
+            overlap.begin(stage)
+            time.sleep(0.1)
+            overlap.end(stage)
+
+        statistics = overlap.get_statistics()
+        self.assertGreaterEqual(statistics["preprocess_busy_sec"], 0.1)
+        self.assertGreaterEqual(statistics["inference_busy_sec"], 0.1)
+        self.assertEqual(0.0, statistics["overlap_sec"])
+        self.assertEqual(0.0, statistics["overlap_ratio"])
+
+    def test_overlapped(self):
+        """
+        Preprocessing in another thread while inference runs
+        """
+        self.setup_logging()
+
+        overlap = sorter.util.stage_overlap.StageOverlap(["preprocess", "inference"])
+
+        def preprocess():
+            overlap.begin("preprocess")
+            time.sleep(0.2)
+            overlap.end("preprocess")
+
+        overlap.begin("inference")
+        thread = threading.Thread(target=preprocess)
+        thread.start()
+        time.sleep(0.4)
+        overlap.end("inference")
+        thread.join()
+
+        statistics = overlap.get_statistics()
+        self.assertGreaterEqual(statistics["inference_busy_sec"], 0.4)
+        self.assertGreaterEqual(statistics["overlap_sec"], 0.2)
+
+        # preprocessing entirely hidden behind inference
+        self.assertAlmostEqual(1.0, statistics["overlap_ratio"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import test_helpers
+
+import sorter.network.subscription_table
+
+
+class RecordingHandler:
+    def __init__(self, name) -> None:
+        self.name = name
+        self.message_list = []
+
+    def get_name(self):
+        return self.name
+
+    def sendall(self, msg):
+        self.message_list.append(msg)
+
+
+class SubscriptionTableTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_publish(self):
+        self.setup_logging()
+
+        table = sorter.network.subscription_table.SubscriptionTable()
+        vision = RecordingHandler("VisionService")
+        logger = RecordingHandler("Logger")
+        table.subscribe(vision, [b"CLR", b"HMV"])
+        table.subscribe(logger, [b"CLR", b"NTF"])
+        table.subscribe(logger, [b"CLR"])
+
+        self.assertEqual(2, table.publish(b"CLR", b"CLR 1 skip"))
+        self.assertEqual(1, table.publish(b"HMV", b"HMV 1.0"))
+        self.assertEqual(0, table.publish(b"CSS", b"CSS loading"))
+        self.assertEqual([b"CLR 1 skip", b"HMV 1.0"], vision.message_list)
+        self.assertEqual([b"CLR 1 skip"], logger.message_list)
+
+        # disconnected: removed from all message types
+        table.unsubscribe(vision)
+        self.assertEqual((logger,), table.get_subscriber_list(b"CLR"))
+        self.assertEqual((), table.get_subscriber_list(b"HMV"))
+
+        statistics = table.get_statistics()
+        self.assertEqual(
+            {"CLR": ["Logger"], "NTF": ["Logger"]}, statistics["subscribers"]
+        )
+        self.assertEqual({"CLR": 1, "HMV": 1, "CSS": 1}, statistics["count_published"])
+
+    def test_parse(self):
+        parse = sorter.network.subscription_table.parse_message_type_list
+        self.assertEqual([b"CLR", b"CSS"], parse("CLR,CSS"))
+        self.assertEqual([], parse(""))
+
+
+if __name__ == "__main__":
+    unittest.main()
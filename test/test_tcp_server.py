@@ -4,6 +4,7 @@ import unittest
 
 import test_helpers
 
+import sorter.network.async_tcp_server
 import sorter.network.tcp_client
 import sorter.network.tcp_server
 
@@ -28,6 +29,15 @@ class ExampleCommandHandler(sorter.network.tcp_server.RequestHandler):
         self.request.sendall(b"DRV\n")
 
 
+class RecordingTcpClient(sorter.network.tcp_client.TcpClient):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.message_list = []
+
+    def event_msg_received(self, msg):
+        self.message_list.append(msg)
+
+
 class TestTcpServer(unittest.TestCase, test_helpers.BaseTest):
     def test_minimal(self):
         self.setup_logging()
@@ -252,3 +262,57 @@ class TestTcpServer(unittest.TestCase, test_helpers.BaseTest):
         s.stop()
 
         test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_worker_reconnecting_same_name(self):
+        """
+        Only worker of its pool reconnects under the same name (old connection
+        half-open), its requests in flight are sent again on the new connection
+        """
+        self.setup_logging()
+
+        for server_class in [
+            sorter.network.tcp_server.TcpServer,
+            sorter.network.async_tcp_server.AsyncTcpServer,
+        ]:
+            with self.subTest(server_class=server_class.__name__):
+                s = server_class("0.0.0.0", 5005, ExampleCommandHandler)
+                s.start()
+                time.sleep(0.5)
+
+                client_list = []
+                for _ in range(2):
+                    c = RecordingTcpClient(
+                        "localhost",
+                        5005,
+                        name="worker1",
+                        type="none",
+                        retry_connection=False,
+                        auto_reconnect=False,
+                    )
+                    c.start()
+                    time.sleep(0.5)
+                    client_list.append(c)
+
+                    # requests for the 1st connection, not completed
+                    if len(client_list) == 1:
+                        pool = s.get_worker_pool("worker1")
+                        for i in range(3):
+                            self.assertTrue(pool.dispatch(i, b"CLF %d" % i))
+                        pool.complete(1)
+                        time.sleep(0.5)
+                self.assertEqual(
+                    [b"CLF 0", b"CLF 1", b"CLF 2"], client_list[0].message_list
+                )
+
+                self.assertEqual([b"CLF 0", b"CLF 2"], client_list[1].message_list)
+                statistics = s.get_worker_pool("worker1").get_statistics()
+                self.assertEqual(2, statistics["count_redispatched"])
+                self.assertEqual(0, statistics["count_dropped"])
+                self.assertEqual({"worker1": 2}, statistics["in_flight"])
+
+                for c in client_list:
+                    c.stop()
+                time.sleep(0.5)
+                s.stop()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
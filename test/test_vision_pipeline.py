@@ -0,0 +1,171 @@
+import json
+import pathlib
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+import synthetic_belt
+import test_helpers
+
+import sorter.classification_service.config
+import sorter.classification_service.crop_image
+import sorter.util.shared_frame_ring
+import sorter.vision_service.image_writer_pool
+import sorter.vision_service.vision_service
+
+
+class VisionPipelineTest(unittest.TestCase, test_helpers.BaseTest):
+    def run_vision_service(self, enable_pipeline):
+        """
+        Replay a synthetic belt sequence with two parts, return frame indices of
+        the triggered parts
+        """
+        with tempfile.TemporaryDirectory() as recording:
+            vs = sorter.vision_service.vision_service.VisionService(
+                recording=recording,
+                object_class="plate1x",
+                no_write=True,
+                host=None,
+                disable_network=True,
+                enable_visualization_fullscreen=False,
+                enable_pipeline=enable_pipeline,
+            )
+        vs.enable_visualization = False
+        vs.camera_fisheye = synthetic_belt.SyntheticBeltCamera(
+            frame_count=220, part_start_frame_list=[60, 140]
+        )
+
+        trigger_frame_index_list = []
+        persist_step = vs.persist_step
+
+        def recording_persist_step(persist_item):
+            trigger_frame_index_list.append(persist_item.frame_index)
+            persist_step(persist_item)
+
+        vs.persist_step = recording_persist_step
+        vs.collect()
+        vs.stop()
+
+        self.assertEqual(220, vs.collect_loop_frame_index)
+        self.assertIsNotNone(vs.detected_crop_low)
+        return trigger_frame_index_list
+
+    def test_pipeline_same_triggers_as_sequential(self):
+        self.setup_logging()
+
+        sequential_trigger_list = self.run_vision_service(enable_pipeline=False)
+        pipelined_trigger_list = self.run_vision_service(enable_pipeline=True)
+
+        self.assertEqual(2, len(sequential_trigger_list))
+        self.assertEqual(sequential_trigger_list, pipelined_trigger_list)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def run_writing_vision_service(self, folder, **kwargs):
+        """
+        Replay synthetic belt with writing enabled, classification requests recorded
+        instead of sent
+        """
+        vs = sorter.vision_service.vision_service.VisionService(
+            recording=folder,
+            object_class="plate1x",
+            no_write=False,
+            host=None,
+            disable_network=True,
+            enable_visualization_fullscreen=False,
+            **kwargs,
+        )
+        vs.enable_visualization = False
+        vs.soft_estop_enabled = False
+        vs.trash_folder_path = pathlib.Path(folder)
+        vs.camera_fisheye = synthetic_belt.SyntheticBeltCamera(
+            frame_count=220, part_start_frame_list=[60, 140]
+        )
+
+        request_list = []
+
+        def recording_send_classification_request(
+            object_id, filepath, ring_name=None, slot=None, crops_filepath=None
+        ):
+            crops = None
+            if ring_name is not None:
+                ring = sorter.util.shared_frame_ring.SharedFrameRing(ring_name)
+                crops = ring.get(slot, object_id)
+                ring.close()
+            request_list.append((object_id, filepath, crops, crops_filepath))
+
+        vs.send_classification_request = recording_send_classification_request
+        vs.collect()
+        return vs, request_list
+
+    def test_shared_memory_handoff(self):
+        """
+        Crops in shared memory at request time, result before image written pending
+        """
+        self.setup_logging()
+
+        data_dir_path = sorter.classification_service.config.data_dir_path
+        data_dir_path.mkdir(exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=data_dir_path) as folder:
+            vs, request_list = self.run_writing_vision_service(
+                folder, enable_shared_memory=True
+            )
+
+            # crops as cut by the classifier
+            self.assertEqual([0, 1], [r[0] for r in request_list])
+            frame = synthetic_belt.synthetic_belt_frame(203, [60, 140])
+            crop_low = sorter.classification_service.crop_image.crop_image(
+                frame, low=True
+            )
+            np.testing.assert_array_equal(crop_low, request_list[1][2][0])
+            self.assertEqual(".png", request_list[1][1].suffix)
+            self.assertIsNone(request_list[1][3])
+
+            # result arrives while image is still being written
+            vs.image_pending_object_id_set.add(2)
+            pred_list = [{"class": "plate1x", "probability": 1}]
+            vs.receive_classification_result(
+                2, "plate1x", 1.0, 10.0, 1.0, pred_list, pred_list
+            )
+            fp_wo_suffix = pathlib.Path(vs.collect_loop_data_list[0].filepath)
+            vs.image_written(
+                sorter.vision_service.image_writer_pool.ImageWriteJob(
+                    object_id=2, fp_wo_suffix=fp_wo_suffix, image_suffix=".png"
+                )
+            )
+            with open(str(fp_wo_suffix) + ".json") as f:
+                self.assertEqual("plate1x", json.load(f)["predicted_class"])
+            vs.stop()
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
+
+    def test_crops_at_source(self):
+        """
+        Crops image written next to camera image and referenced in the request
+        """
+        self.setup_logging()
+
+        data_dir_path = sorter.classification_service.config.data_dir_path
+        data_dir_path.mkdir(exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=data_dir_path) as folder:
+            vs, request_list = self.run_writing_vision_service(
+                folder, enable_crops_at_source=True
+            )
+            vs.stop()
+
+            self.assertEqual([0, 1], [r[0] for r in request_list])
+            crops_filepath = request_list[1][3]
+            self.assertTrue(crops_filepath.name.endswith("_crops.png"))
+
+            # low | high side by side, as cut by the classifier
+            crops = cv2.imread(str(data_dir_path / crops_filepath))
+            frame = synthetic_belt.synthetic_belt_frame(203, [60, 140])
+            crop_image = sorter.classification_service.crop_image.crop_image
+            np.testing.assert_array_equal(
+                np.hstack([crop_image(frame, low=True), crop_image(frame, low=False)]),
+                crops,
+            )
+            self.assertTrue(vs.collect_loop_data_list[1].crops_written)
+
+        test_helpers.BaseTest.assert_threads_stopped(self)
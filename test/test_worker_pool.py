@@ -0,0 +1,71 @@
+import unittest
+
+import test_helpers
+
+import sorter.network.worker_pool
+
+
+class RecordingHandler:
+    def __init__(self, name) -> None:
+        self.name = name
+        self.message_list = []
+
+    def get_name(self):
+        return self.name
+
+    def sendall(self, msg):
+        self.message_list.append(msg)
+
+
+class WorkerPoolTest(unittest.TestCase, test_helpers.BaseTest):
+    def test_least_outstanding(self):
+        self.setup_logging()
+
+        pool = sorter.network.worker_pool.WorkerPool("ClassificationService")
+        w1 = RecordingHandler("w1")
+        w2 = RecordingHandler("w2")
+        pool.add_worker(w1)
+        pool.add_worker(w2)
+
+        for i in range(4):
+            self.assertTrue(pool.dispatch(i, b"CLF %d" % i))
+        self.assertEqual(2, len(w1.message_list))
+        self.assertEqual(2, len(w2.message_list))
+
+        # w1 done, next two requests go to w1
+        pool.complete(0)
+        pool.complete(2)
+        pool.dispatch(4, b"CLF 4")
+        pool.dispatch(5, b"CLF 5")
+        self.assertEqual([b"CLF 0", b"CLF 2", b"CLF 4", b"CLF 5"], w1.message_list)
+
+        statistics = pool.get_statistics()
+        self.assertEqual(6, statistics["count_dispatched"])
+        self.assertEqual(2, statistics["count_completed"])
+        self.assertEqual({"w1": 2, "w2": 2}, statistics["in_flight"])
+
+    def test_redispatch(self):
+        self.setup_logging()
+
+        pool = sorter.network.worker_pool.WorkerPool("ClassificationService")
+        w1 = RecordingHandler("w1")
+        w2 = RecordingHandler("w2")
+        pool.add_worker(w1)
+        pool.add_worker(w2)
+        for i in range(4):
+            pool.dispatch(i, b"CLF %d" % i)
+        pool.complete(1)
+
+        # w2 disconnects, remaining request 3 goes to w1
+        pool.redispatch(pool.remove_worker(w2))
+        self.assertEqual([b"CLF 0", b"CLF 2", b"CLF 3"], w1.message_list)
+        self.assertEqual(1, pool.get_statistics()["count_redispatched"])
+
+        # no worker left
+        pool.redispatch(pool.remove_worker(w1))
+        self.assertEqual(3, pool.get_statistics()["count_dropped"])
+        self.assertFalse(pool.dispatch(4, b"CLF 4"))
+
+
+if __name__ == "__main__":
+    unittest.main()
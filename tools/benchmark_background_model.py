@@ -0,0 +1,53 @@
+import logging
+import os
+import sys
+
+logging.basicConfig(
+    format="%(levelname)s %(asctime)s %(filename)s:%(lineno)d %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.INFO,
+)
+
+# add robolab folder to python path
+p = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(p)
+
+import sorter.util.argument_parser
+import sorter.vision_service.background_model
+import sorter.vision_service.background_model_benchmark
+import sorter.vision_service.camera_capture
+
+if __name__ == "__main__":
+    # parse command line arguments
+    parser = sorter.util.argument_parser.ArgumentParser(
+        description="Compare background models on a recording: speed vs detection"
+    )
+    parser.add_argument(
+        "--recording", required=True, help="Recording folder, e.g. data/rec_..."
+    )
+    parser.add_argument(
+        "--background_model",
+        nargs="+",
+        default=list(sorter.vision_service.background_model.background_model_class_map),
+        help="Background models to compare (default: all)",
+    )
+    parser.add_argument("--bg_downscale_factor", type=int, default=1)
+    parser.add_argument("--max_frame_count", type=int, default=None)
+    args = parser.parse_args()
+
+    camera = sorter.vision_service.camera_capture.CameraCapture(
+        "fisheye", recording=os.path.abspath(args.recording)
+    )
+    camera.set_pre_recorded_loop_count(0)
+
+    bm = sorter.vision_service.background_model_benchmark
+    result_list = bm.run_benchmark(
+        camera,
+        args.background_model,
+        bg_downscale_factor=args.bg_downscale_factor,
+        max_frame_count=args.max_frame_count,
+    )
+
+    print(" ")
+    for line in bm.format_result_table(result_list):
+        print(line)
@@ -0,0 +1,35 @@
+import logging
+import os
+import sys
+
+logging.basicConfig(
+    format="%(levelname)s %(asctime)s %(filename)s:%(lineno)d %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.INFO,
+)
+
+# add robolab folder to python path
+p = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(p)
+
+import sorter.classification_service.classification_result_codec
+import sorter.util.argument_parser
+
+if __name__ == "__main__":
+    # parse command line arguments
+    parser = sorter.util.argument_parser.ArgumentParser(
+        description="Compare CLR encodings: bytes on the wire and encode/decode time"
+    )
+    parser.add_argument("--message_count", type=int, default=10000)
+    args = parser.parse_args()
+
+    crc = sorter.classification_service.classification_result_codec
+    result_list = crc.benchmark(args.message_count)
+
+    print(" ")
+    print(f"{'format':<8} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    for result in result_list:
+        print(
+            f"{result['format']:<8} {result['bytes']:>6d} "
+            f"{result['encode_us']:>10.1f} {result['decode_us']:>10.1f}"
+        )
@@ -0,0 +1,56 @@
+import logging
+import os
+import pathlib
+import sys
+
+logging.basicConfig(
+    format="%(levelname)s %(asctime)s %(filename)s:%(lineno)d %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.INFO,
+)
+
+# add robolab folder to python path
+p = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(p)
+
+import sorter.classification_service.classifier
+import sorter.classification_service.inference_benchmark
+import sorter.util.argument_parser
+
+if __name__ == "__main__":
+    # parse command line arguments
+    parser = sorter.util.argument_parser.ArgumentParser(
+        description="Compare inference backends on part images: agreement vs latency"
+    )
+    parser.add_argument("--model", required=True, help="Reference model (.keras)")
+    parser.add_argument(
+        "--tflite",
+        nargs="*",
+        default=[],
+        help="Exported models (.tflite) to compare with the reference",
+    )
+    parser.add_argument(
+        "--folder", nargs="+", required=True, help="Folders with part images"
+    )
+    parser.add_argument("--max_image_count", type=int, default=200)
+    parser.add_argument(
+        "--threads", type=int, default=None, help="Intra-op / interpreter threads"
+    )
+    args = parser.parse_args()
+
+    classifier_dict = {}
+    for model_fp in [args.model] + args.tflite:
+        classifier_dict[pathlib.Path(model_fp).name] = (
+            sorter.classification_service.classifier.Classifier(
+                pathlib.Path(model_fp), intra_op_threads=args.threads
+            )
+        )
+
+    ib = sorter.classification_service.inference_benchmark
+    result_list = ib.run_benchmark(
+        classifier_dict, args.folder, max_image_count=args.max_image_count
+    )
+
+    print(" ")
+    for line in ib.format_result_table(result_list):
+        print(line)